@@ -0,0 +1,128 @@
+"""Approximate distinct counts from per-day HyperLogLog sketches.
+
+Closed days get one stored sketch per kind, built once from the daily rollups;
+a range query merges the stored sketches and adds the open days from raw rows.
+See aggregation.hll for the error bound. As in aggregation.bitmap, reads go to
+the given session and new sketches to `writer`, committed right away.
+"""
+from datetime import date, timedelta
+from sqlalchemy import select, distinct
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import dialect
+from models.daily_rollup import DailyVisitor, DailyFinisher
+from models.daily_sketch import DailySketch, SKETCH_VISITORS, SKETCH_FINISHERS
+from aggregation import rollup
+from aggregation.hll import HyperLogLog
+from aggregation.result_cache import result_cache
+
+
+async def _ensure_sketches(
+    session: AsyncSession,
+    kind: str,
+    model,
+    start: date,
+    end: date,
+    writer: AsyncSession | None = None,
+) -> dict[date, HyperLogLog]:
+    """Build the closed-day sketches in [start, end] that are not stored yet,
+    store them (on `writer`, committed right away, when given) and return them.
+    A day that receives a late event while its sketch is built is not stored;
+    the next query builds it again."""
+    result = await session.execute(
+        select(DailySketch.day).where(
+            DailySketch.kind == kind, DailySketch.day >= start, DailySketch.day <= end
+        )
+    )
+    existing = set(result.scalars().all())
+    missing = []
+    d = start
+    while d <= end:
+        if d not in existing:
+            missing.append(d)
+        d += timedelta(days=1)
+    if not missing:
+        return {}
+
+    generation = result_cache.generation
+    separate_writer = writer is not None and writer is not session
+    if separate_writer:
+        # Read the rollups in a snapshot taken after `generation`.
+        await session.commit()
+    sketches = {d: HyperLogLog() for d in missing}
+    rows = await session.stream(
+        select(model.day, model.account_id).where(
+            model.day >= missing[0], model.day <= missing[-1]
+        )
+    )
+    async for day, account_id in rows:
+        sketch = sketches.get(day)
+        if sketch is not None:
+            sketch.add(account_id)
+    stored = [
+        {"day": d, "kind": kind, "registers": s.to_bytes()}
+        for d, s in sketches.items()
+        if not result_cache.invalidated_since((d, d), generation)
+    ]
+    if stored:
+        await (writer if separate_writer else session).execute(
+            dialect.insert(DailySketch).on_conflict_do_nothing(), stored
+        )
+        if separate_writer:
+            await writer.commit()
+    return sketches
+
+
+async def _range_sketch(
+    session: AsyncSession,
+    kind: str,
+    model,
+    raw_days,
+    period_from: date,
+    period_to: date,
+    hwm: date | None,
+    writer: AsyncSession | None = None,
+) -> HyperLogLog:
+    blobs = []
+    if hwm is not None and period_from <= hwm:
+        closed_end = min(period_to, hwm)
+        built = await _ensure_sketches(session, kind, model, period_from, closed_end, writer)
+        result = await session.execute(
+            select(DailySketch.day, DailySketch.registers).where(
+                DailySketch.kind == kind,
+                DailySketch.day >= period_from,
+                DailySketch.day <= closed_end,
+            )
+        )
+        blobs = [registers for day, registers in result.all() if day not in built]
+        blobs += [s.to_bytes() for s in built.values()]
+    sketch = HyperLogLog.union(blobs)
+
+    raw_start = max(period_from, hwm + timedelta(days=1)) if hwm is not None else period_from
+    if raw_start <= period_to:
+        src = raw_days(raw_start, period_to).subquery()
+        rows = await session.stream(select(distinct(src.c.account_id)))
+        async for (account_id,) in rows:
+            sketch.add(account_id)
+    return sketch
+
+
+async def compute_participation_approx(
+    session: AsyncSession,
+    period_from: date,
+    period_to: date,
+    writer: AsyncSession | None = None,
+) -> tuple[int, int, float]:
+    """Approximate (finished_users, target_users, rate); see aggregation.hll
+    for the error bound of each count."""
+    hwm = await rollup.get_high_water_mark(session)
+    finished = await _range_sketch(
+        session, SKETCH_FINISHERS, DailyFinisher, rollup.finisher_days_raw, period_from, period_to, hwm, writer
+    )
+    target = await _range_sketch(
+        session, SKETCH_VISITORS, DailyVisitor, rollup.visitor_days_raw, period_from, period_to, hwm, writer
+    )
+    finished_users = finished.count() if period_from <= period_to else 0
+    target_users = target.count() if period_from <= period_to else 0
+    rate = (finished_users / target_users) if target_users else 0.0
+    return finished_users, target_users, rate
@@ -0,0 +1,221 @@
+"""Archival of cold months of event_logs and quiz_attempts (SQLite only).
+
+A month is archived once it is entirely behind the rollup high-water mark
+and older than the ARCHIVE_KEEP_MONTHS most recent months. Its rows are
+copied into a new SQLite file under ARCHIVE_DIR, the file is VACUUMed, and
+then, in one transaction on the main database, the copied rows are deleted
+and the month is registered in `archived_partitions`. A crash at any point
+leaves the rows in the live table; the next run redoes the month.
+
+Attempts still in START, or finished after the high-water mark, are not
+copied and stay in the live table. Archive files never change once
+registered, so later runs skip the month and these rows stay live for
+good, like rows that land in an archived month afterwards (bulk replays);
+readers see both (see partitions.union_source). To fold them into the
+file, `restore` the month and `archive` again.
+
+    python -m aggregation.archive archive
+    python -m aggregation.archive list
+    python -m aggregation.archive restore YYYY-MM
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, delete, insert, func, or_
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+import dialect
+import partitions
+from database import IS_SQLITE
+from models.event_log import EventLog
+from models.quiz_attempt import QuizAttempt
+from models.archived_partition import ArchivedPartition
+from aggregation import rollup
+
+ARCHIVE_KEEP_MONTHS = int(os.environ.get("ARCHIVE_KEEP_MONTHS", "3"))
+
+# Schema name of the file being written; readers never see it.
+_NEW = "archive_new"
+
+
+def _file_name(month: date) -> str:
+    return f"events-{month.year:04d}-{month.month:02d}.sqlite"
+
+
+def _month_rows(month: date, hwm: date) -> dict:
+    """Per table, the WHERE clause selecting the rows of `month` to archive."""
+    start = partitions.month_start_dt(month)
+    end = partitions.month_start_dt(partitions.next_month(month))
+    events, attempts = EventLog.__table__, QuizAttempt.__table__
+    return {
+        events: [events.c.occurred_at >= start, events.c.occurred_at < end],
+        attempts: [
+            attempts.c.started_at >= start,
+            attempts.c.started_at < end,
+            attempts.c.status != "START",
+            or_(attempts.c.finished_at.is_(None), attempts.c.finished_at <= rollup._end(hwm)),
+        ],
+    }
+
+
+def _add_months(month: date, n: int) -> date:
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+async def archivable_months(conn: AsyncConnection) -> list[date]:
+    """Months with live rows that are fully rolled up, older than the kept
+    months and not archived yet."""
+    hwm = await rollup.get_high_water_mark(conn)
+    if hwm is None:
+        return []
+    # The first month not entirely behind the mark, minus the kept months.
+    cutoff = _add_months(partitions.month_of(hwm + timedelta(days=1)), -ARCHIVE_KEEP_MONTHS)
+    oldest = (await conn.execute(select(func.min(EventLog.occurred_at)))).scalar()
+    if oldest is None:
+        return []
+    done = set((await conn.execute(select(ArchivedPartition.month))).scalars())
+    months = []
+    month = partitions.month_of(oldest.date())
+    while month < cutoff:
+        if month not in done:
+            months.append(month)
+        month = partitions.next_month(month)
+    return months
+
+
+def _vacuum(path: str) -> None:
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+async def archive_month(engine: AsyncEngine, month: date) -> ArchivedPartition | None:
+    """Move `month` into its archive file. Returns None when it has no rows."""
+    file_name = _file_name(month)
+    path = partitions.archive_path(file_name)
+    partial = path + ".partial"
+    os.makedirs(partitions.ARCHIVE_DIR, exist_ok=True)
+    for leftover in (path, partial):
+        # Unregistered leftovers of an interrupted run.
+        if os.path.exists(leftover):
+            os.remove(leftover)
+
+    async with engine.connect() as conn:
+        await conn.exec_driver_sql(f"ATTACH DATABASE ? AS {_NEW}", (partial,))
+        try:
+            hwm = await rollup.get_high_water_mark(conn)
+            where = _month_rows(month, hwm)
+            tables = [partitions.archived_table(t, _NEW) for t in partitions.ARCHIVED_TABLES]
+            await conn.run_sync(lambda c: tables[0].metadata.create_all(c, tables=tables))
+            counts = {}
+            for table, target in zip(partitions.ARCHIVED_TABLES, tables):
+                result = await conn.execute(
+                    insert(target).from_select(list(table.c.keys()), select(table).where(*where[table]))
+                )
+                counts[table] = result.rowcount
+            attempts = tables[1]
+            last_finished = (await conn.execute(select(func.max(attempts.c.finished_at)))).scalar()
+            await conn.commit()
+        finally:
+            await conn.rollback()
+            await conn.exec_driver_sql(f"DETACH DATABASE {_NEW}")
+            await conn.commit()
+        if not any(counts.values()):
+            os.remove(partial)
+            return None
+
+        await asyncio.to_thread(_vacuum, partial)
+        os.replace(partial, path)
+
+        archived = ArchivedPartition(
+            month=month,
+            last_day=max(partitions.month_end(month), last_finished.date() if last_finished else month),
+            file_name=file_name,
+            event_rows=counts[EventLog.__table__],
+            attempt_rows=counts[QuizAttempt.__table__],
+            size_bytes=os.path.getsize(path),
+            archived_at=datetime.utcnow(),
+        )
+        async with partitions.attached(conn, [archived]) as (schema,):
+            # Delete exactly the copied rows; anything that arrived since
+            # stays live.
+            for table in partitions.ARCHIVED_TABLES:
+                copied = partitions.archived_table(table, schema)
+                await conn.execute(delete(table).where(table.c.id.in_(select(copied.c.id))))
+            await conn.execute(
+                insert(ArchivedPartition).values(
+                    {c.key: getattr(archived, c.key) for c in ArchivedPartition.__table__.c}
+                )
+            )
+            await conn.commit()
+        return archived
+
+
+async def restore_month(engine: AsyncEngine, month: date) -> ArchivedPartition | None:
+    """Move an archived month back into the live tables and drop its file."""
+    async with engine.connect() as conn:
+        archived = (
+            await conn.execute(select(ArchivedPartition).where(ArchivedPartition.month == month))
+        ).first()
+        if archived is None:
+            return None
+        async with partitions.attached(conn, [archived]) as (schema,):
+            for table in partitions.ARCHIVED_TABLES:
+                copied = partitions.archived_table(table, schema)
+                # The WHERE keeps SQLite from parsing ON CONFLICT as a join clause.
+                await conn.execute(
+                    dialect.insert(table)
+                    .from_select(list(table.c.keys()), select(copied).where(copied.c.id.is_not(None)))
+                    .on_conflict_do_nothing()
+                )
+            await conn.execute(delete(ArchivedPartition).where(ArchivedPartition.month == month))
+            await conn.commit()
+    os.remove(partitions.archive_path(archived.file_name))
+    return archived
+
+
+async def archive(engine: AsyncEngine) -> list[ArchivedPartition]:
+    """Archive every archivable month, oldest first."""
+    async with engine.connect() as conn:
+        months = await archivable_months(conn)
+    done = []
+    for month in months:
+        archived = await archive_month(engine, month)
+        if archived is not None:
+            done.append(archived)
+    return done
+
+
+async def _main(argv: list[str]) -> None:
+    from database import engine, init_db
+
+    if not IS_SQLITE:
+        raise SystemExit("archival is only implemented for SQLite; use native partitioning on PostgreSQL")
+    await init_db()
+    command = argv[0] if argv else "list"
+    if command == "archive":
+        for p in await archive(engine):
+            print(f"{p.month:%Y-%m}: {p.event_rows} events, {p.attempt_rows} attempts, {p.size_bytes} bytes")
+    elif command == "list":
+        async with engine.connect() as conn:
+            rows = (await conn.execute(select(ArchivedPartition).order_by(ArchivedPartition.month))).all()
+        for p in rows:
+            print(f"{p.month:%Y-%m} {p.file_name} events={p.event_rows} attempts={p.attempt_rows} "
+                  f"bytes={p.size_bytes} archived={p.archived_at:%Y-%m-%d %H:%M}")
+    elif command == "restore":
+        if len(argv) < 2:
+            raise SystemExit("usage: restore YYYY-MM")
+        month = date.fromisoformat(argv[1] + "-01")
+        p = await restore_month(engine, month)
+        print(f"restored {month:%Y-%m}" if p else f"{month:%Y-%m} is not archived")
+    else:
+        raise SystemExit(f"unknown command: {command}")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
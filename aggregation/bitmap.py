@@ -0,0 +1,253 @@
+"""Cohort bitmaps: active-account sets as Python ints indexed by account ordinal.
+
+Every account gets a dense ordinal in `account_ordinals`; a day's visitors (or
+finishers) become an int with bit `ordinal` set. Set algebra is then native int
+arithmetic: OR for unions, AND for intersections, int.bit_count() for the
+cardinality. Closed days are built once from the daily rollups and kept in a
+bounded in-process LRU; open days are rebuilt from raw rows on each query.
+
+The engine reads on the session it is given. Ordinals of new accounts are
+written on `writer` when one is passed, in a short transaction of its own
+(see ensure_ordinals), so a long computation does not hold SQLite's write
+lock.
+"""
+import os
+import sys
+from collections import OrderedDict
+from datetime import date, timedelta
+from sqlalchemy import select, distinct, exists
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import dialect
+from models.account_ordinal import AccountOrdinal
+from models.daily_rollup import DailyVisitor, DailyFinisher
+from aggregation import rollup
+from aggregation.result_cache import add_event_day_listener, result_cache
+
+BITMAP_CACHE_MAX_BYTES = int(os.environ.get("BITMAP_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+VISITORS = "VISITORS"
+FINISHERS = "FINISHERS"
+
+_SOURCES = {
+    VISITORS: (DailyVisitor, rollup.visitor_days_raw),
+    FINISHERS: (DailyFinisher, rollup.finisher_days_raw),
+}
+
+
+def to_bitmap(ordinals) -> int:
+    ordinals = list(ordinals)
+    if not ordinals:
+        return 0
+    buf = bytearray(max(ordinals) // 8 + 1)
+    for o in ordinals:
+        buf[o >> 3] |= 1 << (o & 7)
+    return int.from_bytes(buf, "little")
+
+
+def bitmap_bytes(bitmap: int) -> int:
+    return sys.getsizeof(bitmap)
+
+
+class BitmapCache:
+    """LRU of closed-day bitmaps keyed on (kind, day), bounded by total size."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._bitmaps: OrderedDict[tuple[str, date], int] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple[str, date]) -> int | None:
+        bitmap = self._bitmaps.get(key)
+        if bitmap is None:
+            self.misses += 1
+            return None
+        self._bitmaps.move_to_end(key)
+        self.hits += 1
+        return bitmap
+
+    def put(self, key: tuple[str, date], bitmap: int) -> None:
+        self.discard(key)
+        self._bitmaps[key] = bitmap
+        self._bytes += bitmap_bytes(bitmap)
+        while self._bitmaps and self._bytes > self.max_bytes:
+            _, evicted = self._bitmaps.popitem(last=False)
+            self._bytes -= bitmap_bytes(evicted)
+
+    def discard(self, key: tuple[str, date]) -> None:
+        bitmap = self._bitmaps.pop(key, None)
+        if bitmap is not None:
+            self._bytes -= bitmap_bytes(bitmap)
+
+    def discard_days(self, days) -> None:
+        for d in days:
+            for kind in _SOURCES:
+                self.discard((kind, d))
+
+    def clear(self) -> None:
+        self._bitmaps.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "bitmaps": len(self._bitmaps),
+            "totalBytes": self._bytes,
+            "maxBytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "items": [
+                {
+                    "kind": kind,
+                    "day": d.isoformat(),
+                    "cardinality": bitmap.bit_count(),
+                    "bytes": bitmap_bytes(bitmap),
+                }
+                for (kind, d), bitmap in self._bitmaps.items()
+            ],
+        }
+
+
+bitmap_cache = BitmapCache(BITMAP_CACHE_MAX_BYTES)
+# A replayed event on a closed day changes that day's rollup.
+add_event_day_listener(bitmap_cache.discard_days)
+
+
+async def ensure_ordinals(session: AsyncSession, src, writer: AsyncSession | None = None) -> None:
+    """Assign ordinals to the accounts in `src.c.account_id` that have none.
+
+    Without `writer` they are inserted on `session`, in its transaction. With
+    one, `session` only reads: if any account lacks an ordinal, `writer`
+    inserts them and commits right away, and `session`'s read transaction is
+    ended so that its next query sees them.
+    """
+    insert_missing = (
+        dialect.insert(AccountOrdinal)
+        # The WHERE also keeps SQLite from parsing ON CONFLICT as a join clause.
+        .from_select(["account_id"], select(distinct(src.c.account_id)).where(src.c.account_id.is_not(None)))
+        .on_conflict_do_nothing()
+    )
+    if writer is None or writer is session:
+        await session.execute(insert_missing)
+        return
+    missing = await session.execute(
+        select(src.c.account_id)
+        .where(
+            src.c.account_id.is_not(None),
+            ~exists().where(AccountOrdinal.account_id == src.c.account_id),
+        )
+        .limit(1)
+    )
+    if missing.first() is None:
+        return
+    await writer.execute(insert_missing)
+    await writer.commit()
+    # Nothing to write on a read session; this only starts a new snapshot.
+    await session.commit()
+
+
+async def _day_bitmaps(session: AsyncSession, account_days, writer: AsyncSession | None = None) -> dict[date, int]:
+    """Group (day, account_id) rows into per-day bitmaps, assigning ordinals to
+    accounts that do not have one yet."""
+    src = account_days.subquery()
+    await ensure_ordinals(session, src, writer)
+    rows = await session.stream(
+        select(src.c.day, AccountOrdinal.ordinal).join(
+            AccountOrdinal, AccountOrdinal.account_id == src.c.account_id
+        )
+    )
+    by_day: dict[date, list[int]] = {}
+    async for day, ordinal in rows:
+        by_day.setdefault(day, []).append(ordinal)
+    return {day: to_bitmap(ordinals) for day, ordinals in by_day.items()}
+
+
+async def active_bitmap(
+    session: AsyncSession,
+    kind: str,
+    start: date,
+    end: date,
+    writer: AsyncSession | None = None,
+) -> int:
+    """Accounts active (by `kind`) on any day in [start, end], as one bitmap."""
+    model, raw_days = _SOURCES[kind]
+    hwm = await rollup.get_high_water_mark(session)
+    bitmap = 0
+
+    if hwm is not None and start <= hwm:
+        closed_end = min(end, hwm)
+        missing = []
+        d = start
+        while d <= closed_end:
+            cached = bitmap_cache.get((kind, d))
+            if cached is None:
+                missing.append(d)
+            else:
+                bitmap |= cached
+            d += timedelta(days=1)
+        if missing:
+            generation = result_cache.generation
+            if writer is not None and writer is not session:
+                # Read the rollups in a snapshot taken after `generation`.
+                await session.commit()
+            built = await _day_bitmaps(
+                session,
+                select(model.day, model.account_id).where(
+                    model.day >= missing[0], model.day <= missing[-1]
+                ),
+                writer,
+            )
+            for d in missing:
+                day_bitmap = built.get(d, 0)
+                # A day that received a late event meanwhile is rebuilt next time.
+                if not result_cache.invalidated_since((d, d), generation):
+                    bitmap_cache.put((kind, d), day_bitmap)
+                bitmap |= day_bitmap
+
+    raw_start = max(start, hwm + timedelta(days=1)) if hwm is not None else start
+    if raw_start <= end:
+        for day_bitmap in (await _day_bitmaps(session, raw_days(raw_start, end), writer)).values():
+            bitmap |= day_bitmap
+    return bitmap
+
+
+async def cohort_intersection(
+    session: AsyncSession,
+    ranges: list[tuple[date, date]],
+    kind: str = VISITORS,
+    writer: AsyncSession | None = None,
+) -> tuple[int, int]:
+    """Accounts active in every range, and in any of them: (in_all, in_any)."""
+    in_all = None
+    in_any = 0
+    for start, end in ranges:
+        bitmap = await active_bitmap(session, kind, start, end, writer)
+        in_all = bitmap if in_all is None else in_all & bitmap
+        in_any |= bitmap
+    return (in_all or 0).bit_count(), in_any.bit_count()
+
+
+async def compute_retention_bitmap(
+    session: AsyncSession,
+    buckets: list[tuple[date, date]],
+    writer: AsyncSession | None = None,
+) -> tuple[int, int, float]:
+    """(retained, total, rate) over arbitrary buckets: a len(buckets)-way AND."""
+    retained, total = await cohort_intersection(session, buckets, writer=writer)
+    rate = (retained / total) if total else 0.0
+    return retained, total, rate
+
+
+async def compute_participation_bitmap(
+    session: AsyncSession,
+    period_from: date,
+    period_to: date,
+    writer: AsyncSession | None = None,
+) -> tuple[int, int, float]:
+    if period_from > period_to:
+        return 0, 0, 0.0
+    finished_users = (await active_bitmap(session, FINISHERS, period_from, period_to, writer)).bit_count()
+    target_users = (await active_bitmap(session, VISITORS, period_from, period_to, writer)).bit_count()
+    rate = (finished_users / target_users) if target_users else 0.0
+    return finished_users, target_users, rate
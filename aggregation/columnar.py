@@ -0,0 +1,471 @@
+"""Columnar analytics engine over the daily rollups (optional, needs NumPy).
+
+Closed days are exported once, oldest first, in segments of up to
+COLUMNAR_EXPORT_DAYS days under COLUMNAR_DIR. Each segment has three column
+files sorted by day: account ordinal (int32, from `account_ordinals`), day
+(int32, days since 1970-01-01) and kind (int8, visit or finish). meta.json
+lists the segments. The files are memory-mapped. Participation and retention
+become boolean masks over the columns, scattered into one presence array per
+account ordinal. Open days after the rollup high-water mark are read from
+raw rows on each query, as in the bitmap engine.
+
+A late event on an exported day marks the day dirty, and the next query
+rewrites the segment holding it. The segment is written to new files,
+meta.json is switched to them, and the old files are removed. Files never
+change once written, so processes still mapping the old ones keep reading
+them until they pick up the new meta.json. Exports from several processes
+are serialised by a lock file. A segment that another process rebuilt after
+the day was marked is not rebuilt again.
+
+    python -m aggregation.columnar export
+    python -m aggregation.columnar rebuild
+    python -m aggregation.columnar verify FROM TO
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+from sqlalchemy import select, literal, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not on Windows
+    fcntl = None
+
+from database import DB_PATH, async_session_factory, read_session_factory
+from models.account_ordinal import AccountOrdinal
+from models.daily_rollup import DailyVisitor, DailyFinisher
+from aggregation import rollup
+from aggregation.bitmap import ensure_ordinals
+from aggregation.result_cache import add_event_day_listener
+
+COLUMNAR_DIR = os.environ.get("COLUMNAR_DIR", os.path.join(os.path.dirname(DB_PATH), "columnar"))
+# Closed days per segment: a late event rewrites this many days, and the
+# first export of a long history does not hold it all in memory.
+COLUMNAR_EXPORT_DAYS = int(os.environ.get("COLUMNAR_EXPORT_DAYS", "31"))
+
+AVAILABLE = np is not None
+
+KIND_VISIT = 0
+KIND_FINISH = 1
+
+EPOCH = date(1970, 1, 1)
+_EPOCH_ORDINAL = EPOCH.toordinal()
+
+# file name -> dtype
+_COLUMNS = {"ordinal": "int32", "day": "int32", "kind": "int8"}
+_LOCK_POLL_S = 0.05
+
+
+def day_number(d: date) -> int:
+    return d.toordinal() - _EPOCH_ORDINAL
+
+
+def _account_days(start: date | None, end: date, raw: bool):
+    """(day, account_id, kind) rows of both kinds, from the rollups or raw rows."""
+    parts = []
+    for kind, model, raw_days in (
+        (KIND_VISIT, DailyVisitor, rollup.visitor_days_raw),
+        (KIND_FINISH, DailyFinisher, rollup.finisher_days_raw),
+    ):
+        if raw:
+            q = raw_days(start, end).add_columns(literal(kind).label("kind"))
+        else:
+            q = select(model.day, model.account_id, literal(kind).label("kind")).where(model.day <= end)
+            if start is not None:
+                q = q.where(model.day >= start)
+        parts.append(q)
+    return union_all(*parts)
+
+
+async def _fetch_columns(session: AsyncSession, account_days, writer: AsyncSession | None = None) -> dict:
+    """`account_days` as NumPy columns sorted by day, assigning missing
+    account ordinals (see ensure_ordinals for `writer`)."""
+    src = account_days.subquery()
+    await ensure_ordinals(session, src, writer)
+    result = await session.execute(
+        select(AccountOrdinal.ordinal, src.c.day, src.c.kind)
+        .join(AccountOrdinal, AccountOrdinal.account_id == src.c.account_id)
+        .order_by(src.c.day)
+    )
+    rows = result.all()
+    return {
+        "ordinal": np.fromiter((r[0] for r in rows), dtype=np.int32, count=len(rows)),
+        "day": np.fromiter((day_number(r[1]) for r in rows), dtype=np.int32, count=len(rows)),
+        "kind": np.fromiter((r[2] for r in rows), dtype=np.int8, count=len(rows)),
+    }
+
+
+async def _first_day(session: AsyncSession, default: date) -> date:
+    days = []
+    for model in (DailyVisitor, DailyFinisher):
+        result = await session.execute(select(model.day).order_by(model.day).limit(1))
+        days.append(result.scalar() or default)
+    return min(days)
+
+
+def _empty_columns() -> dict:
+    return {name: np.zeros(0, dtype=dtype) for name, dtype in _COLUMNS.items()}
+
+
+class ColumnStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+        # {"id", "first", "last", "rows", "maxOrdinal", "builtAt"}, oldest first
+        self.segments: list[dict] = []
+        self.next_id = 0
+        self.exported_through: date | None = None
+        self.exports = 0
+        self.rewrites = 0
+        self._meta_mtime: float | None = None
+        self._maps: list[dict] | None = None
+        # Exported day -> time.time() it was first marked dirty.
+        self._dirty: dict[date, float] = {}
+        self._lock = asyncio.Lock()
+
+    @property
+    def rows(self) -> int:
+        return sum(segment["rows"] for segment in self.segments)
+
+    @property
+    def max_ordinal(self) -> int:
+        return max((segment["maxOrdinal"] for segment in self.segments), default=-1)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _file(self, segment: dict, name: str) -> str:
+        return self._path(f"{name}-{segment['id']:06d}.bin")
+
+    def _load_meta(self) -> None:
+        """Pick up the state written by the last export (in any process)."""
+        path = self._path("meta.json")
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self._meta_mtime:
+            return
+        with open(path) as f:
+            meta = json.load(f)
+        # A store written before segments existed has none and is exported again.
+        self.segments = [
+            {**segment, "first": date.fromisoformat(segment["first"]), "last": date.fromisoformat(segment["last"])}
+            for segment in meta.get("segments", [])
+        ]
+        self.next_id = meta.get("nextId", 0)
+        self.exported_through = self.segments[-1]["last"] if self.segments else None
+        self._meta_mtime = mtime
+        self._maps = None
+
+    def _write_meta(self) -> None:
+        path = self._path("meta.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump({
+                "segments": [
+                    {**segment, "first": segment["first"].isoformat(), "last": segment["last"].isoformat()}
+                    for segment in self.segments
+                ],
+                "nextId": self.next_id,
+                "exportedThrough": self.exported_through.isoformat() if self.exported_through else None,
+            }, f)
+        os.replace(path + ".tmp", path)
+        self._meta_mtime = os.stat(path).st_mtime
+        self._maps = None
+
+    def _write_segment(self, columns: dict, first: date, last: date, built_at: float) -> dict:
+        """Write the files of a new segment; it is committed once meta.json
+        lists it. Files of an interrupted write are overwritten by the next."""
+        rows = len(columns["ordinal"])
+        segment = {
+            "id": self.next_id,
+            "first": first,
+            "last": last,
+            "rows": rows,
+            "maxOrdinal": int(columns["ordinal"].max()) if rows else -1,
+            "builtAt": built_at,
+        }
+        self.next_id += 1
+        for name, dtype in _COLUMNS.items():
+            with open(self._file(segment, name), "wb") as f:
+                f.write(columns[name].astype(dtype, copy=False).tobytes())
+        return segment
+
+    def _remove_files(self, segment: dict) -> None:
+        for name in _COLUMNS:
+            try:
+                os.remove(self._file(segment, name))
+            except FileNotFoundError:
+                pass
+
+    def _map(self) -> list[dict]:
+        return [
+            {
+                name: np.memmap(self._file(segment, name), dtype=dtype, mode="r", shape=(segment["rows"],))
+                for name, dtype in _COLUMNS.items()
+            }
+            for segment in self.segments
+            if segment["rows"]
+        ]
+
+    def columns(self) -> list[dict]:
+        """The columns of each exported segment, memory-mapped."""
+        if self._maps is None:
+            try:
+                self._maps = self._map()
+            except FileNotFoundError:
+                # Rewritten by another process since meta.json was read.
+                self._meta_mtime = None
+                self._load_meta()
+                self._maps = self._map()
+        return self._maps
+
+    def _open_lock_file(self):
+        os.makedirs(self.directory, exist_ok=True)
+        return open(self._path("export.lock"), "w")
+
+    @asynccontextmanager
+    async def _exclusive(self):
+        async with self._lock:
+            if fcntl is None:
+                await asyncio.to_thread(os.makedirs, self.directory, exist_ok=True)
+                yield
+                return
+            with await asyncio.to_thread(self._open_lock_file) as f:
+                while True:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        await asyncio.sleep(_LOCK_POLL_S)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    async def _build(self, reader: AsyncSession, writer: AsyncSession, first: date, last: date) -> dict:
+        built_at = time.time()
+        # Read from a snapshot taken after built_at.
+        await reader.commit()
+        columns = await _fetch_columns(reader, _account_days(first, last, raw=False), writer)
+        return self._write_segment(columns, first, last, built_at)
+
+    async def _rewrite_dirty(self, reader: AsyncSession, writer: AsyncSession) -> None:
+        """Rebuild each segment holding a day marked dirty after the segment
+        was built, then forget the days marked before it was."""
+        for i, segment in enumerate(list(self.segments)):
+            # The first segment also takes late events before its first day.
+            days = [d for d in list(self._dirty) if (i == 0 or segment["first"] <= d) and d <= segment["last"]]
+            if not days:
+                continue
+            if max(self._dirty[d] for d in days) >= segment["builtAt"]:
+                rebuilt = await self._build(reader, writer, min([segment["first"], *days]), segment["last"])
+                self.segments[i] = rebuilt
+                self._write_meta()
+                self._remove_files(segment)
+                self.rewrites += 1
+            built_at = self.segments[i]["builtAt"]
+            for d in days:
+                if self._dirty.get(d, built_at) < built_at:
+                    del self._dirty[d]
+        through = self.exported_through
+        for d in list(self._dirty):
+            if through is None or d > through:
+                del self._dirty[d]
+
+    async def sync(self, session: AsyncSession) -> None:
+        """Export the closed days after `exported_through`, and rewrite the
+        segments holding days marked dirty by late events. `session` only
+        reads the high-water mark. The export reads on a session of its own
+        and commits the account ordinals it assigns on another, before the
+        files that hold them are written."""
+        self._load_meta()
+        hwm = await rollup.get_high_water_mark(session)
+        if hwm is None or (self.exported_through == hwm and not self._dirty):
+            return
+        async with self._exclusive():
+            self._load_meta()
+            async with async_session_factory() as writer, read_session_factory() as reader:
+                await self._rewrite_dirty(reader, writer)
+                through = self.exported_through
+                start = through + timedelta(days=1) if through is not None else await _first_day(reader, hwm)
+                while start <= hwm:
+                    end = min(start + timedelta(days=COLUMNAR_EXPORT_DAYS - 1), hwm)
+                    self.segments.append(await self._build(reader, writer, start, end))
+                    self.exported_through = end
+                    self._write_meta()
+                    start = end + timedelta(days=1)
+            self.exports += 1
+
+    def mark_dirty(self, days) -> None:
+        """Event-day listener. Only exported days are kept: most writes are to
+        open days, which every query reads raw anyway."""
+        self._load_meta()
+        through = self.exported_through
+        if through is None:
+            return
+        now = time.time()
+        for d in days:
+            if d <= through:
+                self._dirty.setdefault(d, now)
+
+    def reset(self) -> None:
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".bin") or name == "meta.json":
+                    os.remove(self._path(name))
+        self.segments = []
+        self.next_id = 0
+        self.exported_through = None
+        self._meta_mtime = None
+        self._maps = None
+        self._dirty.clear()
+
+    def stats(self) -> dict:
+        return {
+            "available": AVAILABLE,
+            "rows": self.rows,
+            "bytes": self.rows * sum(np.dtype(t).itemsize for t in _COLUMNS.values()) if AVAILABLE else 0,
+            "segments": len(self.segments),
+            "exportedThrough": self.exported_through.isoformat() if self.exported_through else None,
+            "exports": self.exports,
+            "rewrites": self.rewrites,
+            "dirtyDays": len(self._dirty),
+        }
+
+
+column_store = ColumnStore(COLUMNAR_DIR)
+# A replayed event on a closed day adds rows to that day's rollup.
+add_event_day_listener(column_store.mark_dirty)
+
+
+class _Snapshot:
+    """Exported columns plus the open days, for one query."""
+
+    def __init__(self, store: ColumnStore, open_columns: dict):
+        self._parts = [*store.columns(), open_columns]
+        self.size = max(store.max_ordinal, int(open_columns["ordinal"].max(initial=-1))) + 1
+
+    def active(self, kind: int, start: date, end: date):
+        """Presence array over account ordinals: active on any day in [start, end]."""
+        seen = np.zeros(self.size, dtype=bool)
+        lo, hi = day_number(start), day_number(end)
+        for cols in self._parts:
+            # Every part is sorted by day.
+            first, last = np.searchsorted(cols["day"], [lo, hi + 1])
+            mask = cols["kind"][first:last] == kind
+            seen[cols["ordinal"][first:last][mask]] = True
+        return seen
+
+
+async def _snapshot(session: AsyncSession, start: date, end: date, writer: AsyncSession | None = None) -> _Snapshot:
+    if not AVAILABLE:
+        raise RuntimeError("the columnar engine needs numpy")
+    await column_store.sync(session)
+    hwm = column_store.exported_through
+    raw_start = max(start, hwm + timedelta(days=1)) if hwm is not None else start
+    if raw_start <= end:
+        open_columns = await _fetch_columns(session, _account_days(raw_start, end, raw=True), writer)
+    else:
+        open_columns = _empty_columns()
+    return _Snapshot(column_store, open_columns)
+
+
+async def compute_participation_columnar(
+    session: AsyncSession,
+    period_from: date,
+    period_to: date,
+    writer: AsyncSession | None = None,
+) -> tuple[int, int, float]:
+    if period_from > period_to:
+        return 0, 0, 0.0
+    snap = await _snapshot(session, period_from, period_to, writer)
+    finished_users = int(snap.active(KIND_FINISH, period_from, period_to).sum())
+    target_users = int(snap.active(KIND_VISIT, period_from, period_to).sum())
+    rate = (finished_users / target_users) if target_users else 0.0
+    return finished_users, target_users, rate
+
+
+async def compute_retention_columnar(
+    session: AsyncSession,
+    buckets: list[tuple[date, date]],
+    writer: AsyncSession | None = None,
+) -> tuple[int, int, float]:
+    """(retained, total, rate): accounts active in every bucket, over those
+    active in any."""
+    snap = await _snapshot(session, buckets[0][0], buckets[-1][1], writer)
+    in_all = in_any = None
+    for start, end in buckets:
+        active = snap.active(KIND_VISIT, start, end)
+        in_all = active if in_all is None else in_all & active
+        in_any = active if in_any is None else in_any | active
+    retained, total = int(in_all.sum()), int(in_any.sum())
+    rate = (retained / total) if total else 0.0
+    return retained, total, rate
+
+
+async def verify(
+    session: AsyncSession,
+    period_from: date,
+    period_to: date,
+    writer: AsyncSession | None = None,
+) -> list[str]:
+    """Compare the columnar engine with the SQL engine on every day's
+    participation and every 4-week retention anchor in the range. Returns
+    the mismatches; empty means identical."""
+    from aggregation import service
+
+    mismatches = []
+    d = period_from
+    while d <= period_to:
+        sql = await service.compute_participation(session, d, d)
+        col = await compute_participation_columnar(session, d, d, writer)
+        if sql != col:
+            mismatches.append(f"participation {d}: sql={sql} columnar={col}")
+        buckets = service.retention_buckets(d, 4, service.GRANULARITY_WEEK)
+        sql = await service.compute_retention(session, buckets, service.GRANULARITY_WEEK)
+        col = await compute_retention_columnar(session, buckets, writer)
+        if sql != col:
+            mismatches.append(f"retention_4w {d}: sql={sql} columnar={col}")
+        d += timedelta(days=1)
+    return mismatches
+
+
+async def _main(argv: list[str]) -> int:
+    from database import init_db
+
+    if not AVAILABLE:
+        print("the columnar engine needs numpy: pip install numpy", file=sys.stderr)
+        return 1
+    await init_db()
+    command = argv[0] if argv else "export"
+    async with async_session_factory() as writer, read_session_factory() as session:
+        if command == "rebuild":
+            column_store.reset()
+            command = "export"
+        if command == "export":
+            await column_store.sync(session)
+            print(column_store.stats())
+        elif command == "verify":
+            period_from, period_to = (date.fromisoformat(a) for a in argv[1:3])
+            mismatches = await verify(session, period_from, period_to, writer)
+            for line in mismatches:
+                print(line)
+            print("identical" if not mismatches else f"{len(mismatches)} mismatches")
+            return 1 if mismatches else 0
+        else:
+            raise SystemExit(f"unknown command: {command}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
@@ -0,0 +1,89 @@
+"""HyperLogLog distinct counter.
+
+With the default precision p=14 (16384 one-byte registers, 16 KiB per sketch)
+the relative standard error of a count is 1.04 / sqrt(2**14) ~= 0.81%, so an
+estimate falls within +/-2.44% (3 sigma) of the exact count ~99.7% of the time.
+Error is somewhat higher than that near the switch from linear counting to the
+raw estimator (~2.5 * 2**14 ~= 41k distinct accounts).
+Merging sketches is lossless: the merge of per-day sketches estimates the
+distinct count of the union of those days.
+"""
+import math
+from collections.abc import Iterable
+from hashlib import blake2b
+
+try:
+    import numpy as np
+except ImportError:  # optional: only speeds up merge/count
+    np = None
+
+HLL_PRECISION = 14
+HLL_STANDARD_ERROR = 1.04 / math.sqrt(1 << HLL_PRECISION)
+
+_HASH_BITS = 64
+_INV_POW2 = [2.0 ** -k for k in range(_HASH_BITS + 1)]
+
+
+class HyperLogLog:
+    def __init__(self, registers: bytes | None = None, precision: int = HLL_PRECISION):
+        self.p = precision
+        self.m = 1 << precision
+        if registers is not None and len(registers) != self.m:
+            raise ValueError(f"expected {self.m} registers, got {len(registers)}")
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+
+    def add(self, value: str) -> None:
+        h = int.from_bytes(blake2b(value.encode(), digest_size=8).digest(), "big")
+        w_bits = _HASH_BITS - self.p
+        idx = h >> w_bits
+        rank = w_bits - (h & ((1 << w_bits) - 1)).bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def update(self, values: Iterable[str]) -> None:
+        for v in values:
+            self.add(v)
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.p != self.p:
+            raise ValueError("cannot merge sketches of different precision")
+        if np is not None:
+            merged = np.maximum(
+                np.frombuffer(self.registers, dtype=np.uint8),
+                np.frombuffer(other.registers, dtype=np.uint8),
+            )
+            self.registers = bytearray(merged.tobytes())
+        else:
+            self.registers = bytearray(map(max, self.registers, other.registers))
+
+    @classmethod
+    def union(cls, register_blobs: Iterable[bytes], precision: int = HLL_PRECISION) -> "HyperLogLog":
+        """Merge many serialized sketches at once."""
+        blobs = list(register_blobs)
+        if not blobs:
+            return cls(precision=precision)
+        if np is not None:
+            stacked = np.frombuffer(b"".join(blobs), dtype=np.uint8).reshape(len(blobs), -1)
+            return cls(stacked.max(axis=0).tobytes(), precision)
+        sketch = cls(blobs[0], precision)
+        for blob in blobs[1:]:
+            sketch.merge(cls(blob, precision))
+        return sketch
+
+    def count(self) -> int:
+        m = self.m
+        if np is not None:
+            regs = np.frombuffer(self.registers, dtype=np.uint8)
+            total = float(np.ldexp(1.0, -regs.astype(np.int32)).sum())
+            zeros = int(m - np.count_nonzero(regs))
+        else:
+            total = sum(_INV_POW2[r] for r in self.registers)
+            zeros = self.registers.count(0)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / total
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting for small cardinalities
+        return round(estimate)
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
@@ -0,0 +1,166 @@
+"""Cross-process cache invalidation for multi-worker deployments (SQLite).
+
+Every process keeps its own result_cache, bitmap cache and column-store dirty
+set, and a commit only invalidates those of the process that made it
+(result_cache.dispatch_event_days). So that the other uvicorn workers, and
+CLI processes writing to the same file, hear about it too, a commit that
+marked event days also inserts them into `cache_invalidations`, in the same
+transaction. Each process polls `PRAGMA data_version` on a connection of its
+own every INVALIDATION_POLL_S. The value changes only when another
+connection has committed, so an idle poll does not run a query. When it
+changes, the poller reads the rows after the last id it saw and dispatches
+their days to the local caches, skipping the rows it published itself.
+Each poller also deletes rows older than INVALIDATION_RETENTION_S, at most
+once per tenth of that time.
+
+A worker's caches therefore trail another worker's writes by at most about
+one poll interval. The channel costs an extra insert per commit and a poll
+per process, so it is on by default only with more than one worker:
+
+    WEB_CONCURRENCY=4 python main.py        # or: WEB_CONCURRENCY=4 uvicorn main:app --workers 4
+
+All workers must use the same DATABASE_URL file. INVALIDATION_ENABLED=1 or
+=0 overrides the default, e.g. =1 for a single worker that shares its file
+with other writing processes. The snapshot scheduler runs in every worker;
+it only stores snapshots that are missing, so the extra workers mostly find
+cache hits. On PostgreSQL the channel is off (sequence ids can commit out of
+order); run a single worker per cache or use LISTEN/NOTIFY.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from sqlalchemy import event, insert, make_url
+from sqlalchemy.orm import Session
+
+from database import DATABASE_URL, IS_SQLITE, SQLITE_BUSY_TIMEOUT_MS
+from models.cache_invalidation import CacheInvalidation
+from aggregation.result_cache import PENDING_EVENT_DAYS_KEY, dispatch_event_days
+
+logger = logging.getLogger(__name__)
+
+# Worker count, as uvicorn and main.py read it.
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", "1"))
+INVALIDATION_ENABLED = IS_SQLITE and os.environ.get(
+    "INVALIDATION_ENABLED", "1" if WEB_CONCURRENCY > 1 else "0"
+) == "1"
+INVALIDATION_POLL_S = float(os.environ.get("INVALIDATION_POLL_S", "0.5"))
+INVALIDATION_RETENTION_S = float(os.environ.get("INVALIDATION_RETENTION_S", "3600"))
+
+# Identifies the rows this process published; spawned workers each get one.
+ORIGIN = uuid.uuid4().hex
+
+# SQLAlchemy's storage format for DateTime on SQLite, for comparisons in raw SQL.
+_SQLITE_DATETIME = "%Y-%m-%d %H:%M:%S.%f"
+
+
+@event.listens_for(Session, "before_commit")
+def _publish_pending(session: Session) -> None:
+    if not INVALIDATION_ENABLED:
+        return
+    days = session.info.get(PENDING_EVENT_DAYS_KEY)
+    if days:
+        now = datetime.utcnow()
+        session.execute(
+            insert(CacheInvalidation),
+            [{"day": d, "origin": ORIGIN, "created_at": now} for d in sorted(days)],
+        )
+
+
+class InvalidationChannel:
+    """Polls `cache_invalidations` for days written by other processes."""
+
+    def __init__(self, path: str, poll_s: float = INVALIDATION_POLL_S, retention_s: float = INVALIDATION_RETENTION_S):
+        self.path = path
+        self.poll_s = poll_s
+        self.retention_s = retention_s
+        self._conn: sqlite3.Connection | None = None
+        self._task: asyncio.Task | None = None
+        self._data_version: int | None = None
+        self._next_prune = 0.0
+        self.last_id = 0
+        self.polls = 0
+        self.changes = 0
+        self.received_days = 0
+        self.pruned = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self._conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        # Only what is published from now on matters; the caches start empty.
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        self.last_id = self._conn.execute("SELECT coalesce(max(id), 0) FROM cache_invalidations").fetchone()[0]
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def poll(self) -> set[date]:
+        """Days published by other processes since the last poll."""
+        self.polls += 1
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return set()
+        self._data_version = version
+        self.changes += 1
+        rows = self._conn.execute(
+            "SELECT id, day, origin FROM cache_invalidations WHERE id > ? ORDER BY id", (self.last_id,)
+        ).fetchall()
+        if not rows:
+            return set()
+        self.last_id = rows[-1][0]
+        days = {date.fromisoformat(day) for _, day, origin in rows if origin != ORIGIN}
+        self.received_days += len(days)
+        if time.monotonic() >= self._next_prune:
+            self._next_prune = time.monotonic() + self.retention_s / 10
+            cutoff = datetime.utcnow() - timedelta(seconds=self.retention_s)
+            self.pruned += self._conn.execute(
+                "DELETE FROM cache_invalidations WHERE created_at < ?", (cutoff.strftime(_SQLITE_DATETIME),)
+            ).rowcount
+        return days
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                days = await asyncio.to_thread(self.poll)
+                if days:
+                    dispatch_event_days(days)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Cache invalidation poll failed")
+            await asyncio.sleep(self.poll_s)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": INVALIDATION_ENABLED,
+            "running": self.running,
+            "origin": ORIGIN,
+            "lastId": self.last_id,
+            "polls": self.polls,
+            "changes": self.changes,
+            "receivedDays": self.received_days,
+            "pruned": self.pruned,
+            "pollSeconds": self.poll_s,
+        }
+
+
+invalidation_channel = InvalidationChannel(make_url(DATABASE_URL).database or "")
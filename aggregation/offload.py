@@ -0,0 +1,139 @@
+"""Process pool for the read-only analytics computations.
+
+The exact SQL engine's computations (participation, retention, cohorts)
+iterate rows and build results in Python, which holds the event loop for as
+long as they run and stalls every other request of the worker. With
+ANALYTICS_WORKERS > 0 they run in a ProcessPoolExecutor instead. Each pool
+process opens its own read-only connections (NullPool, the read pragmas of
+database.read_engine) and runs one computation per job with asyncio.run.
+Cache lookups, rollup catch-up and snapshot writes stay in the server
+process. So do the sketch, bitmap and columnar engines, which write as they
+go and depend on in-process caches.
+
+At most ANALYTICS_QUEUE_MAX jobs may be queued or running. Past that,
+`run` raises AnalyticsBusy, which the routes answer with 503 and
+Retry-After. When every client of a flight has disconnected, its job is
+dropped if no pool process has picked it up yet. The executor hands each
+process one job ahead, so only jobs queued behind those can be dropped. A
+job that was already handed out finishes, so its snapshot is still stored.
+"""
+import asyncio
+import concurrent.futures
+import multiprocessing
+import os
+from collections.abc import Awaitable, Callable
+from typing import Any
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+ANALYTICS_WORKERS = int(os.environ.get("ANALYTICS_WORKERS", "2"))
+ANALYTICS_QUEUE_MAX = int(os.environ.get("ANALYTICS_QUEUE_MAX", str(max(ANALYTICS_WORKERS, 1) * 4)))
+ANALYTICS_RETRY_AFTER_S = int(os.environ.get("ANALYTICS_RETRY_AFTER_S", "2"))
+
+
+class AnalyticsBusy(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"analytics queue is full; retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+# Pool process side. Each process builds its session factory once; NullPool
+# because every job runs on a new event loop and connections cannot outlive it.
+_worker_sessions: async_sessionmaker[AsyncSession] | None = None
+
+
+def _init_worker() -> None:
+    global _worker_sessions
+    from database import DATABASE_URL, _on_read_connect
+
+    engine = create_async_engine(DATABASE_URL, poolclass=NullPool)
+    event.listen(engine.sync_engine, "connect", _on_read_connect)
+    _worker_sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def _call(fn: Callable[..., Awaitable[Any]], args: tuple) -> Any:
+    async with _worker_sessions() as session:
+        return await fn(session, *args)
+
+
+def _run_job(fn: Callable[..., Awaitable[Any]], args: tuple) -> Any:
+    return asyncio.run(_call(fn, args))
+
+
+def _ready() -> None:
+    pass
+
+
+class AnalyticsPool:
+    """Runs `fn(read_session, *args)` in a pool process when started, and in
+    the event loop on the given session otherwise (CLIs, benchmarks)."""
+
+    def __init__(self, workers: int = ANALYTICS_WORKERS, queue_max: int = ANALYTICS_QUEUE_MAX):
+        self.workers = workers
+        self.queue_max = queue_max
+        self._executor: concurrent.futures.ProcessPoolExecutor | None = None
+        self.depth = 0
+        self.jobs = 0
+        self.rejected = 0
+        self.dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._executor is not None
+
+    def start(self) -> None:
+        if self.running or self.workers <= 0:
+            return
+        # spawn: forking would copy the event loop, its threads and open connections.
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        # Start the processes now instead of on the first request.
+        for _ in range(self.workers):
+            self._executor.submit(_ready)
+
+    def stop(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, fn: Callable[..., Awaitable[Any]], session: AsyncSession, *args) -> Any:
+        if self._executor is None:
+            return await fn(session, *args)
+        if self.depth >= self.queue_max:
+            self.rejected += 1
+            raise AnalyticsBusy(ANALYTICS_RETRY_AFTER_S)
+        job = self._executor.submit(_run_job, fn, args)
+        self.depth += 1
+        self.jobs += 1
+        result = asyncio.wrap_future(job)
+        result.add_done_callback(self._done)
+        try:
+            return await asyncio.shield(result)
+        except asyncio.CancelledError:
+            if job.cancel():
+                self.dropped += 1
+                raise
+            # Already running: let it finish so the caller can still store it.
+            asyncio.current_task().uncancel()
+            return await result
+
+    def _done(self, result: asyncio.Future) -> None:
+        self.depth -= 1
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "workers": self.workers if self.running else 0,
+            "depth": self.depth,
+            "queueMax": self.queue_max,
+            "jobs": self.jobs,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+        }
+
+
+analytics_pool = AnalyticsPool()
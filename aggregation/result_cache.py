@@ -0,0 +1,204 @@
+import os
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from datetime import date, datetime
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models.aggregation_snapshot import AggregationSnapshot
+from aggregation.rollup import last_closed_day
+
+# How long a result for a period that includes an open day stays valid.
+ANALYTICS_OPEN_TTL_S = float(os.environ.get("ANALYTICS_OPEN_TTL_S", "30"))
+# Entries kept before the least recently used one is evicted.
+ANALYTICS_CACHE_MAX_ENTRIES = int(os.environ.get("ANALYTICS_CACHE_MAX_ENTRIES", "10000"))
+# Whether a cache hit still stores the result again (see aggregation.snapshots).
+ANALYTICS_SNAPSHOT_ON_HIT = os.environ.get("ANALYTICS_SNAPSHOT_ON_HIT", "0") == "1"
+
+# Session.info key holding the UTC days the current transaction wrote events to.
+PENDING_EVENT_DAYS_KEY = "pending_event_days"
+
+# (metric_type, period_from, period_to, anchor_date)
+CacheKey = tuple[str, date | None, date | None, date | None]
+
+
+class _Entry:
+    __slots__ = ("snapshot", "window", "expires_at")
+
+    def __init__(self, snapshot: AggregationSnapshot, window: tuple[date, date], expires_at: float | None):
+        self.snapshot = snapshot
+        self.window = window
+        self.expires_at = expires_at
+
+
+class ResultCache:
+    """Analytics results keyed on (metric_type, period_from, period_to, anchor_date).
+
+    Entries whose window is fully closed never expire; entries covering an open
+    day live for `open_ttl` seconds. Both are dropped as soon as an event is
+    written to a day inside their window (see `invalidate_days`), and the least
+    recently used entry is evicted beyond `max_entries`.
+
+    A result computed while one of its days was invalidated may predate the
+    write, so `put` takes the `generation` read before computing and drops
+    the result if a day of its window was invalidated since.
+    """
+
+    def __init__(self, open_ttl: float = ANALYTICS_OPEN_TTL_S, max_entries: int = ANALYTICS_CACHE_MAX_ENTRIES):
+        self.open_ttl = open_ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[CacheKey, _Entry] = OrderedDict()
+        # Closed days that received late (replayed) events, with the time they did.
+        self._late_writes: dict[date, datetime] = {}
+        # Day -> generation of its last invalidation.
+        self._invalidated_at: dict[date, int] = {}
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self.stale_puts = 0
+
+    def get(self, key: CacheKey) -> AggregationSnapshot | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at is not None and entry.expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry.snapshot
+
+    def record(self, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def put(
+        self,
+        key: CacheKey,
+        snapshot: AggregationSnapshot,
+        window: tuple[date, date],
+        closed: bool,
+        generation: int | None = None,
+    ) -> None:
+        if generation is not None and self.invalidated_since(window, generation):
+            self.stale_puts += 1
+            return
+        expires_at = None if closed else time.monotonic() + self.open_ttl
+        self._entries[key] = _Entry(_detached(snapshot), window, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidated_since(self, window: tuple[date, date], generation: int) -> bool:
+        """Whether a day of `window` was invalidated after `generation`."""
+        return any(
+            g > generation and window[0] <= d <= window[1] for d, g in self._invalidated_at.items()
+        )
+
+    def invalidate_days(self, days, late: bool = False) -> None:
+        """Drop every entry whose window contains one of `days`. `late` marks
+        writes to already-closed days so stored snapshots are not reused."""
+        days = set(days)
+        if not days:
+            return
+        self.generation += 1
+        for d in days:
+            self._invalidated_at[d] = self.generation
+        if late:
+            now = datetime.utcnow()
+            for d in days:
+                self._late_writes[d] = now
+        stale = [
+            key
+            for key, entry in self._entries.items()
+            if any(entry.window[0] <= d <= entry.window[1] for d in days)
+        ]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+
+    def late_write_since(self, window: tuple[date, date]) -> datetime | None:
+        """Latest late write into the window, if any happened in this process."""
+        times = [t for d, t in self._late_writes.items() if window[0] <= d <= window[1]]
+        return max(times) if times else None
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._late_writes.clear()
+        self._invalidated_at.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "maxEntries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+            "stalePuts": self.stale_puts,
+            "hitRate": (self.hits / lookups) if lookups else 0.0,
+            "openTtlSeconds": self.open_ttl,
+            "snapshotOnHit": ANALYTICS_SNAPSHOT_ON_HIT,
+        }
+
+
+def _detached(snap: AggregationSnapshot) -> AggregationSnapshot:
+    """Plain copy so the cached value does not hold on to a session."""
+    return AggregationSnapshot(
+        id=snap.id,
+        metric_type=snap.metric_type,
+        period_from=snap.period_from,
+        period_to=snap.period_to,
+        anchor_date=snap.anchor_date,
+        numerator=snap.numerator,
+        denominator=snap.denominator,
+        rate=snap.rate,
+        created_at=snap.created_at,
+        snapshot_key=snap.snapshot_key,
+    )
+
+
+result_cache = ResultCache()
+
+
+_event_day_listeners: list[Callable[[set[date]], None]] = []
+
+
+def add_event_day_listener(callback: Callable[[set[date]], None]) -> None:
+    """Call `callback(days)` whenever a transaction that wrote events commits;
+    for other in-process caches derived from event data."""
+    _event_day_listeners.append(callback)
+
+
+def mark_event_days(session, days) -> None:
+    """Record the days this transaction writes events to; matching cache
+    entries are invalidated once it commits. Accepts Session or AsyncSession."""
+    session.info.setdefault(PENDING_EVENT_DAYS_KEY, set()).update(days)
+
+
+def dispatch_event_days(days: set[date]) -> None:
+    """Invalidate this process's caches for events written to `days`, by a
+    commit here or (see aggregation.invalidation) in another process."""
+    closed = last_closed_day()
+    result_cache.invalidate_days({d for d in days if d > closed})
+    result_cache.invalidate_days({d for d in days if d <= closed}, late=True)
+    for callback in _event_day_listeners:
+        callback(days)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_pending(session: Session) -> None:
+    days = session.info.pop(PENDING_EVENT_DAYS_KEY, None)
+    if days:
+        dispatch_event_days(days)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session: Session) -> None:
+    session.info.pop(PENDING_EVENT_DAYS_KEY, None)
@@ -0,0 +1,237 @@
+"""Daily rollups of distinct visitors and finishers.
+
+`daily_visitors` / `daily_finishers` hold one row per (day, account). Days up to
+the high-water mark in `rollup_state` are complete; later days (including the
+still-open current day) are read from raw rows by the analytics queries.
+
+Maintenance:
+    python -m aggregation.rollup catch-up
+    python -m aggregation.rollup rebuild
+    python -m aggregation.rollup verify [FROM TO]
+"""
+import asyncio
+import os
+import sys
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, delete, func, literal_column
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import dialect
+import partitions
+from models.event_log import EventLog
+from models.quiz_attempt import QuizAttempt
+from models.daily_rollup import DailyVisitor, DailyFinisher, RollupState
+from models.daily_sketch import DailySketch, SKETCH_VISITORS, SKETCH_FINISHERS
+
+SERVICE_VISIT = "SERVICE_VISIT"
+ROLLUP_STATE_NAME = "daily"
+# A day is closed only once it ended this long ago, so visits flushed late
+# from the write-behind buffer still land before the day is rolled up.
+ROLLUP_CLOSE_DELAY_S = int(os.environ.get("ROLLUP_CLOSE_DELAY_S", "300"))
+
+
+def _start(d: date) -> datetime:
+    return datetime(d.year, d.month, d.day)
+
+
+def _end(d: date) -> datetime:
+    return datetime(d.year, d.month, d.day, 23, 59, 59, 999999)
+
+
+def visitor_days_raw(start: date | None, end: date, source=None):
+    """(day, account_id) pairs with a SERVICE_VISIT, from raw event_logs (or
+    `source`, e.g. partitions.union_source over archived months)."""
+    t = EventLog.__table__ if source is None else source
+    q = select(dialect.day_of(t.c.occurred_at).label("day"), t.c.account_id).where(
+        t.c.event_type == SERVICE_VISIT,
+        t.c.occurred_at <= _end(end),
+    )
+    if start is not None:
+        q = q.where(t.c.occurred_at >= _start(start))
+    return q.group_by(literal_column("day"), t.c.account_id)
+
+
+def finisher_days_raw(start: date | None, end: date, source=None):
+    """(day, account_id) pairs with a FINISH attempt, from raw quiz_attempts
+    (or `source`)."""
+    t = QuizAttempt.__table__ if source is None else source
+    q = select(dialect.day_of(t.c.finished_at).label("day"), t.c.account_id).where(
+        t.c.status == "FINISH",
+        t.c.finished_at <= _end(end),
+    )
+    if start is not None:
+        q = q.where(t.c.finished_at >= _start(start))
+    return q.group_by(literal_column("day"), t.c.account_id)
+
+
+def last_closed_day(now: datetime | None = None) -> date:
+    now = now or datetime.utcnow()
+    return (now - timedelta(seconds=ROLLUP_CLOSE_DELAY_S)).date() - timedelta(days=1)
+
+
+async def get_high_water_mark(session: AsyncSession) -> date | None:
+    result = await session.execute(
+        select(RollupState.high_water_mark).where(RollupState.name == ROLLUP_STATE_NAME)
+    )
+    return result.scalar()
+
+
+async def _set_high_water_mark(session: AsyncSession, day: date) -> None:
+    await session.execute(
+        dialect.insert(RollupState)
+        .values(name=ROLLUP_STATE_NAME, high_water_mark=day)
+        .on_conflict_do_update(index_elements=["name"], set_={"high_water_mark": day})
+    )
+
+
+async def catch_up(session: AsyncSession, now: datetime | None = None) -> date | None:
+    """Roll up every closed day after the high-water mark. Returns the new mark
+    (None when nothing has ever been rolled up and there is nothing closed)."""
+    hwm = await get_high_water_mark(session)
+    target = last_closed_day(now)
+    if hwm is not None and hwm >= target:
+        return hwm
+    start = hwm + timedelta(days=1) if hwm is not None else None
+
+    await session.execute(
+        dialect.insert(DailyVisitor)
+        .from_select(["day", "account_id"], visitor_days_raw(start, target))
+        .on_conflict_do_nothing()
+    )
+    await session.execute(
+        dialect.insert(DailyFinisher)
+        .from_select(["day", "account_id"], finisher_days_raw(start, target))
+        .on_conflict_do_nothing()
+    )
+    await _set_high_water_mark(session, target)
+    await session.flush()
+    return target
+
+
+async def rebuild(session: AsyncSession, now: datetime | None = None) -> date | None:
+    """Drop all rollup rows and recompute them from raw data, including the
+    archived months (read one file at a time)."""
+    await session.execute(delete(DailyVisitor))
+    await session.execute(delete(DailyFinisher))
+    await session.execute(delete(DailySketch))
+    await session.execute(delete(RollupState).where(RollupState.name == ROLLUP_STATE_NAME))
+    last = last_closed_day(now)
+    for p in await partitions.archived_months(session):
+        for model, raw, table in (
+            (DailyVisitor, visitor_days_raw, EventLog.__table__),
+            (DailyFinisher, finisher_days_raw, QuizAttempt.__table__),
+        ):
+            rows = await partitions.fetch_archived(
+                p, lambda schema: raw(None, last, partitions.archived_table(table, schema))
+            )
+            if rows:
+                await session.execute(
+                    dialect.insert(model).on_conflict_do_nothing(),
+                    [{"day": day, "account_id": account_id} for day, account_id in rows],
+                )
+    # Rows still in the live tables, including late ones for archived months.
+    return await catch_up(session, now)
+
+
+async def apply_late_visits(
+    session: AsyncSession,
+    visits: list[tuple[str, datetime]],
+) -> None:
+    """Add visits that landed on already-closed days (bulk replays) to the rollup."""
+    hwm = await get_high_water_mark(session)
+    if hwm is None:
+        return
+    rows = {(t.date(), user_id) for user_id, t in visits if t.date() <= hwm}
+    if rows:
+        await session.execute(
+            dialect.insert(DailyVisitor).on_conflict_do_nothing(),
+            [{"day": d, "account_id": a} for d, a in rows],
+        )
+        await _drop_sketches(session, SKETCH_VISITORS, {d for d, _ in rows})
+
+
+async def apply_late_finishes(
+    session: AsyncSession,
+    finishes: list[tuple[str, datetime]],
+) -> None:
+    """Same as apply_late_visits for FINISH attempts."""
+    hwm = await get_high_water_mark(session)
+    if hwm is None:
+        return
+    rows = {(t.date(), user_id) for user_id, t in finishes if t.date() <= hwm}
+    if rows:
+        await session.execute(
+            dialect.insert(DailyFinisher).on_conflict_do_nothing(),
+            [{"day": d, "account_id": a} for d, a in rows],
+        )
+        await _drop_sketches(session, SKETCH_FINISHERS, {d for d, _ in rows})
+
+
+async def _drop_sketches(session: AsyncSession, kind: str, days: set[date]) -> None:
+    """Per-day HyperLogLog sketches are derived from the rollups; drop the ones
+    for days whose rollup just changed so they get rebuilt."""
+    await session.execute(
+        delete(DailySketch).where(DailySketch.kind == kind, DailySketch.day.in_(days))
+    )
+
+
+async def verify(
+    session: AsyncSession,
+    period_from: date | None = None,
+    period_to: date | None = None,
+) -> dict[str, int]:
+    """Compare rollup rows with the raw path over closed days in the range.
+    Returns counts of (day, account) pairs missing from / extra in each rollup;
+    all zeros means consistent."""
+    hwm = await get_high_water_mark(session)
+    if hwm is None:
+        return {"visitorsMissing": 0, "visitorsExtra": 0, "finishersMissing": 0, "finishersExtra": 0}
+    end = min(period_to, hwm) if period_to else hwm
+
+    async def count(q) -> int:
+        result = await session.execute(select(func.count()).select_from(q.subquery()))
+        return result.scalar() or 0
+
+    def rolled(model, seg_from: date | None, seg_to: date):
+        q = select(model.day, model.account_id).where(model.day <= seg_to)
+        if seg_from is not None:
+            q = q.where(model.day >= seg_from)
+        return q
+
+    totals = {"visitorsMissing": 0, "visitorsExtra": 0, "finishersMissing": 0, "finishersExtra": 0}
+    archived = await partitions.archived_months(session, period_from, end)
+    # Each range is checked against the live rows plus the archive files
+    # holding rows for it.
+    for seg_from, seg_to in partitions.segments(archived, period_from, end):
+        files = [p for p in archived if p.month <= seg_to and (seg_from is None or p.last_day >= seg_from)]
+        async with partitions.attached(session, files) as schemas:
+            for prefix, model, raw, table in (
+                ("visitors", DailyVisitor, visitor_days_raw, EventLog.__table__),
+                ("finishers", DailyFinisher, finisher_days_raw, QuizAttempt.__table__),
+            ):
+                raw_q = raw(seg_from, seg_to, partitions.union_source(table, schemas))
+                totals[prefix + "Missing"] += await count(raw_q.except_(rolled(model, seg_from, seg_to)))
+                totals[prefix + "Extra"] += await count(rolled(model, seg_from, seg_to).except_(raw_q))
+    return totals
+
+
+async def _main(argv: list[str]) -> None:
+    from database import async_session_factory, init_db
+
+    await init_db()
+    command = argv[0] if argv else "catch-up"
+    async with async_session_factory() as session:
+        if command == "catch-up":
+            print("high-water mark:", await catch_up(session))
+        elif command == "rebuild":
+            print("high-water mark:", await rebuild(session))
+        elif command == "verify":
+            bounds = [date.fromisoformat(a) for a in argv[1:3]]
+            print(await verify(session, *bounds))
+        else:
+            raise SystemExit(f"unknown command: {command}")
+        await session.commit()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
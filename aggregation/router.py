@@ -1,79 +1,281 @@
+import asyncio
+from collections.abc import Hashable
 from datetime import date
-from fastapi import APIRouter, Depends, Query
+from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import get_db
+from database import get_read_db, async_session_factory, read_session_factory
+from pagination import InvalidCursor, decode_cursor
+from responses import FastJSONResponse, dumps_line
 from aggregation.schemas import (
     ParticipationResponse,
     Retention4wResponse,
-    SnapshotItem,
+    RetentionResponse,
+    RetentionBucket,
+    RetentionCohort,
     SnapshotsResponse,
 )
+from aggregation.hll import HLL_STANDARD_ERROR
+from aggregation.result_cache import result_cache
+from aggregation.bitmap import bitmap_cache
+from aggregation import columnar
+from aggregation.scheduler import snapshot_scheduler
+from aggregation.singleflight import analytics_flights
+from aggregation.offload import AnalyticsBusy, analytics_pool
 from aggregation.service import (
-    compute_participation,
-    save_participation_snapshot,
-    compute_retention_4w,
-    save_retention_snapshot,
-    list_snapshots,
+    ENGINE_SQL,
+    ENGINE_COLUMNAR,
+    PARTICIPATION,
+    PARTICIPATION_APPROX,
+    RETENTION_4W,
+    GRANULARITY_WEEK,
+    participation_snapshot,
+    retention_4w_snapshot,
+    retention_report,
+    list_snapshot_rows,
+    stream_snapshots,
+    snapshot_cursor,
 )
 from quiz.service import format_datetime
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
+Engine = Literal["sql", "bitmap", "columnar"]
+
+
+def _check_engine(engine: str) -> None:
+    if engine == ENGINE_COLUMNAR and not columnar.AVAILABLE:
+        raise HTTPException(status_code=400, detail="The columnar engine needs numpy, which is not installed")
+
+
+# Identical concurrent analytics requests share one computation (and one
+# snapshot write). A flight owns its sessions and commits inside the flight,
+# so it completes even when the request that started it goes away, unless
+# every request waiting for it has gone while its pool job is still queued.
+
+# How often a request waiting on a flight checks that its client is still there.
+DISCONNECT_POLL_S = 0.25
+
+
+async def _flight(request: Request, key: Hashable, fn):
+    """analytics_flights.do(key, fn) on behalf of one request. A full analytics
+    pool answers 503 with Retry-After; a client that disconnects stops waiting
+    (see SingleFlight's cancel_abandoned and aggregation.offload)."""
+    waiting = asyncio.ensure_future(analytics_flights.do(key, fn, cancel_abandoned=True))
+    while not (await asyncio.wait({waiting}, timeout=DISCONNECT_POLL_S))[0]:
+        if await request.is_disconnected():
+            waiting.cancel()
+            raise HTTPException(status_code=499, detail="Client closed request")
+    try:
+        return waiting.result()
+    except AnalyticsBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+async def _participation_flight(period_from: date, period_to: date, approx: bool, engine: str):
+    async with async_session_factory() as db, read_session_factory() as read_db:
+        snap = await participation_snapshot(db, period_from, period_to, approx, engine, read_session=read_db)
+        await db.commit()
+        return snap
+
+
+async def _retention_4w_flight(anchor_date: date, engine: str):
+    async with async_session_factory() as db, read_session_factory() as read_db:
+        snap = await retention_4w_snapshot(db, anchor_date, engine, read_session=read_db)
+        await db.commit()
+        return snap
+
+
+async def _retention_flight(anchor_date: date, weeks: int, granularity: str, cohort: bool, engine: str):
+    async with async_session_factory() as db, read_session_factory() as read_db:
+        report = await retention_report(db, anchor_date, weeks, granularity, cohort, engine, read_session=read_db)
+        await db.commit()
+        return report
+
 
 @router.get("/participation", response_model=ParticipationResponse)
 async def get_participation(
+    request: Request,
     from_: date = Query(..., alias="from", description="Period start YYYY-MM-DD"),
     to: date = Query(..., description="Period end YYYY-MM-DD"),
-    db: AsyncSession = Depends(get_db),
+    approx: bool = Query(False, description="Estimate distinct counts with HyperLogLog sketches"),
+    engine: Engine = Query(ENGINE_SQL, description="Exact engine used when the result is not cached"),
 ):
-    finished_users, target_users, rate = await compute_participation(db, from_, to)
-    snap = await save_participation_snapshot(
-        db, from_, to, finished_users, target_users, rate
+    _check_engine(engine)
+    metric_type = PARTICIPATION_APPROX if approx else PARTICIPATION
+    snap = await _flight(
+        request,
+        (metric_type, from_, to, None, engine),
+        lambda: _participation_flight(from_, to, approx, engine),
     )
     return ParticipationResponse(
-        finishedUsers=finished_users,
-        targetUsers=target_users,
-        participationRate=rate,
+        finishedUsers=snap.numerator,
+        targetUsers=snap.denominator,
+        participationRate=snap.rate,
         snapshotId=snap.id,
+        approximate=approx,
+        standardError=HLL_STANDARD_ERROR if approx else None,
     )
 
 
 @router.get("/retention/4w", response_model=Retention4wResponse)
 async def get_retention_4w(
+    request: Request,
     anchorDate: date = Query(..., description="Anchor date YYYY-MM-DD"),
-    db: AsyncSession = Depends(get_db),
+    engine: Engine = Query(ENGINE_SQL, description="Exact engine used when the result is not cached"),
 ):
-    retained_users, total_users, rate = await compute_retention_4w(db, anchorDate)
-    snap = await save_retention_snapshot(
-        db, anchorDate, retained_users, total_users, rate
+    _check_engine(engine)
+    snap = await _flight(
+        request,
+        (RETENTION_4W, None, None, anchorDate, engine),
+        lambda: _retention_4w_flight(anchorDate, engine),
     )
     return Retention4wResponse(
-        retainedUsers=retained_users,
-        totalUsers=total_users,
-        retentionRate=rate,
+        retainedUsers=snap.numerator,
+        totalUsers=snap.denominator,
+        retentionRate=snap.rate,
         snapshotId=snap.id,
     )
 
 
+RETENTION_MAX_PERIODS = 104
+
+
+@router.get("/retention", response_model=RetentionResponse)
+async def get_retention(
+    request: Request,
+    anchorDate: date = Query(..., description="Anchor date YYYY-MM-DD (last day of the last bucket)"),
+    weeks: int = Query(4, ge=1, le=RETENTION_MAX_PERIODS, description="Number of buckets (weeks at the default granularity)"),
+    granularity: Literal["day", "week", "month"] = Query(GRANULARITY_WEEK, description="Bucket size"),
+    cohort: bool = Query(False, description="Include the cohort triangle by first active bucket"),
+    engine: Engine = Query(
+        ENGINE_SQL,
+        description="Exact engine used when the result is not cached; the cohort triangle is only computed by sql, "
+        "so cohort=true with another engine is rejected with 400",
+    ),
+):
+    _check_engine(engine)
+    if cohort and engine != ENGINE_SQL:
+        raise HTTPException(status_code=400, detail="cohort=true is only supported by engine=sql")
+    report = await _flight(
+        request,
+        ("RETENTION", anchorDate, weeks, granularity, cohort, engine),
+        lambda: _retention_flight(anchorDate, weeks, granularity, cohort, engine),
+    )
+    buckets = report["buckets"]
+    cohorts = None
+    if report["cohorts"] is not None:
+        cohorts = []
+        for row in report["cohorts"]:
+            c = row["cohort"]
+            active = row["active"] if c < 0 else row["active"][c:]
+            cohorts.append(RetentionCohort(
+                cohort=c,
+                start=buckets[c][0] if c >= 0 else None,
+                size=row["size"],
+                active=active,
+                rates=[(a / row["size"]) if row["size"] else 0.0 for a in active],
+            ))
+    return RetentionResponse(
+        anchorDate=anchorDate,
+        granularity=granularity,
+        buckets=[RetentionBucket(start=b_start, end=b_end) for b_start, b_end in buckets],
+        retainedUsers=report["retained"],
+        totalUsers=report["total"],
+        retentionRate=report["rate"],
+        snapshotId=report["snapshotId"],
+        cohorts=cohorts,
+    )
+
+
+SNAPSHOTS_MAX_LIMIT = 1000
+
+
 @router.get("/snapshots", response_model=SnapshotsResponse)
 async def get_snapshots(
-    metricType: str | None = Query(None, description="Filter by PARTICIPATION or RETENTION_4W"),
-    db: AsyncSession = Depends(get_db),
+    metricType: str | None = Query(None, description="Filter by PARTICIPATION, PARTICIPATION_APPROX or RETENTION_4W"),
+    limit: int | None = Query(None, ge=1, le=SNAPSHOTS_MAX_LIMIT, description="Page size; omit for all rows"),
+    cursor: str | None = Query(None, description="nextCursor of the previous page"),
+    format: Literal["json", "ndjson"] = Query("json", description="ndjson streams one snapshot per line"),
+    db: AsyncSession = Depends(get_read_db),
 ):
-    snapshots = await list_snapshots(db, metricType)
-    items = [
-        SnapshotItem(
-            id=s.id,
-            metric_type=s.metric_type,
-            period_from=s.period_from,
-            period_to=s.period_to,
-            anchor_date=s.anchor_date,
-            numerator=s.numerator,
-            denominator=s.denominator,
-            rate=s.rate,
-            created_at=format_datetime(s.created_at),
+    if cursor is not None:
+        try:
+            decode_cursor(cursor)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if format == "ndjson":
+        return StreamingResponse(
+            _snapshots_ndjson(metricType, limit, cursor), media_type="application/x-ndjson"
         )
-        for s in snapshots
-    ]
-    return SnapshotsResponse(snapshots=items)
+
+    rows = await list_snapshot_rows(db, metricType, limit + 1 if limit else None, cursor)
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = snapshot_cursor(rows[-1])
+    # Returned as-is; response_model above only documents the shape.
+    return FastJSONResponse({"snapshots": [_snapshot_item(r) for r in rows], "nextCursor": next_cursor})
+
+
+def _iso(d: date | None) -> str | None:
+    return d.isoformat() if d is not None else None
+
+
+def _snapshot_item(row) -> dict:
+    """SnapshotItem as a plain dict, from a SNAPSHOT_COLUMNS row."""
+    return {
+        "id": row.id,
+        "metric_type": row.metric_type,
+        "period_from": _iso(row.period_from),
+        "period_to": _iso(row.period_to),
+        "anchor_date": _iso(row.anchor_date),
+        "numerator": row.numerator,
+        "denominator": row.denominator,
+        "rate": row.rate,
+        "created_at": format_datetime(row.created_at),
+    }
+
+
+async def _snapshots_ndjson(metric_type: str | None, limit: int | None, cursor: str | None):
+    async with read_session_factory() as session:
+        sent = 0
+        last = None
+        async for row in stream_snapshots(session, metric_type, limit + 1 if limit else None, cursor):
+            if limit is not None and sent == limit:
+                yield dumps_line({"nextCursor": snapshot_cursor(last)})
+                break
+            yield dumps_line(_snapshot_item(row))
+            sent += 1
+            last = row
+
+
+@router.get("/cache")
+async def get_cache_stats():
+    return {**result_cache.stats(), "singleFlight": analytics_flights.stats()}
+
+
+@router.get("/bitmaps")
+async def get_bitmap_stats():
+    """Cached cohort bitmaps with their cardinality and memory use."""
+    return bitmap_cache.stats()
+
+
+@router.get("/columnar")
+async def get_columnar_stats():
+    """State of the exported columns behind engine=columnar."""
+    return columnar.column_store.stats()
+
+
+@router.get("/pool")
+async def get_pool_stats():
+    """Queue depth and counters of the analytics process pool."""
+    return analytics_pool.stats()
+
+
+@router.get("/scheduler")
+async def get_scheduler_stats():
+    """State of the background snapshot precomputation."""
+    return snapshot_scheduler.stats()
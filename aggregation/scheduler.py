@@ -0,0 +1,139 @@
+"""Background precomputation of the daily analytics snapshots.
+
+Once a UTC day closes (ROLLUP_CLOSE_DELAY_S after midnight), the scheduler
+rolls it up and stores two snapshots: participation for that single day, and
+4-week retention anchored on it. Request handlers then answer those periods
+from the stored snapshots (see service._cached_snapshot) instead of all
+recomputing them when the morning reports arrive.
+
+At startup, and on every run, any of the last SCHEDULER_BACKFILL_DAYS closed
+days that have no valid snapshot yet are filled in, so downtime leaves no
+gaps. At most SCHEDULER_CONCURRENCY computations run at a time. Each run
+ends by pruning snapshot history (snapshots.apply_retention).
+"""
+import asyncio
+import logging
+import os
+from datetime import date, datetime, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database import async_session_factory, read_session_factory
+from aggregation import rollup, snapshots
+from aggregation.service import participation_snapshot, retention_4w_snapshot
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "1") == "1"
+SCHEDULER_BACKFILL_DAYS = int(os.environ.get("SCHEDULER_BACKFILL_DAYS", "7"))
+SCHEDULER_CONCURRENCY = int(os.environ.get("SCHEDULER_CONCURRENCY", "2"))
+# Wait before retrying after a failed run.
+SCHEDULER_RETRY_S = float(os.environ.get("SCHEDULER_RETRY_S", "300"))
+
+PARTICIPATION_DAY = "participation"
+RETENTION_4W = "retention_4w"
+
+
+def next_run_at(now: datetime) -> datetime:
+    """The moment the current UTC day closes (see rollup.last_closed_day)."""
+    midnight = datetime(now.year, now.month, now.day) + timedelta(days=1)
+    at = midnight + timedelta(seconds=rollup.ROLLUP_CLOSE_DELAY_S)
+    # Still before today's close moment (i.e. within the delay after midnight).
+    earlier = at - timedelta(days=1)
+    return earlier if earlier > now else at
+
+
+class SnapshotScheduler:
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        read_session_factory: async_sessionmaker[AsyncSession],
+        backfill_days: int = SCHEDULER_BACKFILL_DAYS,
+        concurrency: int = SCHEDULER_CONCURRENCY,
+    ):
+        self._session_factory = session_factory
+        self._read_session_factory = read_session_factory
+        self._backfill_days = backfill_days
+        self._concurrency = concurrency
+        self._task: asyncio.Task | None = None
+        self.last_run: datetime | None = None
+        self.jobs = 0
+        self.pruned = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def run_once(self, now: datetime | None = None) -> int:
+        """Catch up the rollups, then make sure every closed day in the
+        backfill window has its snapshots. Returns the number of jobs run."""
+        async with self._session_factory() as session:
+            await rollup.catch_up(session, now)
+            await session.commit()
+
+        last = rollup.last_closed_day(now)
+        days = [last - timedelta(days=i) for i in range(self._backfill_days)]
+        semaphore = asyncio.Semaphore(self._concurrency)
+        jobs = [(kind, d) for d in days for kind in (PARTICIPATION_DAY, RETENTION_4W)]
+        results = await asyncio.gather(
+            *(self._job(semaphore, kind, d) for kind, d in jobs), return_exceptions=True
+        )
+        for (kind, d), result in zip(jobs, results):
+            if isinstance(result, Exception):
+                logger.error("Snapshot %s for %s failed", kind, d, exc_info=result)
+        async with self._session_factory() as session:
+            self.pruned += await snapshots.apply_retention(session, now=now)
+            await session.commit()
+        self.last_run = datetime.utcnow()
+        return len(jobs)
+
+    async def _job(self, semaphore: asyncio.Semaphore, kind: str, day: date) -> None:
+        async with semaphore:
+            async with self._session_factory() as session, self._read_session_factory() as read_session:
+                # Days that already have a valid snapshot are cache hits here
+                # and write nothing.
+                if kind == PARTICIPATION_DAY:
+                    await participation_snapshot(session, day, day, read_session=read_session, record_hit=False)
+                else:
+                    await retention_4w_snapshot(session, day, read_session=read_session, record_hit=False)
+                await session.commit()
+            self.jobs += 1
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+                delay = (next_run_at(datetime.utcnow()) - datetime.utcnow()).total_seconds()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Scheduled snapshot run failed")
+                delay = SCHEDULER_RETRY_S
+            await asyncio.sleep(max(delay, 1.0))
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "lastRun": self.last_run.isoformat() if self.last_run else None,
+            "jobs": self.jobs,
+            "prunedSnapshots": self.pruned,
+            "backfillDays": self._backfill_days,
+            "concurrency": self._concurrency,
+        }
+
+
+snapshot_scheduler = SnapshotScheduler(async_session_factory, read_session_factory)
@@ -8,6 +8,9 @@ class ParticipationResponse(BaseModel):
     targetUsers: int
     participationRate: float
     snapshotId: str
+    approximate: bool = False
+    # Relative standard error of each count when approximate (see aggregation.hll)
+    standardError: Optional[float] = None
 
 
 class Retention4wResponse(BaseModel):
@@ -17,6 +20,35 @@ class Retention4wResponse(BaseModel):
     snapshotId: str
 
 
+class RetentionBucket(BaseModel):
+    start: date
+    end: date
+
+
+class RetentionCohort(BaseModel):
+    # Index of the first bucket the accounts were active in; -1 for accounts
+    # already active before the window.
+    cohort: int
+    start: Optional[date] = None
+    size: int
+    # active[k]: accounts of the cohort active k buckets after its first one
+    # (for cohort -1: in bucket k).
+    active: list[int]
+    rates: list[float]
+
+
+class RetentionResponse(BaseModel):
+    anchorDate: date
+    granularity: str
+    buckets: list[RetentionBucket]
+    retainedUsers: int
+    totalUsers: int
+    retentionRate: float
+    # Set when the result is a stored snapshot (the 4-week weekly case)
+    snapshotId: Optional[str] = None
+    cohorts: Optional[list[RetentionCohort]] = None
+
+
 class SnapshotItem(BaseModel):
     id: str
     metric_type: str
@@ -31,3 +63,4 @@ class SnapshotItem(BaseModel):
 
 class SnapshotsResponse(BaseModel):
     snapshots: list[SnapshotItem]
+    nextCursor: Optional[str] = None
@@ -1,16 +1,30 @@
-import uuid
+from collections.abc import AsyncIterator
 from datetime import date, datetime, timedelta
-from sqlalchemy import select, func, distinct
+from sqlalchemy import Row, select, func, distinct, case, and_, union_all
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from models.event_log import EventLog
-from models.quiz_attempt import QuizAttempt
+import dialect
+import partitions
+from pagination import after_cursor_desc, encode_cursor
 from models.aggregation_snapshot import AggregationSnapshot
+from models.daily_rollup import DailyVisitor, DailyFinisher
+from aggregation import rollup, snapshots
+from aggregation.approx import compute_participation_approx
+from aggregation.bitmap import compute_participation_bitmap, compute_retention_bitmap
+from aggregation.columnar import compute_participation_columnar, compute_retention_columnar
+from aggregation.result_cache import result_cache, ANALYTICS_SNAPSHOT_ON_HIT
+from aggregation.offload import analytics_pool
 
 SERVICE_VISIT = "SERVICE_VISIT"
 PARTICIPATION = "PARTICIPATION"
+PARTICIPATION_APPROX = "PARTICIPATION_APPROX"
 RETENTION_4W = "RETENTION_4W"
 
+# Interchangeable exact engines; all return identical results.
+ENGINE_SQL = "sql"
+ENGINE_BITMAP = "bitmap"
+ENGINE_COLUMNAR = "columnar"  # needs numpy
+
 
 def _date_to_datetime_start(d: date) -> datetime:
     return datetime(d.year, d.month, d.day, 0, 0, 0)
@@ -20,40 +34,89 @@ def _date_to_datetime_end(d: date) -> datetime:
     return datetime(d.year, d.month, d.day, 23, 59, 59, 999999)
 
 
+def _account_days(model, raw_days, period_from: date, period_to: date, hwm: date | None):
+    """(day, account_id) rows for the range: rollup rows for days up to the
+    high-water mark, raw rows for the days after it."""
+    parts = []
+    if hwm is not None and period_from <= hwm:
+        parts.append(
+            select(model.day, model.account_id).where(
+                model.day >= period_from,
+                model.day <= min(period_to, hwm),
+            )
+        )
+    raw_start = max(period_from, hwm + timedelta(days=1)) if hwm is not None else period_from
+    if raw_start <= period_to or not parts:
+        parts.append(raw_days(raw_start, period_to))
+    return union_all(*parts) if len(parts) > 1 else parts[0]
+
+
+async def _count_accounts(session: AsyncSession, account_days) -> int:
+    src = account_days.subquery()
+    result = await session.execute(select(func.count(distinct(src.c.account_id))))
+    return result.scalar() or 0
+
+
 async def compute_participation(
     session: AsyncSession,
     period_from: date,
     period_to: date,
 ) -> tuple[int, int, float]:
-    """Returns (finished_users, target_users, rate)."""
+    """Returns (finished_users, target_users, rate).
+
+    Closed days are answered from the daily rollups; only days after the
+    rollup high-water mark touch raw rows. Archived months are always behind
+    the mark, so no archive file is ever attached here.
+    """
+    hwm = await rollup.get_high_water_mark(session)
+    finished_users = await _count_accounts(
+        session,
+        _account_days(DailyFinisher, rollup.finisher_days_raw, period_from, period_to, hwm),
+    )
+    target_users = await _count_accounts(
+        session,
+        _account_days(DailyVisitor, rollup.visitor_days_raw, period_from, period_to, hwm),
+    )
+    rate = (finished_users / target_users) if target_users else 0.0
+    return finished_users, target_users, rate
+
+
+async def _compute_participation_raw(
+    session: AsyncSession,
+    period_from: date,
+    period_to: date,
+) -> tuple[int, int, float]:
+    """Same as compute_participation, straight from event_logs/quiz_attempts
+    (and the archived months in the range)."""
     start_dt = _date_to_datetime_start(period_from)
     end_dt = _date_to_datetime_end(period_to)
 
-    finished_subq = (
-        select(distinct(QuizAttempt.account_id))
-        .where(
-            QuizAttempt.status == "FINISH",
-            QuizAttempt.finished_at >= start_dt,
-            QuizAttempt.finished_at <= end_dt,
+    async with partitions.sources(session, period_from, period_to) as (events, attempts):
+        finished_subq = (
+            select(distinct(attempts.c.account_id))
+            .where(
+                attempts.c.status == "FINISH",
+                attempts.c.finished_at >= start_dt,
+                attempts.c.finished_at <= end_dt,
+            )
         )
-    )
-    target_subq = (
-        select(distinct(EventLog.account_id))
-        .where(
-            EventLog.event_type == SERVICE_VISIT,
-            EventLog.occurred_at >= start_dt,
-            EventLog.occurred_at <= end_dt,
+        target_subq = (
+            select(distinct(events.c.account_id))
+            .where(
+                events.c.event_type == SERVICE_VISIT,
+                events.c.occurred_at >= start_dt,
+                events.c.occurred_at <= end_dt,
+            )
         )
-    )
 
-    finished_result = await session.execute(
-        select(func.count()).select_from(finished_subq.subquery())
-    )
-    target_result = await session.execute(
-        select(func.count()).select_from(target_subq.subquery())
-    )
-    finished_users = finished_result.scalar() or 0
-    target_users = target_result.scalar() or 0
+        finished_result = await session.execute(
+            select(func.count()).select_from(finished_subq.subquery())
+        )
+        target_result = await session.execute(
+            select(func.count()).select_from(target_subq.subquery())
+        )
+        finished_users = finished_result.scalar() or 0
+        target_users = target_result.scalar() or 0
     rate = (finished_users / target_users) if target_users else 0.0
     return finished_users, target_users, rate
 
@@ -65,52 +128,241 @@ async def save_participation_snapshot(
     numerator: int,
     denominator: int,
     rate: float,
+    metric_type: str = PARTICIPATION,
+    created_at: datetime | None = None,
 ) -> AggregationSnapshot:
-    snap = AggregationSnapshot(
-        id=str(uuid.uuid4()),
-        metric_type=PARTICIPATION,
-        period_from=period_from,
-        period_to=period_to,
-        anchor_date=None,
-        numerator=numerator,
-        denominator=denominator,
-        rate=rate,
-        created_at=datetime.utcnow(),
+    return await snapshots.save_snapshot(
+        session, metric_type, period_from, period_to, None, numerator, denominator, rate,
+        created_at=created_at,
     )
-    session.add(snap)
-    await session.flush()
-    return snap
 
 
-def _four_weekly_buckets(anchor_date: date) -> list[tuple[date, date]]:
-    """Four ISO weekly buckets ending at anchor_date (inclusive). Monday = week start.
+GRANULARITY_DAY = "day"
+GRANULARITY_WEEK = "week"
+GRANULARITY_MONTH = "month"
+
+
+def _daily_buckets(anchor_date: date, periods: int) -> list[tuple[date, date]]:
+    return [(d, d) for d in (anchor_date - timedelta(days=i) for i in reversed(range(periods)))]
+
+
+def _weekly_buckets(anchor_date: date, periods: int) -> list[tuple[date, date]]:
+    """`periods` ISO weekly buckets ending at anchor_date (inclusive). Monday = week start.
     Returns [(start, end), ...] with end inclusive. Last bucket may be partial (Monday to anchor_date).
     """
     # Monday of the week containing anchor_date
-    weekday = anchor_date.isoweekday()  # 1=Mon, 7=Sun
-    week4_monday = anchor_date - timedelta(days=weekday - 1)
-    bucket4 = (week4_monday, anchor_date)
+    monday = anchor_date - timedelta(days=anchor_date.isoweekday() - 1)
+    buckets = [(monday, anchor_date)]
+    for _ in range(periods - 1):
+        end = buckets[0][0] - timedelta(days=1)
+        buckets.insert(0, (end - timedelta(days=6), end))
+    return buckets
+
+
+def _monthly_buckets(anchor_date: date, periods: int) -> list[tuple[date, date]]:
+    """Calendar months ending at anchor_date; the last one may be partial."""
+    buckets = [(anchor_date.replace(day=1), anchor_date)]
+    for _ in range(periods - 1):
+        end = buckets[0][0] - timedelta(days=1)
+        buckets.insert(0, (end.replace(day=1), end))
+    return buckets
+
 
-    bucket3_end = week4_monday - timedelta(days=1)
-    bucket3_start = bucket3_end - timedelta(days=6)
-    bucket3 = (bucket3_start, bucket3_end)
+_BUCKETS = {
+    GRANULARITY_DAY: _daily_buckets,
+    GRANULARITY_WEEK: _weekly_buckets,
+    GRANULARITY_MONTH: _monthly_buckets,
+}
+
+
+def retention_buckets(anchor_date: date, periods: int, granularity: str = GRANULARITY_WEEK) -> list[tuple[date, date]]:
+    return _BUCKETS[granularity](anchor_date, periods)
+
+
+def _four_weekly_buckets(anchor_date: date) -> list[tuple[date, date]]:
+    return _weekly_buckets(anchor_date, 4)
 
-    bucket2_end = bucket3_start - timedelta(days=1)
-    bucket2_start = bucket2_end - timedelta(days=6)
-    bucket2 = (bucket2_start, bucket2_end)
 
-    bucket1_end = bucket2_start - timedelta(days=1)
-    bucket1_start = bucket1_end - timedelta(days=6)
-    bucket1 = (bucket1_start, bucket1_end)
+async def compute_retention(
+    session: AsyncSession,
+    buckets: list[tuple[date, date]],
+    granularity: str | None = None,
+) -> tuple[int, int, float]:
+    """Returns (retained_users, total_users, rate): accounts active in every
+    bucket, out of accounts active in any of them. `buckets` are contiguous
+    and ascending; pass `granularity` when they are ISO weeks or calendar
+    periods so the backend's date_trunc can be used.
 
-    return [bucket1, bucket2, bucket3, bucket4]
+    Reads visitor days from the daily rollups (raw rows after the high-water
+    mark), buckets them and counts distinct buckets per account.
+    """
+    hwm = await rollup.get_high_water_mark(session)
+    src = _account_days(
+        DailyVisitor, rollup.visitor_days_raw, buckets[0][0], buckets[-1][1], hwm
+    ).subquery()
+    if granularity == GRANULARITY_WEEK:
+        bucket = _week_bucket(src.c.day, buckets)
+    else:
+        bucket = _bucket_case(src.c.day, buckets)
+    return await _retained_of(
+        session,
+        select(src.c.account_id, func.count(distinct(bucket)).label("bucket_count"))
+        .group_by(src.c.account_id)
+        .subquery(),
+        len(buckets),
+    )
 
 
 async def compute_retention_4w(
     session: AsyncSession,
     anchor_date: date,
 ) -> tuple[int, int, float]:
-    """Returns (retained_users, total_users, rate)."""
+    """Returns (retained_users, total_users, rate) over the four ISO weeks
+    ending at anchor_date."""
+    return await compute_retention(session, _four_weekly_buckets(anchor_date), GRANULARITY_WEEK)
+
+
+def _bucket_case(day, buckets: list[tuple[date, date]], before: int | None = None):
+    """Index of the bucket containing `day`. Buckets are contiguous, so only
+    the upper bounds are compared. Days before the first bucket map to
+    `before` (NULL by default)."""
+    whens = [(day < buckets[0][0], before)] if before is not None else []
+    whens += [(day <= b_end, i) for i, (_, b_end) in enumerate(buckets)]
+    return case(*whens)
+
+
+def _week_bucket(day, buckets: list[tuple[date, date]]):
+    """Bucket key of a Date column for weekly buckets. The buckets are ISO weeks,
+    so the week start identifies them where the backend has date_trunc;
+    otherwise the bucket index."""
+    if dialect.NATIVE_WEEK_START:
+        return dialect.week_start(day)
+    return _bucket_case(day, buckets)
+
+
+async def compute_retention_cohorts(
+    session: AsyncSession,
+    buckets: list[tuple[date, date]],
+) -> list[dict]:
+    """Cohort triangle over `buckets` in one grouped pass over the visitor days.
+
+    Each account active in the window belongs to the cohort of the first
+    bucket it was active in. Accounts with activity before the window form
+    cohort -1. Returns one dict per cohort: its size, how many of its accounts
+    were active in every bucket, and the active count per bucket.
+    """
+    hwm = await rollup.get_high_water_mark(session)
+    # All history up to the window, so earlier activity lands in cohort -1.
+    src = _account_days(
+        DailyVisitor, rollup.visitor_days_raw, date.min, buckets[-1][1], hwm
+    ).subquery()
+    bucket = _bucket_case(src.c.day, buckets, before=-1)
+    # Distinct (account, bucket) pairs first: far fewer rows than account-days,
+    # and the GROUP BY keeps SQLite from inlining the CASE into every flag.
+    pairs = (
+        select(src.c.account_id, bucket.label("bucket"))
+        .group_by(src.c.account_id, bucket)
+        .subquery()
+    )
+    per_account = (
+        select(
+            func.min(pairs.c.bucket).label("cohort"),
+            func.sum(case((pairs.c.bucket >= 0, 1), else_=0)).label("bucket_count"),
+            *[
+                func.max(case((pairs.c.bucket == i, 1), else_=0)).label(f"b{i}")
+                for i in range(len(buckets))
+            ],
+        )
+        .group_by(pairs.c.account_id)
+        .having(func.max(pairs.c.bucket) >= 0)
+        .subquery()
+    )
+    result = await session.execute(
+        select(
+            per_account.c.cohort,
+            func.count(),
+            dialect.count_where(per_account.c.bucket_count == len(buckets)),
+            *[func.sum(per_account.c[f"b{i}"]) for i in range(len(buckets))],
+        )
+        .group_by(per_account.c.cohort)
+        .order_by(per_account.c.cohort)
+    )
+    cohorts = []
+    for cohort, size, retained, *active in result.all():
+        cohorts.append({
+            "cohort": cohort,
+            "size": size,
+            "retained": retained or 0,
+            "active": [a or 0 for a in active],
+        })
+    return cohorts
+
+
+async def _retained_of(session: AsyncSession, per_account, bucket_total: int) -> tuple[int, int, float]:
+    """Collapse (account_id, bucket_count) rows into (retained, total, rate)."""
+    result = await session.execute(
+        select(
+            func.count(),
+            dialect.count_where(per_account.c.bucket_count == bucket_total),
+        ).select_from(per_account)
+    )
+    total_users, retained = result.one()
+    total_users = total_users or 0
+    retained = retained or 0
+
+    rate = (retained / total_users) if total_users else 0.0
+    return retained, total_users, rate
+
+
+async def _compute_retention_4w_raw(
+    session: AsyncSession,
+    anchor_date: date,
+) -> tuple[int, int, float]:
+    """Same as compute_retention_4w, straight from event_logs.
+
+    Buckets every SERVICE_VISIT in the 4-week range by week and counts, per
+    account, how many distinct buckets it touched - all in one grouped query.
+    """
+    buckets = _four_weekly_buckets(anchor_date)
+    start_dt = _date_to_datetime_start(buckets[0][0])
+    end_dt = _date_to_datetime_end(anchor_date)
+
+    async with partitions.sources(session, buckets[0][0], anchor_date) as (events, _):
+        bucket_expr = case(
+            *[
+                (
+                    and_(
+                        events.c.occurred_at >= _date_to_datetime_start(b_start),
+                        events.c.occurred_at <= _date_to_datetime_end(b_end),
+                    ),
+                    i,
+                )
+                for i, (b_start, b_end) in enumerate(buckets)
+            ],
+        )
+        per_account = (
+            select(
+                events.c.account_id,
+                func.count(distinct(bucket_expr)).label("bucket_count"),
+            )
+            .where(
+                events.c.event_type == SERVICE_VISIT,
+                events.c.occurred_at >= start_dt,
+                events.c.occurred_at <= end_dt,
+            )
+            .group_by(events.c.account_id)
+            .subquery()
+        )
+        return await _retained_of(session, per_account, len(buckets))
+
+
+async def _compute_retention_4w_reference(
+    session: AsyncSession,
+    anchor_date: date,
+) -> tuple[int, int, float]:
+    """Per-account loop kept as the reference path for the retention engines.
+    Issues up to four queries per account; do not use on request paths.
+    """
     buckets = _four_weekly_buckets(anchor_date)
     range_start = buckets[0][0]
     range_end = anchor_date
@@ -118,46 +370,47 @@ async def compute_retention_4w(
     start_dt = _date_to_datetime_start(range_start)
     end_dt = _date_to_datetime_end(range_end)
 
-    # All users with >=1 SERVICE_VISIT in the full 4-week range
-    total_subq = (
-        select(distinct(EventLog.account_id))
-        .where(
-            EventLog.event_type == SERVICE_VISIT,
-            EventLog.occurred_at >= start_dt,
-            EventLog.occurred_at <= end_dt,
-        )
-    )
-    total_result = await session.execute(
-        select(func.count()).select_from(total_subq.subquery())
-    )
-    total_users = total_result.scalar() or 0
-
-    if total_users == 0:
-        return 0, 0, 0.0
-
-    # Get all account_ids in the range
-    accounts_result = await session.execute(total_subq)
-    account_ids = [r[0] for r in accounts_result.all()]
-
-    retained = 0
-    for account_id in account_ids:
-        in_all = True
-        for (b_start, b_end) in buckets:
-            b_start_dt = _date_to_datetime_start(b_start)
-            b_end_dt = _date_to_datetime_end(b_end)
-            r = await session.execute(
-                select(EventLog.account_id).where(
-                    EventLog.account_id == account_id,
-                    EventLog.event_type == SERVICE_VISIT,
-                    EventLog.occurred_at >= b_start_dt,
-                    EventLog.occurred_at <= b_end_dt,
-                ).limit(1)
+    async with partitions.sources(session, range_start, range_end) as (events, _):
+        # All users with >=1 SERVICE_VISIT in the full 4-week range
+        total_subq = (
+            select(distinct(events.c.account_id))
+            .where(
+                events.c.event_type == SERVICE_VISIT,
+                events.c.occurred_at >= start_dt,
+                events.c.occurred_at <= end_dt,
             )
-            if r.scalar() is None:
-                in_all = False
-                break
-        if in_all:
-            retained += 1
+        )
+        total_result = await session.execute(
+            select(func.count()).select_from(total_subq.subquery())
+        )
+        total_users = total_result.scalar() or 0
+
+        if total_users == 0:
+            return 0, 0, 0.0
+
+        # Get all account_ids in the range
+        accounts_result = await session.execute(total_subq)
+        account_ids = [r[0] for r in accounts_result.all()]
+
+        retained = 0
+        for account_id in account_ids:
+            in_all = True
+            for (b_start, b_end) in buckets:
+                b_start_dt = _date_to_datetime_start(b_start)
+                b_end_dt = _date_to_datetime_end(b_end)
+                r = await session.execute(
+                    select(events.c.account_id).where(
+                        events.c.account_id == account_id,
+                        events.c.event_type == SERVICE_VISIT,
+                        events.c.occurred_at >= b_start_dt,
+                        events.c.occurred_at <= b_end_dt,
+                    ).limit(1)
+                )
+                if r.scalar() is None:
+                    in_all = False
+                    break
+            if in_all:
+                retained += 1
 
     rate = (retained / total_users) if total_users else 0.0
     return retained, total_users, rate
@@ -169,29 +422,280 @@ async def save_retention_snapshot(
     numerator: int,
     denominator: int,
     rate: float,
+    created_at: datetime | None = None,
 ) -> AggregationSnapshot:
-    snap = AggregationSnapshot(
-        id=str(uuid.uuid4()),
-        metric_type=RETENTION_4W,
-        period_from=None,
-        period_to=None,
-        anchor_date=anchor_date,
-        numerator=numerator,
-        denominator=denominator,
-        rate=rate,
-        created_at=datetime.utcnow(),
+    return await snapshots.save_snapshot(
+        session, RETENTION_4W, None, None, anchor_date, numerator, denominator, rate,
+        created_at=created_at,
     )
-    session.add(snap)
-    await session.flush()
+
+
+async def _cached_snapshot(
+    session: AsyncSession,
+    key: tuple,
+    window: tuple[date, date],
+    generation: int,
+) -> AggregationSnapshot | None:
+    """Look the result up in memory and, for closed windows, in the stored
+    current snapshot of the key when it was computed after the window closed.
+    `generation` is result_cache.generation from before any read."""
+    snap = result_cache.get(key)
+    if snap is None and window[1] <= rollup.last_closed_day():
+        valid_from = _date_to_datetime_start(window[1]) + timedelta(
+            days=1, seconds=rollup.ROLLUP_CLOSE_DELAY_S
+        )
+        late = result_cache.late_write_since(window)
+        if late is not None and late > valid_from:
+            valid_from = late
+        snap = await snapshots.current_snapshot(session, snapshots.snapshot_key(*key))
+        if snap is not None and snap.created_at < valid_from:
+            snap = None
+        if snap is not None:
+            result_cache.put(key, snap, window, closed=True, generation=generation)
+    result_cache.record(snap is not None)
     return snap
 
 
+def _remember(key: tuple, snap: AggregationSnapshot, window: tuple[date, date], generation: int) -> None:
+    """Cache a computed result unless a day of its window was invalidated
+    after `generation`: the computation may have read the data from before."""
+    result_cache.put(
+        key, snap, window, closed=window[1] <= rollup.last_closed_day(), generation=generation
+    )
+
+
+async def _compute_retention_4w_bitmap(
+    session: AsyncSession,
+    anchor_date: date,
+    writer: AsyncSession | None = None,
+) -> tuple[int, int, float]:
+    return await compute_retention_bitmap(session, _four_weekly_buckets(anchor_date), writer)
+
+
+async def _compute_retention_4w_columnar(
+    session: AsyncSession,
+    anchor_date: date,
+    writer: AsyncSession | None = None,
+) -> tuple[int, int, float]:
+    return await compute_retention_columnar(session, _four_weekly_buckets(anchor_date), writer)
+
+
+async def _refresh_rollups(session: AsyncSession, read_session: AsyncSession) -> None:
+    """Roll up newly closed days before computing. Runs as its own short write
+    transaction so the writer connection is not held during the computation."""
+    hwm = await rollup.get_high_water_mark(read_session)
+    if hwm is None or hwm < rollup.last_closed_day():
+        await rollup.catch_up(session)
+        await session.commit()
+
+
+async def _compute(
+    session: AsyncSession,
+    read_session: AsyncSession,
+    engine: str,
+    approx: bool,
+    fn,
+    *args,
+):
+    """fn(session, *args) for the engine. Exact SQL only reads, so it goes to
+    the analytics process pool (see aggregation.offload). The sketch, bitmap
+    and columnar engines read on `read_session` and persist new
+    sketches/ordinals on `session`, committing each batch right away so the
+    writer is not held for the whole computation."""
+    if approx or engine in (ENGINE_BITMAP, ENGINE_COLUMNAR):
+        return await fn(read_session, *args, writer=session)
+    if engine != ENGINE_SQL:
+        raise ValueError(f"unknown engine {engine}")
+    return await analytics_pool.run(fn, read_session, *args)
+
+
+_PARTICIPATION_ENGINES = {
+    ENGINE_SQL: compute_participation,
+    ENGINE_BITMAP: compute_participation_bitmap,
+    ENGINE_COLUMNAR: compute_participation_columnar,
+}
+_RETENTION_4W_ENGINES = {
+    ENGINE_SQL: compute_retention_4w,
+    ENGINE_BITMAP: _compute_retention_4w_bitmap,
+    ENGINE_COLUMNAR: _compute_retention_4w_columnar,
+}
+
+
+async def participation_snapshot(
+    session: AsyncSession,
+    period_from: date,
+    period_to: date,
+    approx: bool = False,
+    engine: str = ENGINE_SQL,
+    read_session: AsyncSession | None = None,
+    record_hit: bool | None = None,
+) -> AggregationSnapshot:
+    """Participation for the period, served from the result cache when possible.
+    A miss computes and records a new snapshot; a hit records one only when
+    `record_hit` (default ANALYTICS_SNAPSHOT_ON_HIT) is set. `approx` uses the
+    HyperLogLog sketches and is recorded under its own metric type; otherwise
+    `engine` picks the exact engine used on a miss. Reads go to `read_session`
+    when given; `session` is only used for writes."""
+    read_session = read_session or session
+    metric_type = PARTICIPATION_APPROX if approx else PARTICIPATION
+    compute = compute_participation_approx if approx else _PARTICIPATION_ENGINES[engine]
+    key = (metric_type, period_from, period_to, None)
+    window = (period_from, period_to)
+    generation, started_at = result_cache.generation, datetime.utcnow()
+    snap = await _cached_snapshot(read_session, key, window, generation)
+    if snap is None:
+        await _refresh_rollups(session, read_session)
+        finished_users, target_users, rate = await _compute(
+            session, read_session, engine, approx, compute, period_from, period_to
+        )
+        snap = await save_participation_snapshot(
+            session, period_from, period_to, finished_users, target_users, rate, metric_type, started_at
+        )
+        _remember(key, snap, window, generation)
+    elif ANALYTICS_SNAPSHOT_ON_HIT if record_hit is None else record_hit:
+        snap = await save_participation_snapshot(
+            session, period_from, period_to, snap.numerator, snap.denominator, snap.rate, metric_type
+        )
+    return snap
+
+
+async def retention_4w_snapshot(
+    session: AsyncSession,
+    anchor_date: date,
+    engine: str = ENGINE_SQL,
+    read_session: AsyncSession | None = None,
+    record_hit: bool | None = None,
+) -> AggregationSnapshot:
+    """4-week retention, served from the result cache when possible."""
+    read_session = read_session or session
+    key = (RETENTION_4W, None, None, anchor_date)
+    window = (_four_weekly_buckets(anchor_date)[0][0], anchor_date)
+    generation, started_at = result_cache.generation, datetime.utcnow()
+    snap = await _cached_snapshot(read_session, key, window, generation)
+    if snap is None:
+        await _refresh_rollups(session, read_session)
+        retained_users, total_users, rate = await _compute(
+            session, read_session, engine, False, _RETENTION_4W_ENGINES[engine], anchor_date
+        )
+        snap = await save_retention_snapshot(
+            session, anchor_date, retained_users, total_users, rate, started_at
+        )
+        _remember(key, snap, window, generation)
+    elif ANALYTICS_SNAPSHOT_ON_HIT if record_hit is None else record_hit:
+        snap = await save_retention_snapshot(
+            session, anchor_date, snap.numerator, snap.denominator, snap.rate
+        )
+    return snap
+
+
+async def retention_report(
+    session: AsyncSession,
+    anchor_date: date,
+    periods: int = 4,
+    granularity: str = GRANULARITY_WEEK,
+    cohorts: bool = False,
+    engine: str = ENGINE_SQL,
+    read_session: AsyncSession | None = None,
+) -> dict:
+    """Retention over `periods` buckets of `granularity` ending at anchor_date.
+
+    Four weekly buckets is the /retention/4w question and goes through
+    retention_4w_snapshot (cached and snapshotted); other shapes are computed
+    per call. With `cohorts` the triangle from compute_retention_cohorts is
+    included and the totals are taken from the same pass; only the SQL engine
+    computes it, so `cohorts` with another engine raises ValueError.
+    """
+    if cohorts and engine != ENGINE_SQL:
+        raise ValueError(f"cohorts are only computed by the {ENGINE_SQL} engine, not {engine}")
+    read_session = read_session or session
+    buckets = retention_buckets(anchor_date, periods, granularity)
+    report = {"buckets": buckets, "snapshotId": None, "cohorts": None}
+    if not cohorts and periods == 4 and granularity == GRANULARITY_WEEK:
+        snap = await retention_4w_snapshot(session, anchor_date, engine, read_session=read_session)
+        retained, total, rate = snap.numerator, snap.denominator, snap.rate
+        report["snapshotId"] = snap.id
+    else:
+        await _refresh_rollups(session, read_session)
+        if cohorts:
+            rows = await analytics_pool.run(compute_retention_cohorts, read_session, buckets)
+            retained = sum(r["retained"] for r in rows)
+            total = sum(r["size"] for r in rows)
+            rate = (retained / total) if total else 0.0
+            report["cohorts"] = rows
+        elif engine == ENGINE_BITMAP:
+            retained, total, rate = await compute_retention_bitmap(read_session, buckets, writer=session)
+        elif engine == ENGINE_COLUMNAR:
+            retained, total, rate = await compute_retention_columnar(read_session, buckets, writer=session)
+        else:
+            retained, total, rate = await analytics_pool.run(compute_retention, read_session, buckets, granularity)
+    report.update(retained=retained, total=total, rate=rate)
+    return report
+
+
+def _snapshots_query(*entities, metric_type: str | None = None, cursor: str | None = None, limit: int | None = None):
+    q = select(*entities).order_by(
+        AggregationSnapshot.created_at.desc(), AggregationSnapshot.id.desc()
+    )
+    if metric_type:
+        q = q.where(AggregationSnapshot.metric_type == metric_type)
+    if cursor is not None:
+        q = q.where(after_cursor_desc(AggregationSnapshot.created_at, AggregationSnapshot.id, cursor))
+    if limit is not None:
+        q = q.limit(limit)
+    return q
+
+
 async def list_snapshots(
     session: AsyncSession,
     metric_type: str | None = None,
+    limit: int | None = None,
+    cursor: str | None = None,
 ) -> list[AggregationSnapshot]:
-    q = select(AggregationSnapshot).order_by(AggregationSnapshot.created_at.desc())
-    if metric_type:
-        q = q.where(AggregationSnapshot.metric_type == metric_type)
-    result = await session.execute(q)
+    result = await session.execute(
+        _snapshots_query(AggregationSnapshot, metric_type=metric_type, cursor=cursor, limit=limit)
+    )
     return list(result.scalars().all())
+
+
+SNAPSHOT_COLUMNS = (
+    AggregationSnapshot.id,
+    AggregationSnapshot.metric_type,
+    AggregationSnapshot.period_from,
+    AggregationSnapshot.period_to,
+    AggregationSnapshot.anchor_date,
+    AggregationSnapshot.numerator,
+    AggregationSnapshot.denominator,
+    AggregationSnapshot.rate,
+    AggregationSnapshot.created_at,
+)
+
+
+async def list_snapshot_rows(
+    session: AsyncSession,
+    metric_type: str | None = None,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> list[Row]:
+    """Like list_snapshots but returns SNAPSHOT_COLUMNS tuples, no ORM entities."""
+    result = await session.execute(
+        _snapshots_query(*SNAPSHOT_COLUMNS, metric_type=metric_type, cursor=cursor, limit=limit)
+    )
+    return list(result.all())
+
+
+async def stream_snapshots(
+    session: AsyncSession,
+    metric_type: str | None = None,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> AsyncIterator[Row]:
+    """SNAPSHOT_COLUMNS tuples from a server-side cursor, no ORM entities."""
+    result = await session.stream(
+        _snapshots_query(*SNAPSHOT_COLUMNS, metric_type=metric_type, cursor=cursor, limit=limit)
+    )
+    async for row in result:
+        yield row
+
+
+def snapshot_cursor(snap) -> str:
+    return encode_cursor(snap.created_at, snap.id)
@@ -0,0 +1,62 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from typing import TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one execution.
+
+    The first caller for a key starts `fn()` as a task; callers arriving while
+    it runs await the same task and get its result (or exception). Each caller
+    waits through asyncio.shield, so a caller that disconnects or is cancelled
+    does not cancel the computation for the others; with `cancel_abandoned`
+    the flight itself is cancelled once its last caller is. The flight is
+    forgotten as soon as it finishes, so later calls start a fresh one.
+    """
+
+    def __init__(self):
+        self._flights: dict[Hashable, asyncio.Task] = {}
+        self._waiters: dict[asyncio.Task, int] = {}
+        self.flights = 0
+        self.deduplicated = 0
+        self.abandoned = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]], cancel_abandoned: bool = False) -> T:
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._flights[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+            self.flights += 1
+        else:
+            self.deduplicated += 1
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if cancel_abandoned and not task.done():
+                    task.cancel()
+                    self.abandoned += 1
+
+    def _finished(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        # Mark the exception as retrieved in case every waiter went away.
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "inFlight": len(self._flights),
+            "flights": self.flights,
+            "deduplicated": self.deduplicated,
+            "abandoned": self.abandoned,
+        }
+
+
+analytics_flights = SingleFlight()
@@ -0,0 +1,198 @@
+"""Storage policy of `aggregation_snapshots`.
+
+Each metric and parameter set (metric_type, period_from, period_to,
+anchor_date) has one current row, found by its unique `snapshot_key`. By
+default a new result updates that row in place (an upsert that keeps its
+id). With ANALYTICS_SNAPSHOT_HISTORY=1 a new row is inserted instead, and
+the previous one is demoted to history by clearing its key.
+
+History rows are pruned by `apply_retention`, which the snapshot scheduler
+runs after each pass. It keeps, per key, the ANALYTICS_SNAPSHOT_KEEP_LATEST
+newest rows, plus the last row of each day for ANALYTICS_SNAPSHOT_KEEP_DAYS
+days. `compact` first gives the rows written before snapshot_key existed a
+key (the newest row of each group becomes current), then applies the
+retention and, on SQLite, VACUUMs:
+
+    python -m aggregation.snapshots compact
+    python -m aggregation.snapshots stats
+"""
+import asyncio
+import os
+import sys
+import uuid
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, update, delete, func, or_
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+import dialect
+from database import IS_SQLITE
+from models.aggregation_snapshot import AggregationSnapshot
+
+ANALYTICS_SNAPSHOT_HISTORY = os.environ.get("ANALYTICS_SNAPSHOT_HISTORY", "0") == "1"
+ANALYTICS_SNAPSHOT_KEEP_LATEST = int(os.environ.get("ANALYTICS_SNAPSHOT_KEEP_LATEST", "5"))
+ANALYTICS_SNAPSHOT_KEEP_DAYS = int(os.environ.get("ANALYTICS_SNAPSHOT_KEEP_DAYS", "30"))
+
+_GROUP = (
+    AggregationSnapshot.metric_type,
+    AggregationSnapshot.period_from,
+    AggregationSnapshot.period_to,
+    AggregationSnapshot.anchor_date,
+)
+_NEWEST_FIRST = (AggregationSnapshot.created_at.desc(), AggregationSnapshot.id.desc())
+
+
+def snapshot_key(
+    metric_type: str,
+    period_from: date | None,
+    period_to: date | None,
+    anchor_date: date | None,
+) -> str:
+    return "|".join([metric_type] + [d.isoformat() if d else "" for d in (period_from, period_to, anchor_date)])
+
+
+async def current_snapshot(session: AsyncSession, key: str) -> AggregationSnapshot | None:
+    result = await session.execute(select(AggregationSnapshot).where(AggregationSnapshot.snapshot_key == key))
+    return result.scalar_one_or_none()
+
+
+async def save_snapshot(
+    session: AsyncSession,
+    metric_type: str,
+    period_from: date | None,
+    period_to: date | None,
+    anchor_date: date | None,
+    numerator: int,
+    denominator: int,
+    rate: float,
+    history: bool | None = None,
+    created_at: datetime | None = None,
+) -> AggregationSnapshot:
+    """Store a result as the current row of its key; `history` (default
+    ANALYTICS_SNAPSHOT_HISTORY) keeps the previous row as history.
+    `created_at` (default now) is when the data was read; a stored snapshot
+    is only reused when no late write to its window happened after it."""
+    key = snapshot_key(metric_type, period_from, period_to, anchor_date)
+    values = {
+        "id": str(uuid.uuid4()),
+        "metric_type": metric_type,
+        "period_from": period_from,
+        "period_to": period_to,
+        "anchor_date": anchor_date,
+        "numerator": numerator,
+        "denominator": denominator,
+        "rate": rate,
+        "created_at": created_at or datetime.utcnow(),
+        "snapshot_key": key,
+    }
+    if ANALYTICS_SNAPSHOT_HISTORY if history is None else history:
+        await session.execute(
+            update(AggregationSnapshot)
+            .where(AggregationSnapshot.snapshot_key == key)
+            .values(snapshot_key=None)
+            .execution_options(synchronize_session=False)
+        )
+        snap = AggregationSnapshot(**values)
+        session.add(snap)
+        await session.flush()
+        return snap
+    stmt = dialect.insert(AggregationSnapshot).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["snapshot_key"],
+        set_={c: getattr(stmt.excluded, c) for c in ("numerator", "denominator", "rate", "created_at")},
+    )
+    result = await session.execute(
+        stmt.returning(AggregationSnapshot), execution_options={"populate_existing": True}
+    )
+    return result.scalar_one()
+
+
+async def assign_keys(session: AsyncSession) -> int:
+    """Make the newest row of every group without a current row its current
+    row (rows written before snapshot_key existed). Returns the rows keyed."""
+    ranked = select(
+        *_GROUP,
+        AggregationSnapshot.id,
+        func.row_number().over(partition_by=_GROUP, order_by=_NEWEST_FIRST).label("rank"),
+        func.count(AggregationSnapshot.snapshot_key).over(partition_by=_GROUP).label("keyed"),
+    ).subquery()
+    result = await session.execute(
+        select(ranked.c.id, ranked.c.metric_type, ranked.c.period_from, ranked.c.period_to, ranked.c.anchor_date)
+        .where(ranked.c.rank == 1, ranked.c.keyed == 0)
+    )
+    rows = [{"id": r.id, "key": snapshot_key(*r[1:])} for r in result.all()]
+    for r in rows:
+        await session.execute(
+            update(AggregationSnapshot)
+            .where(AggregationSnapshot.id == r["id"])
+            .values(snapshot_key=r["key"])
+            .execution_options(synchronize_session=False)
+        )
+    return len(rows)
+
+
+async def apply_retention(
+    session: AsyncSession,
+    keep_latest: int = ANALYTICS_SNAPSHOT_KEEP_LATEST,
+    keep_days: int = ANALYTICS_SNAPSHOT_KEEP_DAYS,
+    now: datetime | None = None,
+) -> int:
+    """Delete history rows beyond the `keep_latest` newest of their key,
+    except each day's last row within `keep_days` days. Current rows are
+    never deleted. Returns the rows deleted."""
+    now = now or datetime.utcnow()
+    day = dialect.day_of(AggregationSnapshot.created_at)
+    ranked = select(
+        AggregationSnapshot.id,
+        AggregationSnapshot.snapshot_key,
+        day.label("day"),
+        func.row_number().over(partition_by=_GROUP, order_by=_NEWEST_FIRST).label("rank"),
+        func.row_number().over(partition_by=_GROUP + (day,), order_by=_NEWEST_FIRST).label("day_rank"),
+    ).subquery()
+    cutoff = (now - timedelta(days=keep_days)).date()
+    doomed = select(ranked.c.id).where(
+        ranked.c.snapshot_key.is_(None),
+        ranked.c.rank > keep_latest,
+        or_(ranked.c.day_rank > 1, ranked.c.day < cutoff),
+    )
+    result = await session.execute(
+        delete(AggregationSnapshot)
+        .where(AggregationSnapshot.id.in_(doomed))
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+async def stats(session: AsyncSession) -> dict:
+    result = await session.execute(
+        select(func.count(), func.count(AggregationSnapshot.snapshot_key)).select_from(AggregationSnapshot)
+    )
+    rows, current = result.one()
+    return {"rows": rows, "current": current, "history": rows - current}
+
+
+async def compact(engine: AsyncEngine, session: AsyncSession) -> dict:
+    keyed = await assign_keys(session)
+    deleted = await apply_retention(session)
+    await session.commit()
+    if IS_SQLITE:
+        async with engine.execution_options(isolation_level="AUTOCOMMIT").connect() as conn:
+            await conn.exec_driver_sql("VACUUM")
+    return {"keyed": keyed, "deleted": deleted, **await stats(session)}
+
+
+async def _main(argv: list[str]) -> None:
+    from database import engine, async_session_factory, init_db
+
+    await init_db()
+    command = argv[0] if argv else "stats"
+    async with async_session_factory() as session:
+        if command == "compact":
+            print(await compact(engine, session))
+        elif command == "stats":
+            print(await stats(session))
+        else:
+            raise SystemExit(f"unknown command: {command}")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
@@ -0,0 +1,229 @@
+"""Run the same service functions against every configured database backend.
+
+    python -m bench.backends [--accounts N] [--events N] [--repeat N]
+
+SQLite always runs, on a scratch file in the temp directory. PostgreSQL runs
+when BENCH_POSTGRES_URL is set, e.g.
+postgresql+asyncpg://postgres@localhost/oh_bench (its tables are dropped and
+recreated). The backend is fixed by DATABASE_URL at import time, so each one
+runs in its own interpreter. Prints throughput per operation and exits
+non-zero when the backends disagree on an analytics result.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEED_DAYS = 56
+SEED_CHUNK = 1000
+
+
+def _seed_rows(accounts: int, events: int, seed: int) -> tuple[list, list]:
+    """Deterministic visits and finished attempts over the SEED_DAYS closed days
+    before today."""
+    rng = random.Random(seed)
+    first_day = date.today() - timedelta(days=SEED_DAYS)
+    ids = [f"bench-{i:07d}" for i in range(accounts)]
+
+    def moment() -> datetime:
+        d = first_day + timedelta(days=rng.randrange(SEED_DAYS))
+        return datetime(d.year, d.month, d.day) + timedelta(seconds=rng.randrange(86400))
+
+    visits = [(rng.choice(ids), moment()) for _ in range(events)]
+    attempts = []
+    for _ in range(events // 4):
+        finished_at = moment()
+        attempts.append({
+            "account_id": rng.choice(ids),
+            "quiz_id": f"quiz-{rng.randrange(50)}",
+            "difficulty_level": rng.choice(("LOW", "MID", "HIGH")),
+            "status": "FINISH",
+            "score": rng.randrange(101),
+            "started_at": finished_at - timedelta(minutes=5),
+            "finished_at": finished_at,
+        })
+    return visits, attempts
+
+
+async def _timed(label: str, timings: dict, count: int, coro_fn):
+    start = time.perf_counter()
+    result = await coro_fn()
+    elapsed = time.perf_counter() - start
+    timings[label] = {"count": count, "seconds": elapsed, "perSecond": count / elapsed if elapsed else None}
+    return result
+
+
+async def _run_worker(accounts: int, events: int, repeat: int, seed: int) -> dict:
+    from sqlalchemy import func, select
+    from database import BACKEND, engine, async_session_factory, init_db
+    from models.base import Base
+    from engagement.service import insert_visits, record_visit
+    from quiz.service import insert_attempts, start_attempt, complete_attempt
+    from models.aggregation_snapshot import AggregationSnapshot
+    from aggregation import rollup, service
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await init_db()
+
+    visits, attempts = _seed_rows(accounts, events, seed)
+    timings: dict = {}
+    results: dict = {}
+
+    async def load(rows, write):
+        for i in range(0, len(rows), SEED_CHUNK):
+            async with async_session_factory() as session:
+                await write(session, rows[i:i + SEED_CHUNK])
+                await session.commit()
+
+    await _timed("insert_visits", timings, len(visits), lambda: load(visits, insert_visits))
+    await _timed("insert_attempts", timings, len(attempts), lambda: load(attempts, insert_attempts))
+
+    singles = max(1, min(500, events // 100))
+
+    async def visit_loop():
+        for i in range(singles):
+            async with async_session_factory() as session:
+                await record_visit(session, f"bench-{i % accounts:07d}")
+                await session.commit()
+
+    async def quiz_loop():
+        for i in range(singles):
+            user_id = f"bench-{i % accounts:07d}"
+            async with async_session_factory() as session:
+                attempt = await start_attempt(session, user_id, "quiz-bench", "MID")
+                await session.commit()
+            async with async_session_factory() as session:
+                await complete_attempt(session, user_id, attempt.id, 80)
+                await session.commit()
+
+    await _timed("record_visit", timings, singles, visit_loop)
+    await _timed("start+complete_attempt", timings, singles, quiz_loop)
+
+    async with async_session_factory() as session:
+        await _timed("rollup.catch_up", timings, 1, lambda: rollup.catch_up(session))
+        await session.commit()
+
+    # Closed days only, so the results do not depend on the timed writes above.
+    anchor = date.today() - timedelta(days=2)
+    period = (anchor - timedelta(days=27), anchor)
+    months = service.retention_buckets(anchor, 2, service.GRANULARITY_MONTH)
+    analytics = {
+        "compute_participation": lambda s: service.compute_participation(s, *period),
+        "compute_participation (raw)": lambda s: service._compute_participation_raw(s, *period),
+        "compute_retention_4w": lambda s: service.compute_retention_4w(s, anchor),
+        "compute_retention_4w (raw)": lambda s: service._compute_retention_4w_raw(s, anchor),
+        "compute_retention (month)": lambda s: service.compute_retention(s, months, service.GRANULARITY_MONTH),
+        "compute_retention_cohorts": lambda s: service.compute_retention_cohorts(s, months),
+    }
+    async with async_session_factory() as session:
+        for label, fn in analytics.items():
+            async def loop():
+                for _ in range(repeat):
+                    value = await fn(session)
+                return value
+
+            results[label] = list(await _timed(label, timings, repeat, loop))
+
+    # Every save of the same key updates its one row in place.
+    async def save(numerator: int):
+        async with async_session_factory() as session:
+            snap = await service.save_participation_snapshot(session, *period, numerator, repeat, numerator / repeat)
+            await session.commit()
+            return snap
+
+    first_id = (await save(0)).id
+
+    async def upsert_loop():
+        for i in range(1, repeat + 1):
+            snap = await save(i)
+        return snap
+
+    snap = await _timed("save_snapshot (upsert)", timings, repeat, upsert_loop)
+    async with async_session_factory() as session:
+        rows = await session.scalar(select(func.count()).select_from(AggregationSnapshot))
+    results["save_snapshot (upsert)"] = [snap.id == first_id, rows, snap.numerator, snap.denominator, snap.rate]
+    await engine.dispose()
+    return {"backend": BACKEND, "timings": timings, "results": results}
+
+
+def _run_backend(name: str, url: str, args) -> dict | None:
+    env = dict(os.environ, DATABASE_URL=url)
+    try:
+        proc = subprocess.run(
+            [
+                sys.executable, "-m", "bench.backends", "--worker",
+                "--accounts", str(args.accounts),
+                "--events", str(args.events),
+                "--repeat", str(args.repeat),
+                "--seed", str(args.seed),
+            ],
+            cwd=REPO_ROOT,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except subprocess.CalledProcessError as e:
+        print(f"[{name}] failed:\n{e.stderr}", file=sys.stderr)
+        return None
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _report(reports: dict[str, dict]) -> bool:
+    names = list(reports)
+    labels = list(next(iter(reports.values()))["timings"])
+    width = max(len(label) for label in labels)
+    print(f"{'operation':<{width}}  " + "  ".join(f"{n + ' ops/s':>18}" for n in names))
+    for label in labels:
+        cells = [reports[n]["timings"][label]["perSecond"] for n in names]
+        print(f"{label:<{width}}  " + "  ".join(f"{c:>18,.1f}" for c in cells))
+
+    consistent = True
+    for label, value in reports[names[0]]["results"].items():
+        for other in names[1:]:
+            if reports[other]["results"][label] != value:
+                consistent = False
+                print(f"MISMATCH {label}: {names[0]}={value} {other}={reports[other]['results'][label]}")
+    return consistent
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=2000)
+    parser.add_argument("--events", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        report = asyncio.run(_run_worker(args.accounts, args.events, args.repeat, args.seed))
+        print(json.dumps(report))
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = {"sqlite": f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.sqlite')}"}
+        if os.environ.get("BENCH_POSTGRES_URL"):
+            backends["postgresql"] = os.environ["BENCH_POSTGRES_URL"]
+        else:
+            print("BENCH_POSTGRES_URL not set; running SQLite only.")
+        reports = {}
+        for name, url in backends.items():
+            report = _run_backend(name, url, args)
+            if report is not None:
+                reports[name] = report
+    if not reports:
+        return 1
+    return 0 if _report(reports) and len(reports) == len(backends) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
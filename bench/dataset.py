@@ -0,0 +1,193 @@
+"""Synthetic dataset generator.
+
+    python -m bench.dataset [--accounts N] [--weeks N] [--visits-per-week X]
+                            [--active-ratio X] [--quiz-ratio X]
+                            [--finish-ratio X] [--abandon-ratio X]
+                            [--seed N] [--reset]
+
+Writes into DATABASE_URL, which is db.sqlite by default. Point DATABASE_URL
+at a copy to keep the working database. The data covers the `weeks` full
+weeks up to yesterday. Each account is active in a week with probability
+`active-ratio` and then visits `visits-per-week` times on average. Each visit
+starts a quiz with probability `quiz-ratio`. A started quiz is finished with
+probability `finish-ratio`, abandoned with probability `abandon-ratio`, and
+otherwise left in START. The rollups are rebuilt afterwards. The same seed
+gives the same dataset.
+"""
+import argparse
+import asyncio
+import random
+import uuid
+from datetime import date, datetime, timedelta
+from sqlalchemy import delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from models.base import Base
+from models.account import Account
+from models.event_log import EventLog
+from models.quiz_attempt import QuizAttempt
+from aggregation import rollup
+
+SERVICE_VISIT = "SERVICE_VISIT"
+DIFFICULTY_LEVELS = ("LOW", "MID", "HIGH")
+INSERT_CHUNK = 20000
+
+# Shape used by events_spec(); visits per active account-week follow from it.
+_EVENTS_PER_ACCOUNT = 24
+_SPEC_WEEKS = 8
+_SPEC_ACTIVE_RATIO = 0.6
+
+
+def events_spec(events: int) -> dict:
+    """generate() keyword arguments for roughly `events` SERVICE_VISIT rows."""
+    accounts = max(50, events // _EVENTS_PER_ACCOUNT)
+    return {
+        "accounts": accounts,
+        "weeks": _SPEC_WEEKS,
+        "active_ratio": _SPEC_ACTIVE_RATIO,
+        "visits_per_week": events / (accounts * _SPEC_WEEKS * _SPEC_ACTIVE_RATIO),
+    }
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _rows(
+    accounts: int,
+    weeks: int,
+    visits_per_week: float,
+    active_ratio: float,
+    quiz_ratio: float,
+    finish_ratio: float,
+    abandon_ratio: float,
+    seed: int,
+    end: date,
+):
+    """Yield ("visit" | "attempt", row) pairs, one account-week at a time."""
+    rng = random.Random(seed)
+    first_day = end - timedelta(days=weeks * 7 - 1)
+    whole, fraction = int(visits_per_week), visits_per_week % 1
+    for a in range(accounts):
+        account_id = f"acct-{a:08d}"
+        for w in range(weeks):
+            if rng.random() >= active_ratio:
+                continue
+            visits = whole + (1 if rng.random() < fraction else 0)
+            week_start = datetime.combine(first_day + timedelta(days=w * 7), datetime.min.time())
+            for _ in range(max(visits, 1)):
+                at = week_start + timedelta(seconds=rng.randrange(7 * 86400))
+                yield "visit", {
+                    "id": _uuid(rng),
+                    "account_id": account_id,
+                    "event_type": SERVICE_VISIT,
+                    "occurred_at": at,
+                }
+                if rng.random() >= quiz_ratio:
+                    continue
+                outcome = rng.random()
+                status, score, finished_at = "START", None, None
+                if outcome < finish_ratio:
+                    status, score = "FINISH", rng.randrange(101)
+                    finished_at = at + timedelta(seconds=rng.randrange(60, 900))
+                elif outcome < finish_ratio + abandon_ratio:
+                    status = "ABANDONED"
+                yield "attempt", {
+                    "id": _uuid(rng),
+                    "account_id": account_id,
+                    "quiz_id": f"quiz-{rng.randrange(200):03d}",
+                    "difficulty_level": rng.choice(DIFFICULTY_LEVELS),
+                    "status": status,
+                    "score": score,
+                    "started_at": at,
+                    "finished_at": finished_at,
+                }
+
+
+async def reset(session: AsyncSession) -> None:
+    """Delete every row from every table."""
+    for table in reversed(Base.metadata.sorted_tables):
+        await session.execute(delete(table))
+
+
+async def generate(
+    session_factory: async_sessionmaker[AsyncSession],
+    accounts: int = 10000,
+    weeks: int = 8,
+    visits_per_week: float = 3.0,
+    active_ratio: float = 0.6,
+    quiz_ratio: float = 0.3,
+    finish_ratio: float = 0.7,
+    abandon_ratio: float = 0.2,
+    seed: int = 1,
+    end: date | None = None,
+) -> dict[str, int]:
+    """Insert the dataset and rebuild the rollups. Returns row counts."""
+    end = end or date.today() - timedelta(days=1)
+    counts = {"accounts": accounts, "visits": 0, "attempts": 0}
+    async with session_factory() as session:
+        for i in range(0, accounts, INSERT_CHUNK):
+            await session.execute(
+                insert(Account),
+                [{"id": f"acct-{a:08d}"} for a in range(i, min(i + INSERT_CHUNK, accounts))],
+            )
+        await session.commit()
+
+        batches = {"visit": [], "attempt": []}
+        models = {"visit": EventLog, "attempt": QuizAttempt}
+        rows = _rows(
+            accounts, weeks, visits_per_week, active_ratio,
+            quiz_ratio, finish_ratio, abandon_ratio, seed, end,
+        )
+        for kind, row in rows:
+            batch = batches[kind]
+            batch.append(row)
+            if len(batch) >= INSERT_CHUNK:
+                await session.execute(insert(models[kind]), batch)
+                counts[kind + "s"] += len(batch)
+                batch.clear()
+        for kind, batch in batches.items():
+            if batch:
+                await session.execute(insert(models[kind]), batch)
+                counts[kind + "s"] += len(batch)
+        await session.commit()
+
+        await rollup.rebuild(session)
+        await session.commit()
+    return counts
+
+
+async def _main(args) -> None:
+    from database import async_session_factory, init_db
+
+    await init_db()
+    if args.reset:
+        async with async_session_factory() as session:
+            await reset(session)
+            await session.commit()
+    counts = await generate(
+        async_session_factory,
+        accounts=args.accounts,
+        weeks=args.weeks,
+        visits_per_week=args.visits_per_week,
+        active_ratio=args.active_ratio,
+        quiz_ratio=args.quiz_ratio,
+        finish_ratio=args.finish_ratio,
+        abandon_ratio=args.abandon_ratio,
+        seed=args.seed,
+    )
+    print(counts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic dataset into DATABASE_URL.")
+    parser.add_argument("--accounts", type=int, default=10000)
+    parser.add_argument("--weeks", type=int, default=8)
+    parser.add_argument("--visits-per-week", type=float, default=3.0)
+    parser.add_argument("--active-ratio", type=float, default=0.6)
+    parser.add_argument("--quiz-ratio", type=float, default=0.3)
+    parser.add_argument("--finish-ratio", type=float, default=0.7)
+    parser.add_argument("--abandon-ratio", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--reset", action="store_true", help="delete all existing rows first")
+    asyncio.run(_main(parser.parse_args()))
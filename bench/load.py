@@ -0,0 +1,168 @@
+"""In-process load test: drive the FastAPI app through ASGI with concurrent
+clients and report latency percentiles and throughput per route.
+
+    python -m bench.load [--clients N] [--requests N] [--mix visit=4,quiz=2,...]
+
+Runs against DATABASE_URL (db.sqlite by default), with the app's lifespan,
+so the visit buffer and init_db behave as in production. Generate data first
+with `python -m bench.dataset`. Only the app and the database are measured;
+there is no network or server in between. Needs httpx.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - optional dependency
+    httpx = None
+
+SCENARIOS = ("visit", "quiz", "history", "participation", "retention", "health")
+DEFAULT_MIX = "visit=40,quiz=20,history=15,participation=10,retention=10,health=5"
+
+
+def percentile(samples: list[float], p: float) -> float:
+    """Nearest-rank percentile of `samples` (p in 0..100)."""
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    async def call(self, client, route: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies.setdefault(route, []).append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[route] = self.errors.get(route, 0) + 1
+        return response
+
+
+def _parse_mix(mix: str) -> dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise SystemExit(f"unknown scenario {name!r}; choose from {SCENARIOS}")
+        weights[name] = int(weight or 1)
+    return weights
+
+
+async def _scenario(name: str, client, rec: Recorder, rng: random.Random, user_ids: list[str]) -> int:
+    """Run one scenario; returns the number of requests it made."""
+    user_id = rng.choice(user_ids)
+    today = date.today()
+    if name == "visit":
+        await rec.call(client, "POST /engagement/visit", "POST", "/engagement/visit", json={"userId": user_id})
+        return 1
+    if name == "quiz":
+        r = await rec.call(
+            client, "POST /quiz/start", "POST", "/quiz/start",
+            json={"userId": user_id, "quizId": f"quiz-{rng.randrange(200):03d}", "difficultyLevel": "MID"},
+        )
+        if r.status_code != 200:
+            return 1
+        await rec.call(
+            client, "POST /quiz/complete", "POST", "/quiz/complete",
+            json={"userId": user_id, "attemptId": r.json()["attemptId"], "score": rng.randrange(101)},
+        )
+        return 2
+    if name == "history":
+        await rec.call(client, "GET /quiz/history", "GET", "/quiz/history", params={"userId": user_id, "limit": 50})
+        return 1
+    if name == "participation":
+        # A handful of distinct windows, so the result cache sees both hits and misses.
+        end = today - timedelta(days=rng.randrange(7))
+        await rec.call(
+            client, "GET /analytics/participation", "GET", "/analytics/participation",
+            params={"from": (end - timedelta(days=27)).isoformat(), "to": end.isoformat()},
+        )
+        return 1
+    if name == "retention":
+        anchor = today - timedelta(days=rng.randrange(7))
+        await rec.call(
+            client, "GET /analytics/retention/4w", "GET", "/analytics/retention/4w",
+            params={"anchorDate": anchor.isoformat()},
+        )
+        return 1
+    await rec.call(client, "GET /health", "GET", "/health")
+    return 1
+
+
+async def _user_ids(limit: int) -> list[str]:
+    from sqlalchemy import select
+    from database import read_session_factory
+    from models.account import Account
+
+    async with read_session_factory() as session:
+        result = await session.execute(select(Account.id).limit(limit))
+        ids = list(result.scalars().all())
+    return ids or [f"load-{i:05d}" for i in range(limit)]
+
+
+async def run(clients: int, requests: int, mix: dict[str, int], seed: int) -> tuple[Recorder, float]:
+    from main import app
+
+    rec = Recorder()
+    names, weights = list(mix), list(mix.values())
+    remaining = requests
+
+    async with app.router.lifespan_context(app):
+        user_ids = await _user_ids(1000)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+            async def worker(i: int) -> None:
+                nonlocal remaining
+                rng = random.Random(seed * 1000 + i)
+                while remaining > 0:
+                    remaining -= 1
+                    await _scenario(rng.choices(names, weights)[0], client, rec, rng, user_ids)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(i) for i in range(clients)))
+            elapsed = time.perf_counter() - started
+    return rec, elapsed
+
+
+def report(rec: Recorder, elapsed: float) -> None:
+    rows = sorted(rec.latencies.items())
+    width = max([len(route) for route, _ in rows] + [5])
+    print(f"{'route':<{width}} {'count':>7} {'errors':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'mean ms':>8}")
+    total = 0
+    for route, samples in rows:
+        total += len(samples)
+        print(
+            f"{route:<{width}} {len(samples):>7} {rec.errors.get(route, 0):>6} "
+            f"{len(samples) / elapsed:>8.1f} {percentile(samples, 50) * 1000:>8.2f} "
+            f"{percentile(samples, 95) * 1000:>8.2f} {percentile(samples, 99) * 1000:>8.2f} "
+            f"{statistics.fmean(samples) * 1000:>8.2f}"
+        )
+    print(f"{'total':<{width}} {total:>7} {sum(rec.errors.values()):>6} {total / elapsed:>8.1f}  in {elapsed:.2f}s")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="In-process ASGI load test.")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=2000, help="scenarios to run in total")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario weights")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    if httpx is None:
+        print("bench.load needs httpx: pip install httpx", file=sys.stderr)
+        return 1
+    rec, elapsed = asyncio.run(run(args.clients, args.requests, _parse_mix(args.mix), args.seed))
+    report(rec, elapsed)
+    return 1 if rec.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
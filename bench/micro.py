@@ -0,0 +1,166 @@
+"""Micro-benchmarks for the analytics compute functions.
+
+    python -m bench.micro [--sizes 10k,100k,1m] [--repeat N] [--save]
+                          [--threshold X]
+
+For each size a synthetic dataset of about that many visits (see
+bench.dataset.events_spec) is generated once into BENCH_DATA_DIR and reused
+after that. The rollups are caught up. compute_participation (28 days) and
+compute_retention_4w then run at least `repeat` times, next to their
+raw-table variants, and the median is reported.
+
+The medians are compared with bench/baselines.json. If a median is slower
+than its baseline by more than `threshold` (0.25 = 25%), the run exits with
+status 1. `--save` writes the current medians as the new baselines.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+
+from database import _on_read_connect, _on_write_connect
+from models.base import Base
+from aggregation import service
+from bench import dataset
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+BENCH_DATA_DIR = os.environ.get("BENCH_DATA_DIR", os.path.join(tempfile.gettempdir(), "oh-bench"))
+DATASET_SEED = 7
+# Fixed end day, so cached datasets and baselines stay comparable across days.
+DATASET_END = date(2026, 3, 1)
+
+# Keep sampling small cases until this much time was measured, so their
+# medians are not dominated by scheduler noise.
+MIN_MEASURED_S = 0.5
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+CASES = {
+    "compute_participation": lambda s, end: service.compute_participation(s, end - timedelta(days=27), end),
+    "compute_participation_raw": lambda s, end: service._compute_participation_raw(s, end - timedelta(days=27), end),
+    "compute_retention_4w": lambda s, end: service.compute_retention_4w(s, end),
+    "compute_retention_4w_raw": lambda s, end: service._compute_retention_4w_raw(s, end),
+}
+
+
+def _engine(path: str, read_only: bool):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    event.listen(engine.sync_engine, "connect", _on_read_connect if read_only else _on_write_connect)
+    return engine
+
+
+async def _prepare(size: str) -> str:
+    """Path of the dataset for `size`, generating it on first use."""
+    os.makedirs(BENCH_DATA_DIR, exist_ok=True)
+    path = os.path.join(BENCH_DATA_DIR, f"events-{size}-seed{DATASET_SEED}.sqlite")
+    if os.path.exists(path):
+        return path
+    partial = path + ".partial"
+    if os.path.exists(partial):
+        os.remove(partial)
+    engine = _engine(partial, read_only=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    started = time.perf_counter()
+    counts = await dataset.generate(
+        async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False),
+        seed=DATASET_SEED,
+        end=DATASET_END,
+        **dataset.events_spec(SIZES[size]),
+    )
+    await engine.dispose()
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(partial + suffix):
+            os.remove(partial + suffix)
+    os.replace(partial, path)
+    print(f"[{size}] generated {counts} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return path
+
+
+async def _measure(size: str, repeat: int) -> dict[str, float]:
+    path = await _prepare(size)
+    engine = _engine(path, read_only=True)
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    medians = {}
+    async with factory() as session:
+        for name, case in CASES.items():
+            await case(session, DATASET_END)  # warm the page cache
+            samples = []
+            while len(samples) < repeat or sum(samples) < MIN_MEASURED_S:
+                started = time.perf_counter()
+                await case(session, DATASET_END)
+                samples.append(time.perf_counter() - started)
+            medians[name] = statistics.median(samples)
+    await engine.dispose()
+    return medians
+
+
+def _load_baselines() -> dict:
+    if not os.path.exists(BASELINES_PATH):
+        return {}
+    with open(BASELINES_PATH) as f:
+        return json.load(f)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Analytics micro-benchmarks with baselines.")
+    parser.add_argument("--sizes", default=",".join(SIZES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=float(os.environ.get("BENCH_THRESHOLD", "0.25")))
+    parser.add_argument("--save", action="store_true", help="store the medians as the new baselines")
+    args = parser.parse_args(argv)
+
+    sizes = [s.strip().lower() for s in args.sizes.split(",") if s.strip()]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        parser.error(f"unknown sizes {unknown}; choose from {list(SIZES)}")
+
+    baselines = _load_baselines()
+    regressions = []
+    print(f"{'size':<6} {'case':<28} {'median ms':>10} {'baseline ms':>12} {'change':>8}")
+    for size in sizes:
+        medians = asyncio.run(_measure(size, args.repeat))
+        for name, seconds in medians.items():
+            base = baselines.get("results", {}).get(size, {}).get(name)
+            change = ""
+            if base:
+                ratio = seconds / base - 1
+                change = f"{ratio:+.0%}"
+                if ratio > args.threshold:
+                    regressions.append((size, name, ratio))
+                    change += " !"
+            print(
+                f"{size:<6} {name:<28} {seconds * 1000:>10.2f} "
+                f"{(base * 1000 if base else float('nan')):>12.2f} {change:>8}"
+            )
+        if args.save:
+            baselines.setdefault("results", {})[size] = {k: round(v, 6) for k, v in medians.items()}
+
+    if args.save:
+        baselines["machine"] = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+        }
+        baselines["repeat"] = args.repeat
+        with open(BASELINES_PATH, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"saved baselines to {BASELINES_PATH}")
+    elif regressions:
+        for size, name, ratio in regressions:
+            print(f"REGRESSION {size} {name}: {ratio:+.0%} (threshold {args.threshold:+.0%})")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Health-check latency while heavy analytics run, with and without the
+analytics process pool.
+
+    python -m bench.offload [--clients 4] [--seconds 10] [--workers 0,2]
+
+For each pool size in --workers (0 computes in the event loop), `--clients`
+concurrent clients repeatedly request uncached cohort retention reports
+(each client its own anchor date, so single-flight does not merge them)
+while a probe requests GET /health every --probe-ms. Reports the probe's
+latency percentiles and the analytics throughput. Runs through ASGI against
+DATABASE_URL like bench.load; generate data first with `python -m bench.dataset`.
+Needs httpx.
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from datetime import timedelta
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - optional dependency
+    httpx = None
+
+from bench.load import percentile
+
+
+async def _last_day():
+    from sqlalchemy import func, select
+    from database import read_session_factory
+    from models.event_log import EventLog
+
+    async with read_session_factory() as session:
+        last = (await session.execute(select(func.max(EventLog.occurred_at)))).scalar()
+    if last is None:
+        raise SystemExit("no events; generate data first with `python -m bench.dataset`")
+    return last.date()
+
+
+async def run(workers: int, clients: int, seconds: float, probe_ms: float, weeks: int) -> dict:
+    from main import app
+    from aggregation.offload import analytics_pool
+
+    analytics_pool.workers = workers
+    health: list[float] = []
+    analytics: list[float] = []
+    statuses: dict[int, int] = {}
+    async with app.router.lifespan_context(app):
+        last = await _last_day()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            # Pool processes start in the background; wait until they answer.
+            await client.get("/analytics/retention", params={"anchorDate": last.isoformat(), "cohort": True})
+            deadline = time.perf_counter() + seconds
+
+            async def analytics_client(i: int) -> None:
+                params = {"anchorDate": (last - timedelta(days=i)).isoformat(), "weeks": weeks, "cohort": True}
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    r = await client.get("/analytics/retention", params=params)
+                    statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+                    if r.status_code == 200:
+                        analytics.append(time.perf_counter() - started)
+
+            async def probe() -> None:
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    await client.get("/health")
+                    health.append(time.perf_counter() - started)
+                    await asyncio.sleep(probe_ms / 1000)
+
+            await asyncio.gather(probe(), *(analytics_client(i) for i in range(clients)))
+    return {"health": health, "analytics": analytics, "statuses": statuses}
+
+
+def report(workers: int, result: dict, seconds: float) -> None:
+    health, analytics = result["health"], result["analytics"]
+    print(
+        f"workers={workers:<3} health p50 {percentile(health, 50) * 1000:>8.2f} ms  "
+        f"p99 {percentile(health, 99) * 1000:>8.2f} ms  max {max(health) * 1000:>8.2f} ms  "
+        f"| analytics {len(analytics) / seconds:>6.2f}/s  "
+        f"mean {statistics.fmean(analytics) * 1000 if analytics else 0:>8.1f} ms  statuses {result['statuses']}"
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Health latency under concurrent analytics load.")
+    parser.add_argument("--clients", type=int, default=4, help="concurrent analytics clients")
+    parser.add_argument("--seconds", type=float, default=10.0, help="duration per pool size")
+    parser.add_argument("--workers", default="0,2", help="comma-separated pool sizes to compare")
+    parser.add_argument("--probe-ms", type=float, default=20.0, help="pause between health probes")
+    parser.add_argument("--weeks", type=int, default=12, help="retention buckets per report")
+    args = parser.parse_args(argv)
+    if httpx is None:
+        print("bench.offload needs httpx: pip install httpx", file=sys.stderr)
+        return 1
+    pool_sizes = [int(w) for w in args.workers.split(",")]
+
+    async def compare() -> list[dict]:
+        # One event loop for all runs: the engines' pooled connections belong to it.
+        return [await run(w, args.clients, args.seconds, args.probe_ms, args.weeks) for w in pool_sizes]
+
+    for workers, result in zip(pool_sizes, asyncio.run(compare())):
+        report(workers, result, args.seconds)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""Serialization benchmark for the list endpoints: one account's quiz history
+of `--rows` FINISH attempts, encoded the previous way and the lean way.
+
+    python -m bench.serialize [--rows 10000] [--repeat 20]
+
+- pydantic: ORM entities, strftime, one QuizHistoryItem per row, then
+  FastAPI's second validation and serialization of the response_model
+  (emulated with a TypeAdapter), then json.dumps.
+- lean: HISTORY_COLUMNS tuples, quiz.service.history_item, responses.dumps
+  (orjson when installed).
+
+Both run on the same SQLite file in BENCH_DATA_DIR and must produce the
+same JSON document. Medians are reported per case, query included.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pydantic import TypeAdapter
+from sqlalchemy import event, insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+
+import responses
+from database import _on_write_connect
+from models.base import Base
+from models.account import Account
+from models.quiz_attempt import QuizAttempt
+from quiz import service
+from quiz.schemas import QuizHistoryItem, QuizHistoryResponse
+from bench.micro import BENCH_DATA_DIR
+
+USER_ID = "bench-history"
+INSERT_CHUNK = 5000
+
+
+async def _prepare(rows: int) -> str:
+    os.makedirs(BENCH_DATA_DIR, exist_ok=True)
+    path = os.path.join(BENCH_DATA_DIR, f"history-{rows}.sqlite")
+    if os.path.exists(path):
+        return path
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    event.listen(engine.sync_engine, "connect", _on_write_connect)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(Account), [{"id": USER_ID}])
+        start = datetime(2026, 1, 1)
+        batch = []
+        for i in range(rows):
+            at = start + timedelta(minutes=7 * i, microseconds=i)
+            batch.append({
+                "id": f"attempt-{i:08d}",
+                "account_id": USER_ID,
+                "quiz_id": f"quiz-{i % 200:03d}",
+                "difficulty_level": ("LOW", "MID", "HIGH")[i % 3],
+                "status": "FINISH",
+                "score": i % 101,
+                "started_at": at,
+                "finished_at": at + timedelta(minutes=3),
+            })
+            if len(batch) == INSERT_CHUNK:
+                await conn.execute(insert(QuizAttempt), batch)
+                batch.clear()
+        if batch:
+            await conn.execute(insert(QuizAttempt), batch)
+    await engine.dispose()
+    return path
+
+
+_response_adapter = TypeAdapter(QuizHistoryResponse)
+
+
+def _strftime(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+async def pydantic_path(session: AsyncSession) -> bytes:
+    attempts = await service.get_finish_history(session, USER_ID)
+    response = QuizHistoryResponse(
+        attempts=[
+            QuizHistoryItem(
+                quizId=a.quiz_id,
+                difficultyLevel=a.difficulty_level,
+                score=a.score,
+                startedAt=_strftime(a.started_at),
+                finishedAt=_strftime(a.finished_at) if a.finished_at else "",
+            )
+            for a in attempts
+        ],
+        nextCursor=None,
+    )
+    # What FastAPI does with a returned model and a response_model.
+    validated = _response_adapter.validate_python(response, from_attributes=True)
+    content = _response_adapter.dump_python(validated, mode="json")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+async def lean_path(session: AsyncSession) -> bytes:
+    rows = await service.get_finish_history_rows(session, USER_ID)
+    return responses.dumps({"attempts": [service.history_item(r) for r in rows], "nextCursor": None})
+
+
+CASES = {"pydantic": pydantic_path, "lean": lean_path}
+
+
+async def run(rows: int, repeat: int) -> dict[str, float]:
+    path = await _prepare(rows)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    medians = {}
+    outputs = {}
+    async with factory() as session:
+        for name, case in CASES.items():
+            outputs[name] = await case(session)  # warm up
+            samples = []
+            for _ in range(repeat):
+                session.expunge_all()
+                started = time.perf_counter()
+                await case(session)
+                samples.append(time.perf_counter() - started)
+            medians[name] = statistics.median(samples)
+    await engine.dispose()
+    if json.loads(outputs["pydantic"]) != json.loads(outputs["lean"]):
+        raise SystemExit("the two paths produced different documents")
+    return medians
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="History list serialization benchmark.")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+    medians = asyncio.run(run(args.rows, args.repeat))
+    print(f"{args.rows} rows, orjson={'yes' if responses.orjson else 'no'}")
+    for name, seconds in medians.items():
+        speedup = medians["pydantic"] / seconds
+        print(f"{name:<10} {seconds * 1000:>9.2f} ms  x{speedup:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""SQL that differs between the supported backends (SQLite, PostgreSQL).
+
+Service code builds statements through these helpers instead of importing a
+dialect directly; the backend is taken from database.DATABASE_URL.
+"""
+from sqlalchemy import Date, func, case
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+from database import BACKEND
+
+POSTGRESQL = "postgresql"
+SQLITE = "sqlite"
+
+# Bucket by date_trunc('week') instead of a CASE over the bucket bounds. On
+# SQLite the date() modifiers equivalent was no faster than the CASE.
+NATIVE_WEEK_START = BACKEND == POSTGRESQL
+
+
+def insert(table):
+    """INSERT supporting on_conflict_do_nothing / on_conflict_do_update
+    (INSERT OR IGNORE / ON CONFLICT on both backends)."""
+    return pg_insert(table) if BACKEND == POSTGRESQL else sqlite_insert(table)
+
+
+class day_of(FunctionElement):
+    """UTC calendar day of a (naive UTC) DateTime column."""
+
+    type = Date()
+    name = "day_of"
+    inherit_cache = True
+
+
+@compiles(day_of)
+def _day_of(element, compiler, **kw):
+    return "CAST(%s AS DATE)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(day_of, SQLITE)
+def _day_of_sqlite(element, compiler, **kw):
+    return "date(%s)" % compiler.process(element.clauses, **kw)
+
+
+class week_start(FunctionElement):
+    """Monday of the ISO week containing a Date column (PostgreSQL only)."""
+
+    type = Date()
+    name = "week_start"
+    inherit_cache = True
+
+
+@compiles(week_start, POSTGRESQL)
+def _week_start_pg(element, compiler, **kw):
+    return "CAST(date_trunc('week', %s) AS DATE)" % compiler.process(element.clauses, **kw)
+
+
+def count_where(condition):
+    """Number of rows matching `condition`: COUNT(*) FILTER (WHERE ...) on
+    PostgreSQL, SUM(CASE ...) elsewhere (NULL over no rows; read it with `or 0`)."""
+    if BACKEND == POSTGRESQL:
+        return func.count().filter(condition)
+    return func.sum(case((condition, 1), else_=0))
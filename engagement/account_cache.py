@@ -0,0 +1,93 @@
+import os
+import sys
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+ACCOUNT_CACHE_MAX_ENTRIES = int(os.environ.get("ACCOUNT_CACHE_MAX_ENTRIES", "200000"))
+ACCOUNT_CACHE_MAX_BYTES = int(os.environ.get("ACCOUNT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Session.info key holding account IDs inserted by the current transaction.
+PENDING_ACCOUNTS_KEY = "pending_account_ids"
+
+# Rough per-entry cost of an OrderedDict slot on top of the key string itself.
+_ENTRY_OVERHEAD = 100
+
+
+class KnownAccountCache:
+    """Bounded LRU set of account IDs known to exist in `accounts`.
+
+    Account rows are never deleted, so a cached ID can only go stale by being
+    evicted. IDs are added only after the transaction that inserted (or saw)
+    them commits, so a rolled-back insert never poisons the cache.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._ids: OrderedDict[str, int] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def lookup(self, account_id: str) -> bool:
+        if account_id in self._ids:
+            self._ids.move_to_end(account_id)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def add(self, account_id: str) -> None:
+        if account_id in self._ids:
+            self._ids.move_to_end(account_id)
+            return
+        size = sys.getsizeof(account_id) + _ENTRY_OVERHEAD
+        self._ids[account_id] = size
+        self._bytes += size
+        while self._ids and (len(self._ids) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._ids.popitem(last=False)
+            self._bytes -= evicted
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._ids.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._ids),
+            "approxBytes": self._bytes,
+            "maxEntries": self.max_entries,
+            "maxBytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hitRate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+known_accounts = KnownAccountCache(ACCOUNT_CACHE_MAX_ENTRIES, ACCOUNT_CACHE_MAX_BYTES)
+
+
+def mark_pending(session, account_ids) -> None:
+    """Remember IDs written in this transaction; they enter the cache on commit.
+    Accepts a sync Session or an AsyncSession."""
+    info = session.info
+    info.setdefault(PENDING_ACCOUNTS_KEY, set()).update(account_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _promote_pending(session: Session) -> None:
+    for account_id in session.info.pop(PENDING_ACCOUNTS_KEY, ()):
+        known_accounts.add(account_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session: Session) -> None:
+    session.info.pop(PENDING_ACCOUNTS_KEY, None)
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+import dialect
+from database import async_session_factory
+from models.account import Account
+from models.event_log import EventLog
+from engagement.account_cache import known_accounts, mark_pending
+from aggregation.result_cache import mark_event_days
+from engagement.service import SERVICE_VISIT
+
+logger = logging.getLogger(__name__)
+
+VISIT_BATCH_WINDOW_MS = float(os.environ.get("VISIT_BATCH_WINDOW_MS", "20"))
+VISIT_BATCH_MAX_SIZE = int(os.environ.get("VISIT_BATCH_MAX_SIZE", "500"))
+VISIT_QUEUE_MAX_SIZE = int(os.environ.get("VISIT_QUEUE_MAX_SIZE", "50000"))
+
+ACK_QUEUED = "queued"
+ACK_DURABLE = "durable"
+
+
+class VisitBuffer:
+    """Write-behind queue for SERVICE_VISIT events.
+
+    Visits are collected for up to `window_ms` or `max_size` items, whichever
+    comes first, and written in one transaction: a multi-row INSERT OR IGNORE
+    into accounts followed by a multi-row INSERT into event_logs.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        window_ms: float = VISIT_BATCH_WINDOW_MS,
+        max_size: int = VISIT_BATCH_MAX_SIZE,
+        queue_size: int = VISIT_QUEUE_MAX_SIZE,
+    ):
+        self._session_factory = session_factory
+        self._window = window_ms / 1000
+        self._max_size = max_size
+        self._queue_size = queue_size
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything queued so far and stop the writer task."""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, user_id: str, ack: str = ACK_DURABLE) -> None:
+        """Queue a visit. With ACK_DURABLE, wait until its batch is committed."""
+        future = asyncio.get_running_loop().create_future() if ack == ACK_DURABLE else None
+        await self._queue.put((user_id, datetime.utcnow(), future))
+        if future is not None:
+            await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self._window
+            while len(batch) < self._max_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+        # Drain anything that was queued behind the stop marker.
+        rest = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                rest.append(item)
+        for i in range(0, len(rest), self._max_size):
+            await self._flush(rest[i:i + self._max_size])
+
+    async def _flush(self, batch: list[tuple[str, datetime, asyncio.Future | None]]) -> None:
+        new_ids = [
+            user_id
+            for user_id in dict.fromkeys(u for u, _, _ in batch)
+            if not known_accounts.lookup(user_id)
+        ]
+        log_rows = [
+            {
+                "id": str(uuid.uuid4()),
+                "account_id": user_id,
+                "event_type": SERVICE_VISIT,
+                "occurred_at": occurred_at,
+            }
+            for user_id, occurred_at, _ in batch
+        ]
+        try:
+            async with self._session_factory() as session:
+                if new_ids:
+                    await session.execute(
+                        dialect.insert(Account)
+                        .values([{"id": user_id} for user_id in new_ids])
+                        .on_conflict_do_nothing()
+                    )
+                    mark_pending(session, new_ids)
+                await session.execute(insert(EventLog).values(log_rows))
+                mark_event_days(session, {t.date() for _, t, _ in batch})
+                await session.commit()
+        except Exception as exc:
+            logger.exception("Failed to flush %d buffered visits", len(batch))
+            for _, _, future in batch:
+                if future is not None and not future.done():
+                    future.set_exception(exc)
+            return
+        for _, _, future in batch:
+            if future is not None and not future.done():
+                future.set_result(None)
+
+
+visit_buffer = VisitBuffer(async_session_factory)
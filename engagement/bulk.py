@@ -0,0 +1,158 @@
+import codecs
+import json
+import os
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import Any, TypeVar
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, ValidationError
+
+from engagement.schemas import BulkChunkResult, BulkIngestResponse
+
+BULK_CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", "1000"))
+# Largest single record we are willing to buffer while waiting for the rest of it.
+BULK_MAX_RECORD_BYTES = int(os.environ.get("BULK_MAX_RECORD_BYTES", "65536"))
+
+M = TypeVar("M", bound=BaseModel)
+
+_INVALID = object()
+
+
+class BulkBodyError(ValueError):
+    """The body cannot be read past some point. Chunks before it may already
+    be committed; ingest_stream records them in `committed`."""
+
+    committed: BulkIngestResponse | None = None
+
+
+def bulk_error_response(e: BulkBodyError) -> JSONResponse:
+    """400 naming the chunks committed before the error. Records after the
+    last of them were not written, so a client resumes from record
+    committed.accepted + committed.rejected instead of resending the body."""
+    committed = e.committed or BulkIngestResponse(accepted=0, rejected=0, chunks=[])
+    return JSONResponse(status_code=400, content={"detail": str(e), "committed": committed.model_dump()})
+
+
+async def iter_json_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """Yield records from a streamed NDJSON or JSON-array body.
+
+    Only the current, incomplete record is buffered. A line (NDJSON) that is not
+    valid JSON yields `_INVALID` so the caller can count it as rejected.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    json_decoder = json.JSONDecoder()
+    buf = ""
+    mode = None  # "array" | "ndjson"
+    done = False
+    eof = False
+    chunk_iter = chunks.__aiter__()
+
+    while not done:
+        if not eof:
+            try:
+                data = await chunk_iter.__anext__()
+                buf += decoder.decode(data)
+            except StopAsyncIteration:
+                buf += decoder.decode(b"", final=True)
+                eof = True
+
+        if mode is None:
+            stripped = buf.lstrip()
+            if not stripped:
+                if eof:
+                    return
+                continue
+            if stripped[0] == "[":
+                mode = "array"
+                buf = stripped[1:]
+            else:
+                mode = "ndjson"
+
+        if mode == "ndjson":
+            *lines, buf = buf.split("\n")
+            if eof:
+                lines.append(buf)
+                buf = ""
+                done = True
+            for line in lines:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    yield _INVALID
+        else:
+            pos = 0
+            while True:
+                while pos < len(buf) and buf[pos] in " \t\r\n,":
+                    pos += 1
+                if pos < len(buf) and buf[pos] == "]":
+                    done = True
+                    break
+                if pos >= len(buf):
+                    break
+                try:
+                    record, pos = json_decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise BulkBodyError("Malformed JSON array body")
+                    break
+                yield record
+            buf = buf[pos:]
+            if eof and not done:
+                raise BulkBodyError("Unterminated JSON array body")
+
+        if len(buf) > BULK_MAX_RECORD_BYTES:
+            raise BulkBodyError(f"Record exceeds {BULK_MAX_RECORD_BYTES} bytes")
+
+
+async def ingest_stream(
+    chunks: AsyncIterator[bytes],
+    item_model: type[M],
+    write_chunk: Callable[[list[M]], Awaitable[None]],
+    chunk_size: int | None = None,
+) -> BulkIngestResponse:
+    """Validate streamed records against `item_model` and hand them to
+    `write_chunk` in groups of `chunk_size`. Invalid records are rejected
+    individually; they never fail the chunk they belong to. A BulkBodyError
+    (broken framing) stops the ingest; the chunks already written are
+    attached to it as `committed`."""
+    chunk_size = chunk_size or BULK_CHUNK_SIZE
+    results: list[BulkChunkResult] = []
+    items: list[M] = []
+    rejected = 0
+
+    async def flush() -> None:
+        nonlocal items, rejected
+        if items:
+            await write_chunk(items)
+        results.append(
+            BulkChunkResult(index=len(results), accepted=len(items), rejected=rejected)
+        )
+        items = []
+        rejected = 0
+
+    try:
+        async for record in iter_json_records(chunks):
+            try:
+                if record is _INVALID:
+                    raise ValueError("invalid JSON")
+                items.append(item_model.model_validate(record))
+            except (ValidationError, ValueError):
+                rejected += 1
+            if len(items) + rejected >= chunk_size:
+                await flush()
+    except BulkBodyError as e:
+        e.committed = _summary(results)
+        raise
+    if items or rejected:
+        await flush()
+    return _summary(results)
+
+
+def _summary(results: list[BulkChunkResult]) -> BulkIngestResponse:
+    return BulkIngestResponse(
+        accepted=sum(c.accepted for c in results),
+        rejected=sum(c.rejected for c in results),
+        chunks=results,
+    )
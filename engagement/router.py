@@ -1,14 +1,52 @@
-from fastapi import APIRouter, Depends
+from typing import Literal
+from fastapi import APIRouter, Depends, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import get_db
-from engagement.schemas import VisitRequest, VisitResponse
-from engagement.service import record_visit
+from engagement.account_cache import known_accounts
+from engagement.buffer import visit_buffer, ACK_DURABLE
+from engagement.bulk import BulkBodyError, bulk_error_response, ingest_stream
+from engagement.schemas import (
+    VisitRequest,
+    VisitResponse,
+    BulkVisitItem,
+    BulkIngestResponse,
+)
+from engagement.service import record_visit, insert_visits
 
 router = APIRouter(prefix="/engagement", tags=["engagement"])
 
 
 @router.post("/visit", response_model=VisitResponse)
-async def post_visit(body: VisitRequest, db: AsyncSession = Depends(get_db)):
-    await record_visit(db, body.userId)
+async def post_visit(
+    body: VisitRequest,
+    ack: Literal["queued", "durable"] = Query(
+        ACK_DURABLE, description="Respond once the visit is queued or once it is committed"
+    ),
+    db: AsyncSession = Depends(get_db),
+):
+    if visit_buffer.running:
+        await visit_buffer.submit(body.userId, ack)
+    else:
+        await record_visit(db, body.userId)
     return VisitResponse(ok=True)
+
+
+@router.post("/visits:bulk", response_model=BulkIngestResponse)
+async def post_visits_bulk(request: Request, db: AsyncSession = Depends(get_db)):
+    """Body: NDJSON or a JSON array of {"userId", "occurredAt"} objects.
+    Malformed framing answers 400 with the chunks already committed."""
+
+    async def write_chunk(items: list[BulkVisitItem]) -> None:
+        await insert_visits(db, [(i.userId, i.occurredAt) for i in items])
+        await db.commit()
+
+    try:
+        return await ingest_stream(request.stream(), BulkVisitItem, write_chunk)
+    except BulkBodyError as e:
+        return bulk_error_response(e)
+
+
+@router.get("/account-cache")
+async def get_account_cache_stats():
+    return known_accounts.stats()
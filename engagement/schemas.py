@@ -1,4 +1,5 @@
-from pydantic import BaseModel, Field
+from datetime import datetime, timezone
+from pydantic import BaseModel, Field, field_validator
 
 
 class VisitRequest(BaseModel):
@@ -7,3 +8,32 @@ class VisitRequest(BaseModel):
 
 class VisitResponse(BaseModel):
     ok: bool = True
+
+
+def to_naive_utc(dt: datetime) -> datetime:
+    """Timestamps are stored as naive UTC; convert aware values accordingly."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+class BulkVisitItem(BaseModel):
+    userId: str = Field(..., min_length=1, max_length=36)
+    occurredAt: datetime
+
+    @field_validator("occurredAt")
+    @classmethod
+    def _utc(cls, v: datetime) -> datetime:
+        return to_naive_utc(v)
+
+
+class BulkChunkResult(BaseModel):
+    index: int
+    accepted: int
+    rejected: int
+
+
+class BulkIngestResponse(BaseModel):
+    accepted: int
+    rejected: int
+    chunks: list[BulkChunkResult]
@@ -1,23 +1,32 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import select
+from sqlalchemy import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
+import dialect
 from models.account import Account
 from models.event_log import EventLog
+from engagement.account_cache import known_accounts, mark_pending
+from aggregation.rollup import apply_late_visits
+from aggregation.result_cache import mark_event_days
 
 
 SERVICE_VISIT = "SERVICE_VISIT"
 
 
-async def ensure_account(session: AsyncSession, user_id: str) -> Account:
-    result = await session.execute(select(Account).where(Account.id == user_id))
-    account = result.scalar_one_or_none()
-    if account is None:
-        account = Account(id=user_id)
-        session.add(account)
-        await session.flush()
-    return account
+async def ensure_account(session: AsyncSession, user_id: str) -> None:
+    """Make sure `accounts` has a row for user_id.
+
+    Known IDs are answered from the in-process cache without a round trip.
+    Otherwise a single INSERT OR IGNORE covers both the new-account case and a
+    concurrent insert of the same ID by another worker.
+    """
+    if known_accounts.lookup(user_id):
+        return
+    await session.execute(
+        dialect.insert(Account).values(id=user_id).on_conflict_do_nothing()
+    )
+    mark_pending(session, (user_id,))
 
 
 async def record_visit(session: AsyncSession, user_id: str) -> None:
@@ -29,3 +38,37 @@ async def record_visit(session: AsyncSession, user_id: str) -> None:
         occurred_at=datetime.utcnow(),
     )
     session.add(log)
+    mark_event_days(session, (log.occurred_at.date(),))
+
+
+async def insert_accounts(session: AsyncSession, user_ids: list[str]) -> None:
+    """INSERT OR IGNORE the given account IDs in one executemany."""
+    unknown = [u for u in dict.fromkeys(user_ids) if not known_accounts.lookup(u)]
+    if unknown:
+        await session.execute(
+            dialect.insert(Account).on_conflict_do_nothing(),
+            [{"id": user_id} for user_id in unknown],
+        )
+        mark_pending(session, unknown)
+
+
+async def insert_visits(
+    session: AsyncSession,
+    visits: list[tuple[str, datetime]],
+) -> None:
+    """Bulk path: write (user_id, occurred_at) visits with executemany."""
+    await insert_accounts(session, [user_id for user_id, _ in visits])
+    await session.execute(
+        insert(EventLog),
+        [
+            {
+                "id": str(uuid.uuid4()),
+                "account_id": user_id,
+                "event_type": SERVICE_VISIT,
+                "occurred_at": occurred_at,
+            }
+            for user_id, occurred_at in visits
+        ],
+    )
+    await apply_late_visits(session, visits)
+    mark_event_days(session, {occurred_at.date() for _, occurred_at in visits})
@@ -1,7 +1,19 @@
+import os
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 
-from database import init_db
+import metrics
+from database import init_db, engine, read_engine
+from engagement.account_cache import known_accounts
+from engagement.buffer import visit_buffer
+from aggregation.result_cache import result_cache
+from aggregation.bitmap import bitmap_cache
+from aggregation.columnar import column_store
+from aggregation.scheduler import snapshot_scheduler, SCHEDULER_ENABLED
+from aggregation.singleflight import analytics_flights
+from aggregation.invalidation import invalidation_channel, INVALIDATION_ENABLED
+from aggregation.offload import analytics_pool
 from engagement.router import router as engagement_router
 from quiz.router import router as quiz_router
 from aggregation.router import router as analytics_router
@@ -10,10 +22,31 @@ from aggregation.router import router as analytics_router
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
+    if INVALIDATION_ENABLED:
+        await invalidation_channel.start()
+    await visit_buffer.start()
+    analytics_pool.start()
+    if SCHEDULER_ENABLED:
+        await snapshot_scheduler.start()
     yield
+    await snapshot_scheduler.stop()
+    analytics_pool.stop()
+    await visit_buffer.stop()
+    await invalidation_channel.stop()
 
 
 app = FastAPI(title="OH Backend", lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
+
+metrics.instrument_engine(engine, "write")
+metrics.instrument_engine(read_engine, "read")
+metrics.add_gauge_source("account_cache", known_accounts.stats)
+metrics.add_gauge_source("result_cache", result_cache.stats)
+metrics.add_gauge_source("bitmap_cache", bitmap_cache.stats)
+metrics.add_gauge_source("columnar_store", column_store.stats)
+metrics.add_gauge_source("analytics_singleflight", analytics_flights.stats)
+metrics.add_gauge_source("cache_invalidation", invalidation_channel.stats)
+metrics.add_gauge_source("analytics_pool", analytics_pool.stats)
 
 app.include_router(engagement_router)
 app.include_router(quiz_router)
@@ -28,3 +61,22 @@ def root():
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus text exposition of request, query and cache metrics."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+if __name__ == "__main__":
+    # Multi-worker run mode: WEB_CONCURRENCY workers share the database file
+    # and keep their caches in step through aggregation.invalidation.
+    import uvicorn
+
+    uvicorn.run(
+        "main:app",
+        host=os.environ.get("HOST", "127.0.0.1"),
+        port=int(os.environ.get("PORT", "8000")),
+        workers=int(os.environ.get("WEB_CONCURRENCY", "1")),
+    )
@@ -0,0 +1,230 @@
+"""Request and query instrumentation, exported in Prometheus text format.
+
+MetricsMiddleware times every HTTP request per route template. Cursor events
+on the engines time every statement and count the statements (and their time)
+per request through a context variable. Statements slower than SLOW_QUERY_MS
+are logged to the "metrics.slow_query" logger. Everything is plain counters
+in process memory. The per-statement cost is two perf_counter() calls and a
+few dict updates, so it can stay on in production; METRICS_ENABLED=0
+turns it off.
+"""
+import logging
+import os
+import time
+from bisect import bisect_left
+from collections.abc import Callable
+from contextvars import ContextVar
+from sqlalchemy import event
+
+logger = logging.getLogger("metrics.slow_query")
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "200"))
+# Longest statement text written to the slow-query log.
+SLOW_QUERY_MAX_CHARS = 2000
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Route label for requests that matched no route, so unknown paths do not
+# create new series.
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class Histogram:
+    """Cumulative-bucket histogram; `observe` is a bisect and two adds."""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+_current_request: ContextVar[RequestStats | None] = ContextVar("metrics_request", default=None)
+
+# (method, route) -> histograms; (method, route, status) -> count
+_request_seconds: dict[tuple[str, str], Histogram] = {}
+_request_queries: dict[tuple[str, str], Histogram] = {}
+_request_db_seconds: dict[tuple[str, str], Histogram] = {}
+_request_total: dict[tuple[str, str, int], int] = {}
+# (engine, verb) -> histogram
+_query_seconds: dict[tuple[str, str], Histogram] = {}
+_slow_queries: dict[str, int] = {}
+
+_gauge_sources: list[tuple[str, Callable[[], dict]]] = []
+
+
+def _histogram(store: dict, key, bounds) -> Histogram:
+    h = store.get(key)
+    if h is None:
+        h = store[key] = Histogram(bounds)
+    return h
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no BaseHTTPMiddleware, so streaming responses are
+    not buffered). The route label is the matched path template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current_request.reset(token)
+            route = scope.get("route")
+            key = (scope["method"], getattr(route, "path", UNMATCHED_ROUTE))
+            _histogram(_request_seconds, key, LATENCY_BUCKETS).observe(elapsed)
+            _histogram(_request_queries, key, QUERY_COUNT_BUCKETS).observe(stats.queries)
+            _histogram(_request_db_seconds, key, LATENCY_BUCKETS).observe(stats.db_seconds)
+            total_key = key + (status,)
+            _request_total[total_key] = _request_total.get(total_key, 0) + 1
+
+
+def _verb(statement: str) -> str:
+    return statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+
+
+def instrument_engine(engine, name: str) -> None:
+    """Time every statement run on `engine` (sync or async) under the label `name`."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if METRICS_ENABLED:
+            conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("metrics_started")
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        verb = _verb(statement)
+        _histogram(_query_seconds, (name, verb), LATENCY_BUCKETS).observe(elapsed)
+        stats = _current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            _slow_queries[name] = _slow_queries.get(name, 0) + 1
+            logger.warning(
+                "slow query %.1f ms engine=%s executemany=%s: %s",
+                elapsed * 1000,
+                name,
+                executemany,
+                statement[:SLOW_QUERY_MAX_CHARS],
+            )
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(exception_context):
+        # The statement failed, so after_cursor_execute never runs for it.
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("metrics_started"):
+            conn.info["metrics_started"].pop()
+
+
+def add_gauge_source(prefix: str, stats: Callable[[], dict]) -> None:
+    """Export the numeric values of `stats()` (e.g. a cache's stats dict) as
+    gauges named `<prefix>_<key>`."""
+    _gauge_sources.append((prefix, stats))
+
+
+def _snake(name: str) -> str:
+    return "".join("_" + c.lower() if c.isupper() else c for c in name)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+
+
+def _render_histograms(lines: list[str], name: str, help_text: str, store: dict, label_names: tuple) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for key, h in sorted(store.items()):
+        labels = _labels(**dict(zip(label_names, key)))
+        cumulative = 0
+        for bound, count in zip(h.bounds, h.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {h.count}')
+        lines.append(f"{name}_sum{{{labels}}} {h.sum}")
+        lines.append(f"{name}_count{{{labels}}} {h.count}")
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (0.0.4)."""
+    lines: list[str] = []
+    lines.append("# HELP http_requests_total HTTP requests by route and status.")
+    lines.append("# TYPE http_requests_total counter")
+    for (method, route, status), count in sorted(_request_total.items()):
+        lines.append(f"http_requests_total{{{_labels(method=method, route=route, status=status)}}} {count}")
+    _render_histograms(
+        lines, "http_request_duration_seconds", "Request latency by route.",
+        _request_seconds, ("method", "route"),
+    )
+    _render_histograms(
+        lines, "http_request_queries", "SQL statements per request.",
+        _request_queries, ("method", "route"),
+    )
+    _render_histograms(
+        lines, "http_request_db_seconds", "Time spent in SQL statements per request.",
+        _request_db_seconds, ("method", "route"),
+    )
+    _render_histograms(
+        lines, "db_query_duration_seconds", "SQL statement latency by engine and verb.",
+        _query_seconds, ("engine", "verb"),
+    )
+    lines.append("# HELP db_slow_queries_total Statements slower than SLOW_QUERY_MS.")
+    lines.append("# TYPE db_slow_queries_total counter")
+    for name, count in sorted(_slow_queries.items()):
+        lines.append(f"db_slow_queries_total{{{_labels(engine=name)}}} {count}")
+
+    for prefix, stats in _gauge_sources:
+        for key, value in stats().items():
+            if isinstance(value, (int, float)):
+                metric = f"{prefix}_{_snake(key)}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {float(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def reset() -> None:
+    for store in (_request_seconds, _request_queries, _request_db_seconds, _request_total, _query_seconds, _slow_queries):
+        store.clear()
@@ -0,0 +1,13 @@
+from sqlalchemy import String, Integer, ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+
+from models.base import Base
+
+
+class AccountOrdinal(Base):
+    """Dense integer ordinal per account, used as its bit position in cohort bitmaps."""
+
+    __tablename__ = "account_ordinals"
+
+    ordinal: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    account_id: Mapped[str] = mapped_column(String(36), ForeignKey("accounts.id"), unique=True, nullable=False)
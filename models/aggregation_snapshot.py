@@ -1,6 +1,6 @@
 from datetime import date, datetime
 from typing import Optional
-from sqlalchemy import String, Integer, Float, Date, DateTime
+from sqlalchemy import String, Integer, Float, Date, DateTime, Index
 from sqlalchemy.orm import Mapped, mapped_column
 
 from models.base import Base
@@ -8,9 +8,16 @@ from models.base import Base
 
 class AggregationSnapshot(Base):
     __tablename__ = "aggregation_snapshots"
+    __table_args__ = (
+        # One current row per metric and parameters; history rows have NULL.
+        Index("ux_aggregation_snapshots_key", "snapshot_key", unique=True),
+        # Snapshot listing, newest first, with and without a metric filter
+        Index("ix_aggregation_snapshots_metric_created", "metric_type", "created_at", "id"),
+        Index("ix_aggregation_snapshots_created", "created_at", "id"),
+    )
 
     id: Mapped[str] = mapped_column(String(36), primary_key=True)
-    metric_type: Mapped[str] = mapped_column(String(32), nullable=False)  # PARTICIPATION | RETENTION_4W
+    metric_type: Mapped[str] = mapped_column(String(32), nullable=False)  # PARTICIPATION | PARTICIPATION_APPROX | RETENTION_4W
     period_from: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
     period_to: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
     anchor_date: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
@@ -18,3 +25,5 @@ class AggregationSnapshot(Base):
     denominator: Mapped[int] = mapped_column(Integer, nullable=False)
     rate: Mapped[float] = mapped_column(Float, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    # metric_type|period_from|period_to|anchor_date (see aggregation.snapshots)
+    snapshot_key: Mapped[Optional[str]] = mapped_column(String(96), nullable=True)
@@ -0,0 +1,21 @@
+from datetime import date, datetime
+from sqlalchemy import String, Integer, Date, DateTime
+from sqlalchemy.orm import Mapped, mapped_column
+
+from models.base import Base
+
+
+class ArchivedPartition(Base):
+    """One closed month of event_logs/quiz_attempts moved to an archive file."""
+
+    __tablename__ = "archived_partitions"
+
+    month: Mapped[date] = mapped_column(Date, primary_key=True)  # first day of the month
+    # Latest day with rows in the file: the month's last day, or later when
+    # attempts started in the month finished after it.
+    last_day: Mapped[date] = mapped_column(Date, nullable=False)
+    file_name: Mapped[str] = mapped_column(String(255), nullable=False)  # inside ARCHIVE_DIR
+    event_rows: Mapped[int] = mapped_column(Integer, nullable=False)
+    attempt_rows: Mapped[int] = mapped_column(Integer, nullable=False)
+    size_bytes: Mapped[int] = mapped_column(Integer, nullable=False)
+    archived_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
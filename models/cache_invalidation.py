@@ -0,0 +1,17 @@
+from datetime import date, datetime
+from sqlalchemy import String, Integer, Date, DateTime
+from sqlalchemy.orm import Mapped, mapped_column
+
+from models.base import Base
+
+
+class CacheInvalidation(Base):
+    """A UTC day that received events, published for the other processes
+    sharing the database (see aggregation.invalidation)."""
+
+    __tablename__ = "cache_invalidations"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    day: Mapped[date] = mapped_column(Date, nullable=False)
+    origin: Mapped[str] = mapped_column(String(32), nullable=False)  # publishing process
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
@@ -0,0 +1,32 @@
+from datetime import date
+from typing import Optional
+from sqlalchemy import String, Date, ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+
+from models.base import Base
+
+
+class DailyVisitor(Base):
+    """One row per (day, account) with at least one SERVICE_VISIT that day."""
+
+    __tablename__ = "daily_visitors"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    account_id: Mapped[str] = mapped_column(String(36), ForeignKey("accounts.id"), primary_key=True)
+
+
+class DailyFinisher(Base):
+    """One row per (day, account) with at least one FINISH attempt that day."""
+
+    __tablename__ = "daily_finishers"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    account_id: Mapped[str] = mapped_column(String(36), ForeignKey("accounts.id"), primary_key=True)
+
+
+class RollupState(Base):
+    __tablename__ = "rollup_state"
+
+    name: Mapped[str] = mapped_column(String(32), primary_key=True)
+    # Last UTC day whose rollup rows are complete; later days come from raw rows.
+    high_water_mark: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
@@ -0,0 +1,18 @@
+from datetime import date
+from sqlalchemy import String, Date, LargeBinary
+from sqlalchemy.orm import Mapped, mapped_column
+
+from models.base import Base
+
+SKETCH_VISITORS = "VISITORS"
+SKETCH_FINISHERS = "FINISHERS"
+
+
+class DailySketch(Base):
+    """HyperLogLog registers of one day's distinct accounts, per kind."""
+
+    __tablename__ = "daily_sketches"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    kind: Mapped[str] = mapped_column(String(16), primary_key=True)  # VISITORS | FINISHERS
+    registers: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
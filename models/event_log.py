@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import String, DateTime, ForeignKey
+from sqlalchemy import String, DateTime, ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from models.base import Base
@@ -7,6 +7,10 @@ from models.base import Base
 
 class EventLog(Base):
     __tablename__ = "event_logs"
+    __table_args__ = (
+        # Covers the SERVICE_VISIT range scans in aggregation.service
+        Index("ix_event_logs_type_occurred_account", "event_type", "occurred_at", "account_id"),
+    )
 
     id: Mapped[str] = mapped_column(String(36), primary_key=True)
     account_id: Mapped[str] = mapped_column(String(36), ForeignKey("accounts.id"), nullable=False)
@@ -1,6 +1,6 @@
 from datetime import datetime
 from typing import Optional
-from sqlalchemy import String, Integer, DateTime, ForeignKey
+from sqlalchemy import String, Integer, DateTime, ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from models.base import Base
@@ -8,6 +8,12 @@ from models.base import Base
 
 class QuizAttempt(Base):
     __tablename__ = "quiz_attempts"
+    __table_args__ = (
+        # FINISH range scans for participation
+        Index("ix_quiz_attempts_status_finished_account", "status", "finished_at", "account_id"),
+        # Per-account history ordered by (started_at, id), the keyset order
+        Index("ix_quiz_attempts_account_status_started_id", "account_id", "status", "started_at", "id"),
+    )
 
     id: Mapped[str] = mapped_column(String(36), primary_key=True)
     account_id: Mapped[str] = mapped_column(String(36), ForeignKey("accounts.id"), nullable=False)
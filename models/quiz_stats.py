@@ -0,0 +1,23 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import String, Integer, DateTime, ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+
+from models.base import Base
+
+
+class QuizStats(Base):
+    """Running totals of one account's attempts at one difficulty level,
+    kept in step with quiz_attempts by quiz.stats."""
+
+    __tablename__ = "quiz_stats"
+
+    account_id: Mapped[str] = mapped_column(String(36), ForeignKey("accounts.id"), primary_key=True)
+    difficulty_level: Mapped[str] = mapped_column(String(8), primary_key=True)  # LOW | MID | HIGH
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)  # started, any status
+    finishes: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    abandons: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    best_score: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # Sum of FINISH scores; mean = score_sum / finishes.
+    score_sum: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_played_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
@@ -0,0 +1,30 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(ts: datetime, row_id: str) -> str:
+    raw = json.dumps([ts.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, row_id = json.loads(raw)
+        return datetime.fromisoformat(ts), str(row_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+
+def after_cursor_desc(ts_column, id_column, cursor: str):
+    """WHERE clause for the page after `cursor` in (ts DESC, id DESC) order.
+    The leading `ts <= cursor` is redundant but lets SQLite seek the
+    (..., ts, id) index instead of walking it from the newest row."""
+    ts, row_id = decode_cursor(cursor)
+    return and_(ts_column <= ts, or_(ts_column < ts, and_(ts_column == ts, id_column < row_id)))
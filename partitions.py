@@ -0,0 +1,172 @@
+"""Routing between the live event tables and archived monthly partitions.
+
+`python -m aggregation.archive` moves closed months of event_logs and
+quiz_attempts out of the main database into one read-only SQLite file per
+month under ARCHIVE_DIR, registered in `archived_partitions`. Readers that
+need those rows ATTACH just the files overlapping their date range for the
+duration of a query and read the live table UNION ALL the archived copies
+(`union_source`). SQLite attaches at most 10 databases per connection, so a
+query may span at most ARCHIVE_MAX_ATTACHED archived months at once.
+
+The rollup-backed analytics never need this: archived months are always
+fully rolled up, and raw rows are only read after the high-water mark.
+"""
+import os
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+from urllib.parse import quote
+from sqlalchemy import MetaData, Row, Table, FromClause, select, union_all
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from database import DB_PATH, IS_SQLITE, read_engine
+from models.account import Account
+from models.event_log import EventLog
+from models.quiz_attempt import QuizAttempt
+from models.archived_partition import ArchivedPartition
+
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", os.path.join(os.path.dirname(DB_PATH), "archive"))
+ARCHIVE_MAX_ATTACHED = int(os.environ.get("ARCHIVE_MAX_ATTACHED", "8"))
+
+ARCHIVED_TABLES = (EventLog.__table__, QuizAttempt.__table__)
+
+
+class TooManyPartitions(ValueError):
+    pass
+
+
+def month_of(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def month_end(month: date) -> date:
+    return next_month(month) - timedelta(days=1)
+
+
+def schema_name(month: date) -> str:
+    return f"archive_{month.year:04d}_{month.month:02d}"
+
+
+def archive_path(file_name: str) -> str:
+    return os.path.join(ARCHIVE_DIR, file_name)
+
+
+def archive_uri(file_name: str) -> str:
+    # Archive files never change once registered, so they are opened read-only
+    # and immutable (no locking or change detection).
+    return f"file:{quote(os.path.abspath(archive_path(file_name)))}?mode=ro&immutable=1"
+
+
+_archive_metadata: dict[str, MetaData] = {}
+
+
+def archived_table(table: Table, schema: str) -> Table:
+    """`table` as it appears in the attached archive database `schema`."""
+    metadata = _archive_metadata.get(schema)
+    if metadata is None:
+        metadata = _archive_metadata[schema] = MetaData()
+        # accounts only resolves the foreign keys; archive files do not hold it.
+        for t in (Account.__table__,) + ARCHIVED_TABLES:
+            t.to_metadata(metadata, schema=schema)
+    return metadata.tables[f"{schema}.{table.name}"]
+
+
+def union_source(table: Table, schemas: list[str]) -> FromClause:
+    """The live `table` UNION ALL its copies in the attached `schemas`; the
+    result has the same columns as `table`."""
+    if not schemas:
+        return table
+    parts = [select(table)] + [select(archived_table(table, s)) for s in schemas]
+    return union_all(*parts).subquery(f"{table.name}_all")
+
+
+async def archived_months(
+    session: AsyncSession,
+    period_from: date | None = None,
+    period_to: date | None = None,
+) -> list[ArchivedPartition]:
+    """Archived partitions with rows in [period_from, period_to] (by
+    occurred_at, started_at or finished_at), oldest first."""
+    if not IS_SQLITE:
+        return []
+    q = select(ArchivedPartition).order_by(ArchivedPartition.month)
+    if period_from is not None:
+        q = q.where(ArchivedPartition.last_day >= period_from)
+    if period_to is not None:
+        q = q.where(ArchivedPartition.month <= period_to)
+    result = await session.execute(q)
+    return list(result.scalars().all())
+
+
+@asynccontextmanager
+async def attached(
+    bind: AsyncSession | AsyncConnection,
+    archived: list[ArchivedPartition],
+) -> AsyncIterator[list[str]]:
+    """ATTACH the files of `archived` to the connection of `bind` for the
+    block; yields their schema names. Results must be fully fetched inside
+    the block."""
+    if len(archived) > ARCHIVE_MAX_ATTACHED:
+        raise TooManyPartitions(
+            f"range spans {len(archived)} archived months; at most {ARCHIVE_MAX_ATTACHED} can be attached"
+        )
+    conn = bind if isinstance(bind, AsyncConnection) else await bind.connection()
+    schemas = []
+    try:
+        for p in archived:
+            schema = schema_name(p.month)
+            await conn.exec_driver_sql(f"ATTACH DATABASE ? AS {schema}", (archive_uri(p.file_name),))
+            schemas.append(schema)
+        yield schemas
+    finally:
+        for schema in schemas:
+            await conn.exec_driver_sql(f"DETACH DATABASE {schema}")
+
+
+async def fetch_archived(archived: ArchivedPartition, build) -> list[Row]:
+    """Rows of the statement `build(schema)` run against one archive file on
+    a read-only connection of its own. For writers: SQLite cannot DETACH a
+    database while the attaching connection has a write transaction open."""
+    async with read_engine.connect() as conn:
+        async with attached(conn, [archived]) as (schema,):
+            result = await conn.execute(build(schema))
+            return list(result.all())
+
+
+@asynccontextmanager
+async def sources(
+    session: AsyncSession,
+    period_from: date,
+    period_to: date,
+) -> AsyncIterator[tuple[FromClause, FromClause]]:
+    """(event_logs, quiz_attempts) sources covering [period_from, period_to],
+    with only the archived months in that range attached."""
+    archived = await archived_months(session, period_from, period_to)
+    async with attached(session, archived) as schemas:
+        yield union_source(EventLog.__table__, schemas), union_source(QuizAttempt.__table__, schemas)
+
+
+def segments(
+    archived: list[ArchivedPartition],
+    period_from: date | None,
+    period_to: date,
+) -> list[tuple[date | None, date]]:
+    """Split [period_from, period_to] at the archived month boundaries, so a
+    scan over a long range can attach the files a few at a time."""
+    bounds = sorted({p.month for p in archived} | {next_month(p.month) for p in archived})
+    out = []
+    start = period_from
+    for bound in bounds:
+        if (start is None or start < bound) and bound <= period_to:
+            out.append((start, bound - timedelta(days=1)))
+            start = bound
+    out.append((start, period_to))
+    return out
+
+
+def month_start_dt(month: date) -> datetime:
+    return datetime(month.year, month.month, 1)
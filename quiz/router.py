@@ -1,7 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import get_db
+from database import get_db, get_read_db, read_session_factory
+from pagination import InvalidCursor, decode_cursor, encode_cursor
+from responses import FastJSONResponse, dumps_line
+from engagement.bulk import BulkBodyError, bulk_error_response, ingest_stream
+from engagement.schemas import BulkIngestResponse
 from quiz.schemas import (
     QuizStartRequest,
     QuizStartResponse,
@@ -9,16 +15,23 @@ from quiz.schemas import (
     QuizCompleteResponse,
     QuizAbandonRequest,
     QuizAbandonResponse,
-    QuizHistoryItem,
     QuizHistoryResponse,
+    QuizStatsItem,
+    QuizStatsResponse,
+    BulkAttemptItem,
 )
 from quiz.service import (
     start_attempt,
     complete_attempt,
     abandon_attempt,
-    get_finish_history,
+    get_finish_history_rows,
+    stream_finish_history,
+    history_item,
+    history_cursor,
     format_datetime,
+    insert_attempts,
 )
+from quiz.stats import get_stats
 
 router = APIRouter(prefix="/quiz", tags=["quiz"])
 
@@ -37,9 +50,11 @@ async def post_quiz_start(body: QuizStartRequest, db: AsyncSession = Depends(get
 
 @router.post("/complete", response_model=QuizCompleteResponse)
 async def post_quiz_complete(body: QuizCompleteRequest, db: AsyncSession = Depends(get_db)):
-    attempt = await complete_attempt(db, body.userId, body.attemptId, body.score)
-    if attempt is None:
+    attempt, error = await complete_attempt(db, body.userId, body.attemptId, body.score)
+    if attempt is None and error is None:
         raise HTTPException(status_code=404, detail="Attempt not found")
+    if error == "already_finished":
+        raise HTTPException(status_code=400, detail="Attempt already FINISH or ABANDONED")
     return QuizCompleteResponse(
         attemptId=attempt.id,
         status="FINISH",
@@ -64,17 +79,95 @@ async def post_quiz_abandon(body: QuizAbandonRequest, db: AsyncSession = Depends
     )
 
 
+HISTORY_MAX_LIMIT = 1000
+
+
 @router.get("/history", response_model=QuizHistoryResponse)
-async def get_quiz_history(userId: str, db: AsyncSession = Depends(get_db)):
-    attempts = await get_finish_history(db, userId)
-    items = [
-        QuizHistoryItem(
-            quizId=a.quiz_id,
-            difficultyLevel=a.difficulty_level,
-            score=a.score,
-            startedAt=format_datetime(a.started_at),
-            finishedAt=format_datetime(a.finished_at) if a.finished_at else "",
+async def get_quiz_history(
+    userId: str,
+    limit: int | None = Query(None, ge=1, le=HISTORY_MAX_LIMIT, description="Page size; omit for all rows"),
+    cursor: str | None = Query(None, description="nextCursor of the previous page"),
+    format: Literal["json", "ndjson"] = Query("json", description="ndjson streams one attempt per line"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    if cursor is not None:
+        try:
+            decode_cursor(cursor)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if format == "ndjson":
+        return StreamingResponse(
+            _history_ndjson(userId, limit, cursor), media_type="application/x-ndjson"
+        )
+
+    rows = await get_finish_history_rows(db, userId, limit + 1 if limit else None, cursor)
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = history_cursor(rows[-1])
+    # Returned as-is; response_model above only documents the shape.
+    return FastJSONResponse({"attempts": [history_item(r) for r in rows], "nextCursor": next_cursor})
+
+
+async def _history_ndjson(user_id: str, limit: int | None, cursor: str | None):
+    # The request-scoped session may be closed before the body is sent, so the
+    # stream owns its session.
+    async with read_session_factory() as session:
+        sent = 0
+        last = None
+        async for row in stream_finish_history(session, user_id, limit + 1 if limit else None, cursor):
+            if limit is not None and sent == limit:
+                yield dumps_line({"nextCursor": encode_cursor(last.started_at, last.id)})
+                break
+            yield dumps_line(history_item(row))
+            sent += 1
+            last = row
+
+
+@router.get("/stats", response_model=QuizStatsResponse)
+async def get_quiz_stats(userId: str, db: AsyncSession = Depends(get_read_db)):
+    """Counts, best and mean score per difficulty level, read from quiz_stats."""
+    return QuizStatsResponse(
+        userId=userId,
+        levels=[
+            QuizStatsItem(
+                difficultyLevel=s.difficulty_level,
+                attempts=s.attempts,
+                finishes=s.finishes,
+                abandons=s.abandons,
+                bestScore=s.best_score,
+                meanScore=round(s.score_sum / s.finishes, 2) if s.finishes else None,
+                lastPlayedAt=format_datetime(s.last_played_at) if s.last_played_at else None,
+            )
+            for s in await get_stats(db, userId)
+        ],
+    )
+
+
+@router.post("/attempts:bulk", response_model=BulkIngestResponse)
+async def post_attempts_bulk(request: Request, db: AsyncSession = Depends(get_db)):
+    """Body: NDJSON or a JSON array of attempts with client-side timestamps.
+    Malformed framing answers 400 with the chunks already committed."""
+
+    async def write_chunk(items: list[BulkAttemptItem]) -> None:
+        await insert_attempts(
+            db,
+            [
+                {
+                    "account_id": i.userId,
+                    "quiz_id": i.quizId,
+                    "difficulty_level": i.difficultyLevel,
+                    "status": i.status,
+                    "score": i.score,
+                    "started_at": i.startedAt,
+                    "finished_at": i.finishedAt,
+                }
+                for i in items
+            ],
         )
-        for a in attempts
-    ]
-    return QuizHistoryResponse(attempts=items)
+        await db.commit()
+
+    try:
+        return await ingest_stream(request.stream(), BulkAttemptItem, write_chunk)
+    except BulkBodyError as e:
+        return bulk_error_response(e)
@@ -1,6 +1,9 @@
-from pydantic import BaseModel, Field
+from datetime import datetime
+from pydantic import BaseModel, Field, field_validator, model_validator
 from typing import Optional
 
+from engagement.schemas import to_naive_utc
+
 
 class QuizStartRequest(BaseModel):
     userId: str
@@ -50,3 +53,46 @@ class QuizHistoryItem(BaseModel):
 
 class QuizHistoryResponse(BaseModel):
     attempts: list[QuizHistoryItem]
+    nextCursor: Optional[str] = None
+
+
+class QuizStatsItem(BaseModel):
+    difficultyLevel: str
+    attempts: int  # started, whatever their status now
+    finishes: int
+    abandons: int
+    bestScore: Optional[int] = None
+    meanScore: Optional[float] = None  # over FINISH attempts
+    lastPlayedAt: Optional[str] = None
+
+
+class QuizStatsResponse(BaseModel):
+    userId: str
+    levels: list[QuizStatsItem]  # LOW, MID, HIGH; levels never played are omitted
+
+
+class BulkAttemptItem(BaseModel):
+    userId: str = Field(..., min_length=1, max_length=36)
+    quizId: str = Field(..., min_length=1, max_length=64)
+    difficultyLevel: str = Field(..., pattern="^(LOW|MID|HIGH)$")
+    status: str = Field(..., pattern="^(START|FINISH|ABANDONED)$")
+    score: Optional[int] = Field(None, ge=0)
+    startedAt: datetime
+    finishedAt: Optional[datetime] = None
+
+    @field_validator("startedAt", "finishedAt")
+    @classmethod
+    def _utc(cls, v: Optional[datetime]) -> Optional[datetime]:
+        return to_naive_utc(v) if v is not None else None
+
+    @model_validator(mode="after")
+    def _check_status(self):
+        if self.status == "START":
+            if self.finishedAt is not None or self.score is not None:
+                raise ValueError("START attempts have no score or finishedAt")
+        else:
+            if self.finishedAt is None or self.finishedAt < self.startedAt:
+                raise ValueError("finishedAt is required and must not precede startedAt")
+            if self.status == "FINISH" and self.score is None:
+                raise ValueError("FINISH attempts require a score")
+        return self
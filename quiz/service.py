@@ -1,12 +1,18 @@
 import uuid
+from collections.abc import AsyncIterator
 from datetime import datetime
-from sqlalchemy import select
+from sqlalchemy import Row, select, insert, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from models.account import Account
 from models.quiz_attempt import QuizAttempt
 
-from engagement.service import ensure_account
+import partitions
+from quiz import stats
+from pagination import after_cursor_desc, decode_cursor, encode_cursor
+from engagement.service import ensure_account, insert_accounts
+from aggregation.rollup import apply_late_finishes
+from aggregation.result_cache import mark_event_days
 
 
 async def start_attempt(
@@ -30,67 +36,252 @@ async def start_attempt(
     )
     session.add(attempt)
     await session.flush()
+    await stats.apply(session, [stats.delta(user_id, difficulty_level, now, attempts=1)])
     return attempt
 
 
-async def complete_attempt(
+# Columns returned by a transition; what the complete/abandon responses need.
+TRANSITION_COLUMNS = (
+    QuizAttempt.id,
+    QuizAttempt.difficulty_level,
+    QuizAttempt.score,
+    QuizAttempt.started_at,
+    QuizAttempt.finished_at,
+)
+
+
+async def _transition(
     session: AsyncSession,
     user_id: str,
     attempt_id: str,
-    score: int,
-) -> QuizAttempt | None:
+    status: str,
+    **values,
+) -> tuple[Row | None, str | None]:
+    """Move a START attempt to `status` with one conditional UPDATE ...
+    RETURNING, so concurrent transitions of the same attempt cannot both
+    succeed. Returns (row, None) on success; otherwise (None, error_code)
+    where error_code is None for an unknown attempt and 'already_finished'
+    when it is no longer START (one extra SELECT tells the two apart)."""
+    now = datetime.utcnow()
     result = await session.execute(
-        select(QuizAttempt).where(
+        update(QuizAttempt)
+        .where(
             QuizAttempt.id == attempt_id,
             QuizAttempt.account_id == user_id,
+            QuizAttempt.status == "START",
         )
+        .values(status=status, finished_at=now, **values)
+        .returning(*TRANSITION_COLUMNS)
+        .execution_options(synchronize_session=False)
     )
-    attempt = result.scalar_one_or_none()
-    if attempt is None:
-        return None
-    now = datetime.utcnow()
-    attempt.status = "FINISH"
-    attempt.score = score
-    attempt.finished_at = now
-    await session.flush()
-    return attempt
+    row = result.first()
+    if row is not None:
+        return row, None
+    result = await session.execute(
+        select(QuizAttempt.status).where(
+            QuizAttempt.id == attempt_id,
+            QuizAttempt.account_id == user_id,
+        )
+    )
+    return None, ("already_finished" if result.scalar() is not None else None)
+
+
+async def complete_attempt(
+    session: AsyncSession,
+    user_id: str,
+    attempt_id: str,
+    score: int,
+) -> tuple[Row | None, str | None]:
+    """START -> FINISH. Returns (TRANSITION_COLUMNS row, error_code) as
+    _transition."""
+    attempt, error = await _transition(session, user_id, attempt_id, "FINISH", score=score)
+    if attempt is not None:
+        await stats.apply(session, [
+            stats.delta(user_id, attempt.difficulty_level, attempt.finished_at, finishes=1, score=score)
+        ])
+        mark_event_days(session, (attempt.finished_at.date(),))
+    return attempt, error
 
 
 async def abandon_attempt(
     session: AsyncSession,
     user_id: str,
     attempt_id: str,
-) -> tuple[QuizAttempt | None, str | None]:
-    """Returns (attempt, error_code). error_code is 'already_finished' or None."""
-    result = await session.execute(
-        select(QuizAttempt).where(
-            QuizAttempt.id == attempt_id,
-            QuizAttempt.account_id == user_id,
+) -> tuple[Row | None, str | None]:
+    """START -> ABANDONED. Returns (TRANSITION_COLUMNS row, error_code) as
+    _transition."""
+    attempt, error = await _transition(session, user_id, attempt_id, "ABANDONED")
+    if attempt is not None:
+        await stats.apply(session, [
+            stats.delta(user_id, attempt.difficulty_level, attempt.finished_at, abandons=1)
+        ])
+    return attempt, error
+
+
+def format_datetime(dt: datetime) -> str:
+    """yyyy-mm-dd HH:MM:SS; isoformat is a C fast path, about 3x strftime."""
+    return dt.isoformat(" ", "seconds")
+
+
+def _finish_history_query(
+    user_id: str,
+    *entities,
+    cursor: str | None = None,
+    limit: int | None = None,
+    table=None,
+):
+    t = QuizAttempt.__table__ if table is None else table
+    q = (
+        select(*entities)
+        .where(
+            t.c.account_id == user_id,
+            t.c.status == "FINISH",
         )
+        .order_by(t.c.started_at.desc(), t.c.id.desc())
     )
-    attempt = result.scalar_one_or_none()
-    if attempt is None:
-        return None, None
-    if attempt.status in ("FINISH", "ABANDONED"):
-        return None, "already_finished"
-    now = datetime.utcnow()
-    attempt.status = "ABANDONED"
-    attempt.finished_at = now
-    await session.flush()
-    return attempt, None
+    if cursor is not None:
+        q = q.where(after_cursor_desc(t.c.started_at, t.c.id, cursor))
+    if limit is not None:
+        q = q.limit(limit)
+    return q
 
 
-def format_datetime(dt: datetime) -> str:
-    return dt.strftime("%Y-%m-%d %H:%M:%S")
+async def _with_archived_history(
+    session: AsyncSession,
+    archived: list,
+    rows: list,
+    limit: int | None,
+    cursor: str | None,
+    fetch,
+) -> list:
+    """Merge the live page `rows` with FINISH attempts from the archived
+    months, newest first. `fetch(table)` runs the page query on one archived
+    table. Months entirely after the cursor, or entirely older than an
+    already full page, are not attached."""
+    cursor_ts = decode_cursor(cursor)[0] if cursor is not None else None
+    for p in reversed(archived):
+        if cursor_ts is not None and partitions.month_start_dt(p.month) > cursor_ts:
+            continue
+        if limit is not None and len(rows) >= limit:
+            rows = _newest(rows, limit)
+            if rows[-1].started_at >= partitions.month_start_dt(partitions.next_month(p.month)):
+                break
+        async with partitions.attached(session, [p]) as (schema,):
+            rows.extend(await fetch(partitions.archived_table(QuizAttempt.__table__, schema)))
+    return _newest(rows, limit)
+
 
+def _newest(rows: list, limit: int | None) -> list:
+    rows = sorted(rows, key=lambda r: (r.started_at, r.id), reverse=True)
+    return rows[:limit] if limit is not None else rows
 
-async def get_finish_history(session: AsyncSession, user_id: str) -> list[QuizAttempt]:
+
+async def get_finish_history(
+    session: AsyncSession,
+    user_id: str,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> list[QuizAttempt]:
+    """FINISH attempts, newest first, including archived months. With
+    `limit`, returns one page; continue from the last row with
+    `history_cursor`."""
     result = await session.execute(
-        select(QuizAttempt)
-        .where(
-            QuizAttempt.account_id == user_id,
-            QuizAttempt.status == "FINISH",
+        _finish_history_query(user_id, QuizAttempt, cursor=cursor, limit=limit)
+    )
+    attempts = list(result.scalars().all())
+    archived = await partitions.archived_months(session)
+    if not archived:
+        return attempts
+
+    async def fetch(table) -> list[QuizAttempt]:
+        stmt = _finish_history_query(user_id, *table.c, cursor=cursor, limit=limit, table=table)
+        result = await session.execute(select(QuizAttempt).from_statement(stmt))
+        return list(result.scalars().all())
+
+    return await _with_archived_history(session, archived, attempts, limit, cursor, fetch)
+
+
+HISTORY_COLUMNS = (
+    QuizAttempt.quiz_id,
+    QuizAttempt.difficulty_level,
+    QuizAttempt.score,
+    QuizAttempt.started_at,
+    QuizAttempt.finished_at,
+    QuizAttempt.id,
+)
+
+
+async def get_finish_history_rows(
+    session: AsyncSession,
+    user_id: str,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> list[Row]:
+    """Like get_finish_history but returns HISTORY_COLUMNS tuples instead of
+    ORM entities."""
+    result = await session.execute(
+        _finish_history_query(user_id, *HISTORY_COLUMNS, cursor=cursor, limit=limit)
+    )
+    rows = list(result.all())
+    archived = await partitions.archived_months(session)
+    if not archived:
+        return rows
+
+    async def fetch(table) -> list[Row]:
+        columns = [table.c[c.key] for c in HISTORY_COLUMNS]
+        result = await session.execute(
+            _finish_history_query(user_id, *columns, cursor=cursor, limit=limit, table=table)
         )
-        .order_by(QuizAttempt.started_at.desc())
+        return list(result.all())
+
+    return await _with_archived_history(session, archived, rows, limit, cursor, fetch)
+
+
+async def stream_finish_history(
+    session: AsyncSession,
+    user_id: str,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> AsyncIterator[Row]:
+    """Like get_finish_history_rows but yields from a server-side cursor.
+    With archived months the page is merged in memory first."""
+    if await partitions.archived_months(session):
+        for row in await get_finish_history_rows(session, user_id, limit, cursor):
+            yield row
+        return
+
+    result = await session.stream(
+        _finish_history_query(user_id, *HISTORY_COLUMNS, cursor=cursor, limit=limit)
+    )
+    async for row in result:
+        yield row
+
+
+def history_item(row: Row) -> dict:
+    """QuizHistoryItem as a plain dict, from a HISTORY_COLUMNS row."""
+    quiz_id, level, score, started_at, finished_at, _ = row
+    return {
+        "quizId": quiz_id,
+        "difficultyLevel": level,
+        "score": score,
+        "startedAt": format_datetime(started_at),
+        "finishedAt": format_datetime(finished_at) if finished_at else "",
+    }
+
+
+def history_cursor(attempt) -> str:
+    return encode_cursor(attempt.started_at, attempt.id)
+
+
+async def insert_attempts(session: AsyncSession, attempts: list[dict]) -> None:
+    """Bulk path: write already-validated attempts (QuizAttempt column values
+    without `id`) with executemany."""
+    await insert_accounts(session, [a["account_id"] for a in attempts])
+    await session.execute(
+        insert(QuizAttempt),
+        [{"id": str(uuid.uuid4()), **a} for a in attempts],
     )
-    return list(result.scalars().all())
+    await stats.apply(session, [stats.attempt_delta(a) for a in attempts])
+    finishes = [(a["account_id"], a["finished_at"]) for a in attempts if a["status"] == "FINISH"]
+    await apply_late_finishes(session, finishes)
+    mark_event_days(session, {finished_at.date() for _, finished_at in finishes})
@@ -0,0 +1,162 @@
+"""Per-account, per-difficulty quiz statistics (`quiz_stats`).
+
+start, complete, abandon and the bulk insert add their deltas to the
+(account, difficulty) row in the same transaction as the attempt, so
+GET /quiz/stats reads at most three rows by primary key instead of the whole
+history. Archiving a month moves attempts without changing them, so the
+totals stay valid.
+
+    python -m quiz.stats rebuild
+
+recomputes the table from quiz_attempts, archived months included.
+database.init_db runs it when it creates the table, or finds it empty while
+there are attempts, so a database that has attempts from before the table
+existed is filled on the first start.
+"""
+import asyncio
+import sys
+from datetime import datetime
+from sqlalchemy import Row, case, delete, func, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import dialect
+import partitions
+from models.quiz_attempt import QuizAttempt
+from models.quiz_stats import QuizStats
+
+LEVELS = ("LOW", "MID", "HIGH")
+
+_COUNTERS = ("attempts", "finishes", "abandons", "score_sum")
+
+
+def delta(
+    account_id: str,
+    difficulty_level: str,
+    played_at: datetime,
+    *,
+    attempts: int = 0,
+    finishes: int = 0,
+    abandons: int = 0,
+    score: int | None = None,
+) -> dict:
+    """A change to one row; `score` is a FINISH score (best and sum)."""
+    return {
+        "account_id": account_id,
+        "difficulty_level": difficulty_level,
+        "attempts": attempts,
+        "finishes": finishes,
+        "abandons": abandons,
+        "best_score": score,
+        "score_sum": score or 0,
+        "last_played_at": played_at,
+    }
+
+
+def attempt_delta(attempt: dict) -> dict:
+    """The delta of inserting one attempt (QuizAttempt column values)."""
+    status = attempt["status"]
+    return delta(
+        attempt["account_id"],
+        attempt["difficulty_level"],
+        attempt["finished_at"] or attempt["started_at"],
+        attempts=1,
+        finishes=int(status == "FINISH"),
+        abandons=int(status == "ABANDONED"),
+        score=attempt["score"] if status == "FINISH" else None,
+    )
+
+
+def _larger(new, current):
+    # NULL is smaller than anything: best_score before the first FINISH.
+    return case((or_(current.is_(None), new > current), new), else_=current)
+
+
+def _merge(into: dict, d: dict) -> None:
+    for key in _COUNTERS:
+        into[key] += d[key]
+    for key in ("best_score", "last_played_at"):
+        if into[key] is None or (d[key] is not None and d[key] > into[key]):
+            into[key] = d[key]
+
+
+async def apply(session: AsyncSession, deltas: list[dict]) -> None:
+    """Add `deltas` to their rows, creating missing rows (one upsert per
+    distinct account and level)."""
+    folded: dict[tuple[str, str], dict] = {}
+    for d in deltas:
+        key = (d["account_id"], d["difficulty_level"])
+        if key in folded:
+            _merge(folded[key], d)
+        else:
+            folded[key] = dict(d)
+    if not folded:
+        return
+    stmt = dialect.insert(QuizStats)
+    excluded = stmt.excluded
+    set_ = {key: getattr(QuizStats, key) + getattr(excluded, key) for key in _COUNTERS}
+    set_["best_score"] = _larger(excluded.best_score, QuizStats.best_score)
+    set_["last_played_at"] = _larger(excluded.last_played_at, QuizStats.last_played_at)
+    await session.execute(
+        stmt.on_conflict_do_update(index_elements=["account_id", "difficulty_level"], set_=set_),
+        list(folded.values()),
+    )
+
+
+async def get_stats(session: AsyncSession, user_id: str) -> list[QuizStats]:
+    """The account's rows in LEVELS order; levels never played are absent."""
+    result = await session.execute(select(QuizStats).where(QuizStats.account_id == user_id))
+    return sorted(result.scalars().all(), key=lambda s: LEVELS.index(s.difficulty_level))
+
+
+def _totals(source):
+    """One delta-shaped row per (account, level) of the attempts in `source`."""
+    c = source.c
+    finished = c.status == "FINISH"
+    finish_score = case((finished, c.score))
+    return select(
+        c.account_id,
+        c.difficulty_level,
+        func.count().label("attempts"),
+        dialect.count_where(finished).label("finishes"),
+        dialect.count_where(c.status == "ABANDONED").label("abandons"),
+        func.max(finish_score).label("best_score"),
+        func.coalesce(func.sum(finish_score), 0).label("score_sum"),
+        func.max(func.coalesce(c.finished_at, c.started_at)).label("last_played_at"),
+    ).group_by(c.account_id, c.difficulty_level)
+
+
+def _as_deltas(rows: list[Row]) -> list[dict]:
+    return [row._asdict() for row in rows]
+
+
+async def rebuild(session: AsyncSession) -> int:
+    """Drop all rows and recompute them from the live attempts and the
+    archived months (read one file at a time). Returns the row count."""
+    await session.execute(delete(QuizStats))
+    attempts = QuizAttempt.__table__
+    totals = _totals(attempts)
+    # The table is empty here, so the live totals go in with one INSERT ... SELECT.
+    await session.execute(insert(QuizStats).from_select([c.name for c in totals.selected_columns], totals))
+    for p in await partitions.archived_months(session):
+        rows = await partitions.fetch_archived(
+            p, lambda schema: _totals(partitions.archived_table(attempts, schema))
+        )
+        await apply(session, _as_deltas(rows))
+    return (await session.execute(select(func.count()).select_from(QuizStats))).scalar()
+
+
+async def _main(argv: list[str]) -> None:
+    from database import async_session_factory, init_db
+
+    await init_db()
+    command = argv[0] if argv else "rebuild"
+    async with async_session_factory() as session:
+        if command == "rebuild":
+            print("rows:", await rebuild(session))
+        else:
+            raise SystemExit(f"unknown command: {command}")
+        await session.commit()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
@@ -0,0 +1,33 @@
+"""Pre-encoded JSON responses for the list endpoints.
+
+Routes that return many rows build plain dicts from column tuples and return
+a FastJSONResponse. FastAPI passes a returned Response through untouched, so
+the `response_model` declared on the route only documents the shape; it is
+not validated a second time. Encoding uses orjson when it is installed.
+"""
+import json
+from typing import Any
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def dumps_line(content: Any) -> bytes:
+    """One NDJSON line."""
+    return dumps(content) + b"\n"
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,79 @@
+"""Shared fixtures.
+
+The app reads its configuration from the environment at import time, so it is
+set here, before any app module is imported: the test session gets a SQLite
+file and archive/columnar directories of its own, computes in the event loop
+(no analytics pool) and runs no background scheduler.
+"""
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+
+_TMP = tempfile.mkdtemp(prefix="oh-tests-")
+DB_FILE = os.path.join(_TMP, "test.sqlite")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{DB_FILE}"
+os.environ["ARCHIVE_DIR"] = os.path.join(_TMP, "archive")
+os.environ["COLUMNAR_DIR"] = os.path.join(_TMP, "columnar")
+os.environ["ANALYTICS_WORKERS"] = "0"
+os.environ["SCHEDULER_ENABLED"] = "0"
+
+import pytest  # noqa: E402
+
+from database import engine, read_engine, async_session_factory, init_db  # noqa: E402
+from bench.dataset import generate, reset  # noqa: E402
+from aggregation import rollup  # noqa: E402
+from engagement.account_cache import known_accounts  # noqa: E402
+from aggregation.result_cache import result_cache  # noqa: E402
+from aggregation.bitmap import bitmap_cache  # noqa: E402
+from aggregation.columnar import column_store  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def db(anyio_backend):
+    """An empty database and empty in-process caches."""
+    await init_db()
+    async with async_session_factory() as session:
+        await reset(session)
+        await session.commit()
+    for cache in (known_accounts, result_cache, bitmap_cache):
+        cache.clear()
+    column_store.reset()
+    yield
+    # Pooled connections belong to the test's event loop.
+    await engine.dispose()
+    await read_engine.dispose()
+
+
+END = date(2026, 3, 1)
+# Days up to HWM come from the rollups, later ones from raw rows.
+HWM = date(2026, 2, 19)
+# Parameters of `dataset`; a test overrides any of them with
+# @pytest.mark.parametrize("dataset", [{...}], indirect=True).
+DATASET = {"accounts": 200, "weeks": 10, "active_ratio": 0.6, "seed": 1, "end": END, "hwm": HWM}
+
+
+@pytest.fixture
+async def dataset(db, request):
+    """A generated history ending at `end`, rolled up through `hwm`, so that
+    queries see days on both sides of the high-water mark. Returns the
+    parameters used."""
+    params = {**DATASET, **getattr(request, "param", {})}
+    await generate(
+        async_session_factory,
+        accounts=params["accounts"],
+        weeks=params["weeks"],
+        active_ratio=params["active_ratio"],
+        seed=params["seed"],
+        end=params["end"],
+    )
+    async with async_session_factory() as session:
+        closed = datetime.combine(params["hwm"] + timedelta(days=1), datetime.max.time())
+        await rollup.rebuild(session, now=closed)
+        await session.commit()
+        assert await rollup.get_high_water_mark(session) == params["hwm"]
+    return params
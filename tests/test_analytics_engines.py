@@ -0,0 +1,68 @@
+"""The rollup-backed analytics agree with the raw queries and the other
+exact engines, on both sides of the rollup high-water mark."""
+from datetime import date, timedelta
+
+import pytest
+
+from database import async_session_factory, read_session_factory
+from aggregation import service
+from aggregation.bitmap import compute_participation_bitmap
+from aggregation.columnar import AVAILABLE as COLUMNAR_AVAILABLE, compute_participation_columnar
+from tests.conftest import END, HWM
+
+pytestmark = pytest.mark.anyio
+
+PERIODS = [
+    (date(2026, 1, 1), date(2026, 1, 31)),  # rollups only
+    (date(2026, 2, 10), date(2026, 2, 25)),  # across the mark
+    (HWM, HWM),
+    (HWM + timedelta(days=1), HWM + timedelta(days=1)),  # first raw day
+    (date(2026, 2, 21), END),  # raw only
+    (date(2025, 12, 1), date(2026, 3, 5)),  # beyond the data on both ends
+]
+ANCHORS = [date(2026, 2, 1), HWM, HWM + timedelta(days=1), date(2026, 2, 25), END]
+
+requires_numpy = pytest.mark.skipif(not COLUMNAR_AVAILABLE, reason="the columnar engine needs numpy")
+
+
+@pytest.mark.parametrize("period", PERIODS)
+async def test_participation_rollup_matches_raw(dataset, period):
+    async with async_session_factory() as session:
+        rolled = await service.compute_participation(session, *period)
+        raw = await service._compute_participation_raw(session, *period)
+        assert rolled == raw
+
+
+@pytest.mark.parametrize("anchor", ANCHORS)
+async def test_retention_rollup_matches_raw(dataset, anchor):
+    async with async_session_factory() as session:
+        rolled = await service.compute_retention_4w(session, anchor)
+        raw = await service._compute_retention_4w_raw(session, anchor)
+        assert rolled == raw
+        assert rolled[1] > 0
+
+
+async def test_retention_matches_reference(dataset):
+    async with async_session_factory() as session:
+        for anchor in (HWM, END):
+            reference = await service._compute_retention_4w_reference(session, anchor)
+            assert await service.compute_retention_4w(session, anchor) == reference
+
+
+@pytest.mark.parametrize("engine", [
+    service.ENGINE_BITMAP,
+    pytest.param(service.ENGINE_COLUMNAR, marks=requires_numpy),
+])
+async def test_exact_engines_match_sql(dataset, engine):
+    participation = {
+        service.ENGINE_BITMAP: compute_participation_bitmap,
+        service.ENGINE_COLUMNAR: compute_participation_columnar,
+    }[engine]
+    retention = service._RETENTION_4W_ENGINES[engine]
+    async with async_session_factory() as writer, read_session_factory() as session:
+        for period in PERIODS:
+            expected = await service.compute_participation(session, *period)
+            assert await participation(session, *period, writer=writer) == expected
+        for anchor in ANCHORS:
+            expected = await service.compute_retention_4w(session, anchor)
+            assert await retention(session, anchor, writer=writer) == expected
@@ -0,0 +1,42 @@
+"""Participation, retention and the snapshot upsert give the same results on
+every backend, through bench.backends. PostgreSQL runs when
+BENCH_POSTGRES_URL is set."""
+import argparse
+import os
+
+import pytest
+
+from bench import backends
+
+POSTGRES_URL = os.environ.get("BENCH_POSTGRES_URL")
+ARGS = argparse.Namespace(accounts=200, events=4000, repeat=2, seed=3)
+BACKENDS = [
+    "sqlite",
+    pytest.param("postgresql", marks=pytest.mark.skipif(not POSTGRES_URL, reason="BENCH_POSTGRES_URL is not set")),
+]
+
+
+def run(name: str, url: str) -> dict:
+    report = backends._run_backend(name, url, ARGS)
+    assert report is not None, f"the {name} worker failed"
+    assert report["backend"] == name
+    return report["results"]
+
+
+@pytest.fixture(scope="module")
+def reference(tmp_path_factory):
+    """Results of a SQLite run on a scratch file of its own."""
+    path = tmp_path_factory.mktemp("reference") / "bench.sqlite"
+    return run("sqlite", f"sqlite+aiosqlite:///{path}")
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backend_matches_reference(backend, reference, tmp_path):
+    url = POSTGRES_URL if backend == "postgresql" else f"sqlite+aiosqlite:///{tmp_path / 'bench.sqlite'}"
+    results = run(backend, url)
+    assert results == reference
+    assert results["compute_participation"] == results["compute_participation (raw)"]
+    assert results["compute_retention_4w"] == results["compute_retention_4w (raw)"]
+    assert results["compute_participation"][1] > 0
+    # One row, kept with its id, holding the last save.
+    assert results["save_snapshot (upsert)"] == [True, 1, ARGS.repeat, ARGS.repeat, 1.0]
@@ -0,0 +1,73 @@
+"""The bitmap and sketch engines read on the read pool and keep the single
+SQLite writer connection only for their short ordinal/sketch inserts."""
+import asyncio
+from datetime import date
+
+import pytest
+
+from database import async_session_factory, read_session_factory
+from engagement.service import record_visit
+from aggregation import bitmap, service
+from aggregation.result_cache import result_cache
+from tests.conftest import END, HWM
+
+pytestmark = pytest.mark.anyio
+
+PERIOD = (date(2026, 1, 1), END)
+
+
+async def write_visit() -> None:
+    async with async_session_factory() as session:
+        await record_visit(session, "late-writer")
+        await session.commit()
+
+
+@pytest.mark.parametrize("approx", [False, True])
+async def test_writes_proceed_during_computation(dataset, monkeypatch, approx):
+    writes = []
+    compute = service.compute_participation_approx if approx else bitmap.active_bitmap
+
+    async def compute_then_write(*args, **kwargs):
+        result = await compute(*args, **kwargs)
+        # Ordinals or sketches are assigned by now; the writer must be free.
+        await asyncio.wait_for(write_visit(), timeout=2)
+        writes.append(True)
+        return result
+
+    if approx:
+        monkeypatch.setattr(service, "compute_participation_approx", compute_then_write)
+    else:
+        monkeypatch.setattr(bitmap, "active_bitmap", compute_then_write)
+    async with async_session_factory() as session, read_session_factory() as read_session:
+        await service.participation_snapshot(
+            session, *PERIOD, approx=approx, engine=service.ENGINE_BITMAP, read_session=read_session
+        )
+        await session.commit()
+    assert writes
+
+
+async def test_bitmap_on_read_session_matches_sql(dataset):
+    async with async_session_factory() as session, read_session_factory() as read_session:
+        for period in [PERIOD, (HWM, END), (END, END)]:
+            sql = await service.compute_participation(read_session, *period)
+            assert await bitmap.compute_participation_bitmap(read_session, *period, writer=session) == sql
+        for anchor in [HWM, END]:
+            sql = await service.compute_retention_4w(read_session, anchor)
+            assert await service._compute_retention_4w_bitmap(read_session, anchor, writer=session) == sql
+        assert not session.in_transaction()
+
+
+async def test_day_invalidated_while_building_is_not_cached(dataset, monkeypatch):
+    build = bitmap._day_bitmaps
+    late_day = date(2026, 1, 10)
+
+    async def build_then_late_write(*args):
+        built = await build(*args)
+        result_cache.invalidate_days({late_day}, late=True)
+        return built
+
+    monkeypatch.setattr(bitmap, "_day_bitmaps", build_then_late_write)
+    async with async_session_factory() as session, read_session_factory() as read_session:
+        await bitmap.active_bitmap(read_session, bitmap.VISITORS, date(2026, 1, 5), date(2026, 1, 15), session)
+    assert bitmap.bitmap_cache.get((bitmap.VISITORS, late_day)) is None
+    assert bitmap.bitmap_cache.get((bitmap.VISITORS, date(2026, 1, 9))) is not None
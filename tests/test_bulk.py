@@ -0,0 +1,33 @@
+"""A bulk body that breaks off after some chunks were committed answers 400
+with those chunks, so the client can resume instead of resending them."""
+import json
+
+import httpx
+import pytest
+from sqlalchemy import select
+
+from database import async_session_factory
+from engagement import bulk
+from models.event_log import EventLog
+from main import app
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_bad_record_after_first_chunk_reports_committed_chunks(db, monkeypatch):
+    monkeypatch.setattr(bulk, "BULK_CHUNK_SIZE", 2)
+    records = [{"userId": f"bulk-{i}", "occurredAt": f"2026-01-1{i}T12:00:00Z"} for i in range(3)]
+    body = "[" + ",".join(json.dumps(r) for r in records) + ', {"userId": '
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post("/engagement/visits:bulk", content=body)
+
+    assert response.status_code == 400
+    payload = response.json()
+    assert payload["detail"] == "Malformed JSON array body"
+    assert payload["committed"] == {
+        "accepted": 2, "rejected": 0, "chunks": [{"index": 0, "accepted": 2, "rejected": 0}]
+    }
+    async with async_session_factory() as session:
+        rows = (await session.execute(select(EventLog.account_id).order_by(EventLog.account_id))).scalars().all()
+        assert rows == ["bulk-0", "bulk-1"]
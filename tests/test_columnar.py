@@ -0,0 +1,62 @@
+"""Late events rewrite the columnar segment of their day instead of
+appending duplicates, and only exported days are marked dirty."""
+import os
+from datetime import date, datetime, time
+
+import pytest
+
+from database import async_session_factory, read_session_factory
+from engagement.service import insert_visits, record_visit
+from aggregation import service
+from aggregation.columnar import AVAILABLE, column_store, compute_participation_columnar
+from tests.conftest import HWM
+
+pytestmark = [pytest.mark.anyio, pytest.mark.skipif(not AVAILABLE, reason="the columnar engine needs numpy")]
+
+PERIOD = (date(2026, 1, 1), HWM)
+
+
+async def participation(period):
+    async with async_session_factory() as writer, read_session_factory() as session:
+        columnar = await compute_participation_columnar(session, *period, writer=writer)
+        assert columnar == await service.compute_participation(session, *period)
+        return columnar
+
+
+def column_files() -> list[str]:
+    return sorted(name for name in os.listdir(column_store.directory) if name.endswith(".bin"))
+
+
+async def test_late_event_rewrites_its_segment(dataset):
+    before = await participation(PERIOD)
+    segments, rows, files = list(column_store.segments), column_store.rows, column_files()
+    mapped, rewrites = column_store.columns(), column_store.rewrites
+
+    late_day = date(2026, 1, 10)
+    async with async_session_factory() as session:
+        await insert_visits(session, [("late-visitor", datetime.combine(late_day, time(12)))])
+        await session.commit()
+    assert late_day in column_store._dirty
+
+    after = await participation(PERIOD)
+    assert after[1] == before[1] + 1
+    assert column_store.rows == rows + 1
+    rewritten = [s for s in column_store.segments if s not in segments]
+    assert len(rewritten) == 1 and rewritten[0]["first"] <= late_day <= rewritten[0]["last"]
+    assert len(column_files()) == len(files)
+    assert not column_store._dirty
+    # Maps taken before the rewrite still read the replaced files.
+    assert sum(len(cols["day"]) for cols in mapped) == rows
+
+    # Nothing is dirty any more, so the next query rewrites nothing.
+    await participation(PERIOD)
+    assert column_store.rewrites == rewrites + 1
+
+
+async def test_open_days_are_not_marked_dirty(dataset):
+    await participation(PERIOD)
+    async with async_session_factory() as session:
+        await record_visit(session, "open-day-visitor")
+        await session.commit()
+    assert column_store.exported_through == HWM
+    assert not column_store._dirty
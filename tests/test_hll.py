@@ -0,0 +1,48 @@
+"""Approximate counts stay within the error bound documented in aggregation.hll."""
+from datetime import date
+
+import pytest
+
+from database import async_session_factory
+from aggregation import service
+from aggregation.approx import compute_participation_approx
+from aggregation.hll import HLL_STANDARD_ERROR, HyperLogLog
+from tests.conftest import END, HWM
+
+# 3 sigma: the documented ~99.7% bound, 2.44% at the default precision.
+BOUND = 3 * HLL_STANDARD_ERROR
+
+def relative_error(estimate: int, exact: int) -> float:
+    return abs(estimate - exact) / exact
+
+
+@pytest.mark.parametrize("n", [1_000, 10_000, 100_000])
+def test_count_within_bound(n):
+    sketch = HyperLogLog()
+    sketch.update(f"acct-{i}" for i in range(n))
+    assert relative_error(sketch.count(), n) <= BOUND
+
+
+def test_union_matches_single_sketch():
+    days = [HyperLogLog() for _ in range(7)]
+    whole = HyperLogLog()
+    for i in range(30_000):
+        days[i % 7].add(f"acct-{i % 20_000}")
+        whole.add(f"acct-{i % 20_000}")
+    merged = HyperLogLog.union(d.to_bytes() for d in days)
+    assert merged.to_bytes() == whole.to_bytes()
+    assert relative_error(merged.count(), 20_000) <= BOUND
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("dataset", [{"accounts": 3000, "active_ratio": 0.5, "seed": 11}], indirect=True)
+async def test_approx_participation_within_bound(dataset):
+    async with async_session_factory() as session:
+        # Closed days from the stored sketches, the rest from raw rows.
+        for period in [(date(2026, 1, 1), date(2026, 1, 31)), (date(2026, 2, 1), END), (HWM, HWM)]:
+            finished, target, _ = await compute_participation_approx(session, *period)
+            exact_finished, exact_target, _ = await service.compute_participation(session, *period)
+            assert exact_finished > 0
+            assert relative_error(finished, exact_finished) <= BOUND
+            assert relative_error(target, exact_target) <= BOUND
+        await session.commit()
@@ -0,0 +1,153 @@
+"""Caches of one process are invalidated by commits of another process on
+the same SQLite file, through aggregation.invalidation."""
+import asyncio
+import os
+import subprocess
+import sys
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import func, select
+
+from database import async_session_factory, read_session_factory
+from engagement.account_cache import known_accounts
+from engagement.service import insert_visits, record_visit
+from models.cache_invalidation import CacheInvalidation
+from aggregation import bitmap, invalidation, service
+from aggregation.result_cache import result_cache
+from tests.conftest import DB_FILE
+
+pytestmark = pytest.mark.anyio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WINDOW = (date(2026, 1, 1), date(2026, 1, 31))
+LATE_DAY = date(2026, 1, 10)
+OTHER_ACCOUNT = "other-worker"
+
+# Another worker: the same database file, its own process and caches.
+OTHER_WORKER = f"""
+import asyncio
+from datetime import datetime
+import main  # registers the listeners of a worker, the publisher included
+from database import async_session_factory
+from engagement.service import insert_visits
+
+async def main():
+    async with async_session_factory() as session:
+        await insert_visits(session, [({OTHER_ACCOUNT!r}, datetime({LATE_DAY.year}, {LATE_DAY.month}, {LATE_DAY.day}, 12))])
+        await session.commit()
+
+asyncio.run(main())
+"""
+
+
+# A worker holding a cached participation result while another process writes.
+CACHING_WORKER = f"""
+import asyncio
+from datetime import date
+import main
+from database import async_session_factory, read_session_factory
+from aggregation import invalidation, service
+from aggregation.result_cache import result_cache
+
+WINDOW = (date.fromisoformat({WINDOW[0].isoformat()!r}), date.fromisoformat({WINDOW[1].isoformat()!r}))
+
+async def run():
+    async with async_session_factory() as session, read_session_factory() as read_session:
+        await service.participation_snapshot(session, *WINDOW, read_session=read_session)
+        await session.commit()
+    key = (service.PARTICIPATION, *WINDOW, None)
+    channel = invalidation.InvalidationChannel({DB_FILE!r}, poll_s=0.05)
+    await channel.start()
+    print("cached" if result_cache.get(key) is not None else "missing", flush=True)
+    for _ in range(200):
+        if result_cache.get(key) is None:
+            break
+        await asyncio.sleep(0.05)
+    await channel.stop()
+    print("dropped" if result_cache.get(key) is None else "kept", flush=True)
+
+asyncio.run(run())
+"""
+WORKERS = 2
+
+
+async def invalidation_rows() -> int:
+    async with async_session_factory() as session:
+        return (await session.execute(select(func.count()).select_from(CacheInvalidation))).scalar()
+
+
+def worker_env() -> dict:
+    env = {k: v for k, v in os.environ.items() if k != "INVALIDATION_ENABLED"}
+    env["WEB_CONCURRENCY"] = "2"
+    return env
+
+
+def run_other_worker() -> None:
+    subprocess.run([sys.executable, "-c", OTHER_WORKER], cwd=ROOT, env=worker_env(), check=True, timeout=60)
+
+
+async def test_other_process_commit_invalidates_caches(dataset):
+    async with async_session_factory() as session, read_session_factory() as read_session:
+        before = await service.participation_snapshot(session, *WINDOW, read_session=read_session)
+        await session.commit()
+        await bitmap.compute_participation_bitmap(read_session, *WINDOW, writer=session)
+    key = (service.PARTICIPATION, *WINDOW, None)
+    assert result_cache.get(key) is not None
+    assert any(day == LATE_DAY for _, day in bitmap.bitmap_cache._bitmaps)
+
+    channel = invalidation.InvalidationChannel(DB_FILE, poll_s=0.05)
+    await channel.start()
+    try:
+        await asyncio.to_thread(run_other_worker)
+        for _ in range(100):
+            if result_cache.get(key) is None:
+                break
+            await asyncio.sleep(0.05)
+    finally:
+        await channel.stop()
+    assert LATE_DAY in result_cache._invalidated_at
+    assert result_cache.get(key) is None
+    assert not any(day == LATE_DAY for _, day in bitmap.bitmap_cache._bitmaps)
+
+    async with async_session_factory() as session, read_session_factory() as read_session:
+        after = await service.participation_snapshot(session, *WINDOW, read_session=read_session)
+        await session.commit()
+        assert after.denominator == before.denominator + 1
+        # Accounts are never deleted, so the account cache has nothing to
+        # drop: an account another process created is simply a miss here.
+        assert not known_accounts.lookup(OTHER_ACCOUNT)
+        await record_visit(session, OTHER_ACCOUNT)
+        await session.commit()
+    assert known_accounts.lookup(OTHER_ACCOUNT)
+
+
+async def test_commit_invalidates_every_other_worker(dataset, monkeypatch):
+    monkeypatch.setattr(invalidation, "INVALIDATION_ENABLED", True)
+    workers = [
+        subprocess.Popen([sys.executable, "-c", CACHING_WORKER], cwd=ROOT, env=worker_env(), stdout=subprocess.PIPE, text=True)
+        for _ in range(WORKERS)
+    ]
+    try:
+        for worker in workers:
+            assert (await asyncio.to_thread(worker.stdout.readline)).strip() == "cached"
+        async with async_session_factory() as session:
+            await insert_visits(session, [("parent-writer", datetime(LATE_DAY.year, LATE_DAY.month, LATE_DAY.day, 12))])
+            await session.commit()
+        for worker in workers:
+            assert (await asyncio.to_thread(worker.stdout.readline)).strip() == "dropped"
+            assert await asyncio.to_thread(worker.wait, 60) == 0
+    finally:
+        for worker in workers:
+            if worker.poll() is None:
+                worker.kill()
+            worker.stdout.close()
+
+
+@pytest.mark.parametrize("enabled", [False, True])
+async def test_publishing_follows_the_worker_gate(db, monkeypatch, enabled):
+    monkeypatch.setattr(invalidation, "INVALIDATION_ENABLED", enabled)
+    async with async_session_factory() as session:
+        await insert_visits(session, [("single-worker", datetime(2026, 1, 10, 12))])
+        await session.commit()
+    assert await invalidation_rows() == (1 if enabled else 0)
@@ -0,0 +1,169 @@
+"""EXPLAIN QUERY PLAN regression checks: the service read paths search the
+indexes declared on their tables instead of scanning or sorting (SQLite
+only). Distinct counts keep their GROUP BY / DISTINCT b-trees, which
+collect account ids and do not sort the rows read."""
+import re
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import event, inspect, update
+
+from database import IS_SQLITE, async_session_factory
+from models.base import Base
+from models.daily_rollup import DailyFinisher, DailyVisitor
+from models.quiz_attempt import QuizAttempt
+from aggregation import columnar, rollup, service, snapshots
+from quiz import stats
+from quiz.service import HISTORY_COLUMNS, _finish_history_query
+from pagination import encode_cursor
+
+pytestmark = [
+    pytest.mark.anyio,
+    pytest.mark.skipif(not IS_SQLITE, reason="EXPLAIN QUERY PLAN is SQLite syntax"),
+]
+
+HWM = date(2026, 1, 20)
+PERIOD = (date(2026, 1, 1), date(2026, 1, 31))
+CURSOR = encode_cursor(datetime(2026, 1, 1), "x")
+DEDUP = (
+    "USE TEMP B-TREE FOR GROUP BY",
+    "USE TEMP B-TREE FOR DISTINCT",
+    "USE TEMP B-TREE FOR count(DISTINCT)",
+)
+# Newest snapshots first with no filter: walks the created_at index until LIMIT.
+SNAPSHOTS_IN_ORDER = "SCAN aggregation_snapshots USING INDEX ix_aggregation_snapshots_created"
+
+
+async def query_plans(session, run) -> list[str]:
+    """The plan of every SELECT or UPDATE executed by `run()`, one string each."""
+    conn = await session.connection()
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(conn.sync_connection, "before_cursor_execute", capture)
+    try:
+        await run()
+    finally:
+        event.remove(conn.sync_connection, "before_cursor_execute", capture)
+    plans = []
+    for statement, parameters in statements:
+        if statement.lstrip().split(None, 1)[0].upper() in ("SELECT", "UPDATE"):
+            rows = (await conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)).all()
+            plans.append("\n".join(row[-1] for row in rows))
+    return plans
+
+
+async def plan_of(session, stmt) -> str:
+    async def run():
+        await session.execute(stmt)
+
+    (plan,) = await query_plans(session, run)
+    return plan
+
+
+def assert_indexed(plans: list[str], dedup: bool = False, scan: str | None = None) -> None:
+    """No step scans a table and none sorts into a TEMP B-TREE; with `dedup`
+    the distinct-count b-trees are allowed, `scan` allows that one step."""
+    assert plans
+    for plan in plans:
+        for line in plan.splitlines():
+            if "TEMP B-TREE" in line:
+                assert dedup and line in DEDUP, plan
+            table = re.match(r"SCAN (\w+)", line)
+            if table and table.group(1) in Base.metadata.tables:
+                assert line == scan, plan
+
+
+async def plans_of(session, run) -> list[str]:
+    """Plans of `run()` with the rollup high-water mark inside PERIOD, so
+    both the rollup and the raw branch are planned."""
+    await rollup._set_high_water_mark(session, HWM)
+    return await query_plans(session, run)
+
+
+@pytest.mark.parametrize("cursor", [None, CURSOR])
+async def test_history(db, cursor):
+    async with async_session_factory() as session:
+        plan = await plan_of(session, _finish_history_query("u1", *HISTORY_COLUMNS, cursor=cursor, limit=50))
+        assert "USING INDEX ix_quiz_attempts_account_status_started_id" in plan
+        assert_indexed([plan])
+
+
+@pytest.mark.parametrize("metric_type", [None, service.PARTICIPATION])
+@pytest.mark.parametrize("cursor", [None, CURSOR])
+async def test_snapshot_listing(db, metric_type, cursor):
+    async with async_session_factory() as session:
+        plans = await query_plans(session, lambda: service.list_snapshot_rows(session, metric_type, 50, cursor))
+        assert_indexed(plans, scan=SNAPSHOTS_IN_ORDER if metric_type is None and cursor is None else None)
+
+
+async def test_point_reads(db):
+    async with async_session_factory() as session:
+        assert_indexed(await query_plans(session, lambda: snapshots.current_snapshot(session, "key")))
+        assert_indexed(await query_plans(session, lambda: stats.get_stats(session, "u1")))
+        assert_indexed(await query_plans(session, lambda: rollup.get_high_water_mark(session)))
+
+
+@pytest.mark.parametrize("model, raw_days", [
+    (DailyVisitor, rollup.visitor_days_raw),
+    (DailyFinisher, rollup.finisher_days_raw),
+])
+async def test_account_days(db, model, raw_days):
+    async with async_session_factory() as session:
+        rolled = await plan_of(session, service._account_days(model, raw_days, *PERIOD, PERIOD[1]))
+        assert_indexed([rolled])
+        mixed = await plan_of(session, service._account_days(model, raw_days, *PERIOD, HWM))
+        assert_indexed([mixed], dedup=True)
+
+
+async def test_columnar_account_days(db):
+    async with async_session_factory() as session:
+        assert_indexed([await plan_of(session, columnar._account_days(*PERIOD, raw=False))])
+        assert_indexed([await plan_of(session, columnar._account_days(*PERIOD, raw=True))], dedup=True)
+
+
+async def test_participation(db):
+    async with async_session_factory() as session:
+        assert_indexed(await plans_of(session, lambda: service.compute_participation(session, *PERIOD)), dedup=True)
+        raw = await plans_of(session, lambda: service._compute_participation_raw(session, *PERIOD))
+        assert_indexed(raw, dedup=True)
+        joined = "\n".join(raw)
+        assert "USING COVERING INDEX ix_quiz_attempts_status_finished_account" in joined
+        assert "USING COVERING INDEX ix_event_logs_type_occurred_account" in joined
+
+
+@pytest.mark.parametrize("granularity", [service.GRANULARITY_DAY, service.GRANULARITY_WEEK, service.GRANULARITY_MONTH])
+async def test_retention(db, granularity):
+    buckets = service.retention_buckets(PERIOD[1], 4, granularity)
+    async with async_session_factory() as session:
+        rolled = await plans_of(session, lambda: service.compute_retention(session, buckets, granularity))
+        assert_indexed(rolled, dedup=True)
+
+
+async def test_retention_raw(db):
+    async with async_session_factory() as session:
+        plans = await plans_of(session, lambda: service._compute_retention_4w_raw(session, PERIOD[1]))
+        assert_indexed(plans, dedup=True)
+
+
+async def test_attempt_transition_uses_primary_key(db):
+    async with async_session_factory() as session:
+        stmt = (
+            update(QuizAttempt)
+            .where(QuizAttempt.id == "a1", QuizAttempt.account_id == "u1", QuizAttempt.status == "START")
+            .values(status="ABANDONED")
+        )
+        plan = await plan_of(session, stmt)
+        assert "USING INDEX sqlite_autoindex_quiz_attempts_1" in plan
+        assert_indexed([plan])
+        await session.rollback()
+
+
+async def test_replaced_attempt_indexes_are_gone(db):
+    async with async_session_factory() as session:
+        conn = await session.connection()
+        names = await conn.run_sync(lambda c: {i["name"] for i in inspect(c).get_indexes("quiz_attempts")})
+        assert not {"ix_quiz_attempts_id_account", "ix_quiz_attempts_account_status_started"} & names
+        assert {"ix_quiz_attempts_status_finished_account", "ix_quiz_attempts_account_status_started_id"} <= names
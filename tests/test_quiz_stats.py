@@ -0,0 +1,50 @@
+"""init_db fills quiz_stats from the attempts of a database that predates it."""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import delete, insert, text
+
+from database import async_session_factory, engine, init_db
+from engagement.service import insert_accounts
+from models.quiz_attempt import QuizAttempt
+from models.quiz_stats import QuizStats
+from quiz.stats import get_stats
+
+pytestmark = pytest.mark.anyio
+
+USER = "veteran"
+STARTED = datetime(2026, 1, 5, 9)
+
+
+async def add_attempts_without_stats() -> None:
+    """Attempts written directly, as before quiz_stats existed."""
+    async with async_session_factory() as session:
+        await insert_accounts(session, [USER])
+        await session.execute(insert(QuizAttempt), [
+            {"id": f"attempt-{i}", "account_id": USER, "quiz_id": "quiz-1", "difficulty_level": "LOW",
+             "status": status, "score": score, "started_at": STARTED + timedelta(hours=i),
+             "finished_at": None if status == "START" else STARTED + timedelta(hours=i, minutes=5)}
+            for i, (status, score) in enumerate([("FINISH", 40), ("FINISH", 90), ("ABANDONED", None), ("START", None)])
+        ])
+        await session.execute(delete(QuizStats))
+        await session.commit()
+
+
+async def assert_filled() -> None:
+    async with async_session_factory() as session:
+        (row,) = await get_stats(session, USER)
+    assert (row.attempts, row.finishes, row.abandons, row.best_score, row.score_sum) == (4, 2, 1, 90, 130)
+
+
+async def test_empty_table_is_filled(db):
+    await add_attempts_without_stats()
+    await init_db()
+    await assert_filled()
+
+
+async def test_new_table_is_filled(db):
+    await add_attempts_without_stats()
+    async with engine.begin() as conn:
+        await conn.execute(text("DROP TABLE quiz_stats"))
+    await init_db()
+    await assert_filled()
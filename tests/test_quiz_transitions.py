@@ -0,0 +1,73 @@
+"""Competing complete/abandon calls on one START attempt: the conditional
+UPDATE in quiz.service._transition lets exactly one of them through."""
+import asyncio
+
+import httpx
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from database import DATABASE_URL, _on_write_connect, async_session_factory
+from main import app
+from quiz.service import abandon_attempt, complete_attempt, start_attempt
+from quiz.stats import get_stats
+
+pytestmark = pytest.mark.anyio
+
+USER = "racer"
+ROUNDS = 20
+
+
+@pytest.fixture
+async def other_writer(db):
+    """Sessions on a second write engine, so that both sides of a race hold
+    a connection of their own, as two uvicorn workers would."""
+    other = create_async_engine(DATABASE_URL)
+    event.listen(other.sync_engine, "connect", _on_write_connect)
+    yield async_sessionmaker(other, class_=AsyncSession, expire_on_commit=False)
+    await other.dispose()
+
+
+async def start() -> str:
+    async with async_session_factory() as session:
+        attempt = await start_attempt(session, USER, "quiz-1", "MID")
+        await session.commit()
+        return attempt.id
+
+
+async def totals() -> tuple[int, int]:
+    async with async_session_factory() as session:
+        (row,) = await get_stats(session, USER)
+        return row.finishes, row.abandons
+
+
+async def test_complete_and_abandon_race(other_writer):
+    async def transition(session_factory, fn, *args):
+        async with session_factory() as session:
+            attempt, error = await fn(session, USER, *args)
+            await session.commit()
+            return attempt is not None, error
+
+    for _ in range(ROUNDS):
+        attempt_id = await start()
+        before = await totals()
+        completed, abandoned = await asyncio.gather(
+            transition(async_session_factory, complete_attempt, attempt_id, 70),
+            transition(other_writer, abandon_attempt, attempt_id),
+        )
+        outcomes = sorted([completed, abandoned])
+        assert outcomes == [(False, "already_finished"), (True, None)]
+        finishes, abandons = await totals()
+        assert (finishes - before[0], abandons - before[1]) == ((1, 0) if completed[0] else (0, 1))
+
+
+async def test_complete_and_abandon_race_over_http(db):
+    attempt_id = await start()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        complete, abandon = await asyncio.gather(
+            client.post("/quiz/complete", json={"userId": USER, "attemptId": attempt_id, "score": 70}),
+            client.post("/quiz/abandon", json={"userId": USER, "attemptId": attempt_id}),
+        )
+    assert sorted([complete.status_code, abandon.status_code]) == [200, 400]
+    assert sum(await totals()) == 1
@@ -0,0 +1,71 @@
+from datetime import date, datetime
+
+import pytest
+
+from database import async_session_factory, read_session_factory
+from models.aggregation_snapshot import AggregationSnapshot
+from aggregation import service
+from aggregation.result_cache import ResultCache, result_cache
+
+WINDOW = (date(2026, 1, 1), date(2026, 1, 31))
+
+
+def snapshot(n: int) -> AggregationSnapshot:
+    return AggregationSnapshot(
+        id=str(n), metric_type="PARTICIPATION", period_from=WINDOW[0], period_to=WINDOW[1],
+        numerator=n, denominator=n, rate=1.0, created_at=datetime(2026, 2, 1),
+    )
+
+
+def key(n: int) -> tuple:
+    return ("PARTICIPATION", date(2026, 1, n), WINDOW[1], None)
+
+
+def test_evicts_least_recently_used():
+    cache = ResultCache(max_entries=3)
+    for n in (1, 2, 3):
+        cache.put(key(n), snapshot(n), WINDOW, closed=True)
+    assert cache.get(key(1)).numerator == 1  # 2 is now the least recently used
+    cache.put(key(4), snapshot(4), WINDOW, closed=True)
+    assert cache.get(key(2)) is None
+    assert [cache.get(key(n)).numerator for n in (1, 3, 4)] == [1, 3, 4]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_put_after_invalidation_is_dropped():
+    cache = ResultCache()
+    generation = cache.generation
+    cache.invalidate_days({date(2026, 1, 15)})
+    cache.put(key(1), snapshot(1), WINDOW, closed=True, generation=generation)
+    assert cache.get(key(1)) is None
+    assert cache.stats()["stalePuts"] == 1
+    # Days outside the window do not matter.
+    generation = cache.generation
+    cache.invalidate_days({date(2026, 2, 15)})
+    cache.put(key(1), snapshot(1), WINDOW, closed=True, generation=generation)
+    assert cache.get(key(1)).numerator == 1
+
+
+@pytest.mark.anyio
+async def test_flight_overtaken_by_invalidation_is_not_cached(db, monkeypatch):
+    compute = service._PARTICIPATION_ENGINES[service.ENGINE_SQL]
+
+    async def compute_then_late_write(session, period_from, period_to):
+        result = await compute(session, period_from, period_to)
+        # An event committed for a day of the window while this computed.
+        result_cache.invalidate_days({period_from}, late=True)
+        return result
+
+    monkeypatch.setitem(service._PARTICIPATION_ENGINES, service.ENGINE_SQL, compute_then_late_write)
+    async with async_session_factory() as session, read_session_factory() as read_session:
+        stale = await service.participation_snapshot(session, *WINDOW, read_session=read_session)
+        await session.commit()
+    assert result_cache.get((service.PARTICIPATION, *WINDOW, None)) is None
+
+    # Nor is its stored snapshot reused: it predates the late write.
+    monkeypatch.setitem(service._PARTICIPATION_ENGINES, service.ENGINE_SQL, compute)
+    async with async_session_factory() as session, read_session_factory() as read_session:
+        fresh = await service.participation_snapshot(session, *WINDOW, read_session=read_session)
+        await session.commit()
+    assert fresh.created_at > stale.created_at
+    assert result_cache.get((service.PARTICIPATION, *WINDOW, None)).created_at == fresh.created_at
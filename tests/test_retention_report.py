@@ -0,0 +1,131 @@
+import random
+from datetime import date, datetime, time, timedelta
+
+import httpx
+import pytest
+
+from aggregation import rollup, service
+from database import async_session_factory
+from engagement.service import insert_visits
+from main import app
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("engine", [service.ENGINE_BITMAP, service.ENGINE_COLUMNAR])
+async def test_cohorts_need_the_sql_engine(db, engine):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get(
+            "/analytics/retention", params={"anchorDate": "2026-03-01", "cohort": "true", "engine": engine}
+        )
+    assert response.status_code == 400
+    async with async_session_factory() as session:
+        with pytest.raises(ValueError):
+            await service.retention_report(session, date(2026, 3, 1), cohorts=True, engine=engine)
+
+
+# A small fixed history: visits from before the windows below to after
+# their anchor, with the rollups closed mid-window.
+ACCOUNTS = [f"acct-{i:02d}" for i in range(30)]
+FIRST_DAY = date(2025, 11, 15)
+LAST_DAY = date(2026, 2, 12)
+CLOSED_THROUGH = date(2026, 1, 15)
+ANCHOR = date(2026, 2, 10)
+
+
+def fixed_visits() -> list[tuple[str, datetime]]:
+    """Account i starts visiting 3*i days after FIRST_DAY, on about a third
+    of the days from then on, so that later windows see new cohorts."""
+    rng = random.Random(17)
+    visits = []
+    for i, account in enumerate(ACCOUNTS):
+        d = FIRST_DAY + timedelta(days=3 * i)
+        while d <= LAST_DAY:
+            if rng.random() < 0.35:
+                visits.append((account, datetime.combine(d, time(rng.randrange(24), rng.randrange(60)))))
+            d += timedelta(days=1)
+    return visits
+
+
+def period_start(d: date, granularity: str) -> date:
+    if granularity == service.GRANULARITY_DAY:
+        return d
+    if granularity == service.GRANULARITY_WEEK:
+        return d - timedelta(days=d.weekday())
+    return d.replace(day=1)
+
+
+def reference_buckets(anchor: date, periods: int, granularity: str) -> list[tuple[date, date]]:
+    """Walk back day by day from the anchor, grouping days by their period."""
+    days: dict[date, list[date]] = {}
+    d = anchor
+    while len(days) < periods or period_start(d, granularity) in days:
+        days.setdefault(period_start(d, granularity), []).append(d)
+        d -= timedelta(days=1)
+    return sorted((min(v), max(v)) for v in days.values())
+
+
+def reference_cohorts(visits, buckets: list[tuple[date, date]]) -> list[dict]:
+    """The cohort triangle as the API reports it, counted account by account."""
+    seen: dict[str, set[int]] = {}
+    for account, at in visits:
+        day = at.date()
+        if day > buckets[-1][1]:
+            continue
+        index = next((i for i, (b_start, b_end) in enumerate(buckets) if b_start <= day <= b_end), -1)
+        seen.setdefault(account, set()).add(index)
+    cohorts = []
+    for c in sorted({min(s) for s in seen.values() if max(s) >= 0}):
+        members = [s for s in seen.values() if max(s) >= 0 and min(s) == c]
+        active = [sum(1 for s in members if i in s) for i in range(max(c, 0), len(buckets))]
+        cohorts.append({
+            "cohort": c,
+            "start": buckets[c][0].isoformat() if c >= 0 else None,
+            "size": len(members),
+            "active": active,
+            "rates": [a / len(members) for a in active],
+        })
+    return cohorts
+
+
+@pytest.mark.parametrize(
+    "anchor, periods, granularity",
+    [
+        (ANCHOR, 10, service.GRANULARITY_DAY),
+        (date(2026, 1, 3), 5, service.GRANULARITY_DAY),
+        (ANCHOR, 6, service.GRANULARITY_WEEK),
+        (date(2026, 1, 2), 3, service.GRANULARITY_WEEK),  # a week across the new year
+        (date(2026, 1, 4), 2, service.GRANULARITY_WEEK),  # anchored on a Sunday
+        (ANCHOR, 3, service.GRANULARITY_MONTH),  # December, January, February
+        (date(2026, 1, 31), 2, service.GRANULARITY_MONTH),
+        (date(2024, 3, 5), 3, service.GRANULARITY_MONTH),  # a leap February
+    ],
+)
+def test_buckets_match_reference(anchor, periods, granularity):
+    assert service.retention_buckets(anchor, periods, granularity) == reference_buckets(anchor, periods, granularity)
+
+
+@pytest.mark.parametrize(
+    "periods, granularity",
+    [(10, service.GRANULARITY_DAY), (6, service.GRANULARITY_WEEK), (3, service.GRANULARITY_MONTH)],
+)
+async def test_cohorts_match_reference(db, periods, granularity):
+    visits = fixed_visits()
+    async with async_session_factory() as session:
+        await insert_visits(session, visits)
+        await rollup.rebuild(session, now=datetime.combine(CLOSED_THROUGH + timedelta(days=1), time.max))
+        await session.commit()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get(
+            "/analytics/retention",
+            params={"anchorDate": ANCHOR.isoformat(), "weeks": periods, "granularity": granularity, "cohort": "true"},
+        )
+    assert response.status_code == 200
+    body = response.json()
+    buckets = reference_buckets(ANCHOR, periods, granularity)
+    assert [(b["start"], b["end"]) for b in body["buckets"]] == [(s.isoformat(), e.isoformat()) for s, e in buckets]
+    expected = reference_cohorts(visits, buckets)
+    assert len(expected) > 2
+    assert body["cohorts"] == expected